@@ -7,12 +7,29 @@
 # ----------------------------------------------------------------------------
 import importlib
 
+from q2_types.feature_table import FeatureTable, Frequency
 from q2_types.sample_data import SampleData
-from qiime2.plugin import Citations, Metadata, Plugin
+from qiime2.plugin import (
+    Bool,
+    Choices,
+    Citations,
+    Collection,
+    Float,
+    Int,
+    Metadata,
+    Plugin,
+    Properties,
+    Range,
+    Str,
+    TypeMap,
+)
 
 from q2_ms import __version__
 from q2_ms.types import (
     MSP,
+    CompiledMSP,
+    CompiledMSPDirFmt,
+    CompiledMSPMetadataFormat,
     MatchedSpectra,
     MatchedSpectraDirFmt,
     MatchedSpectraFormat,
@@ -22,6 +39,10 @@ from q2_ms.types import (
     MSExperimentSampleDataLinksSpectra,
     MSPDirFmt,
     MSPFormat,
+    MSPIndexFormat,
+    NPYFormat,
+    ParquetFormat,
+    ResourceUsageFormat,
     SpectraSlotsFormat,
     XCMSExperiment,
     XCMSExperimentChromPeakDataFormat,
@@ -30,15 +51,36 @@ from q2_ms.types import (
     XCMSExperimentFeatureDefinitionsFormat,
     XCMSExperimentFeaturePeakIndexFormat,
     XCMSExperimentJSONFormat,
+    XCMSExperimentParquet,
+    XCMSExperimentParquetDirFmt,
     mzML,
     mzMLDirFmt,
     mzMLFormat,
 )
-from q2_ms.xcms.database import fetch_massbank
+from q2_ms.xcms.append_ms_experiment import append_ms_experiment
+from q2_ms.xcms.database import compile_msp, fetch_massbank
+from q2_ms.xcms.feature_table import extract_feature_table
+from q2_ms.xcms.match_spectra import match_spectra
+from q2_ms.xcms.matched_spectra import filter_matched_spectra
+from q2_ms.xcms.parquet import (
+    convert_ms_experiment_to_parquet,
+    convert_ms_experiment_to_text,
+)
 from q2_ms.xcms.read_ms_experiment import read_ms_experiment
+from q2_ms.xcms.shards import (
+    merge_ms_experiments,
+    read_ms_experiment_sharded,
+    split_ms_experiment,
+)
 
 citations = Citations.load("citations.bib", package="q2_ms")
 
+ENGINE_DESCRIPTION = (
+    "Engine that reads the mzML files. 'r' uses MsExperiment and MsIO. 'python' "
+    "writes the same plain text files with a streaming mzML parser and does not "
+    "need R."
+)
+
 plugin = Plugin(
     name="ms",
     version=__version__,
@@ -52,14 +94,143 @@ plugin.methods.register_function(
     function=fetch_massbank,
     inputs={},
     outputs=[("massbank", MSP)],
-    parameters={},
+    parameters={"url": Str, "sha256": Str},
     input_descriptions={},
     output_descriptions={"massbank": "MassBank spectral library in NIST MSP format."},
-    parameter_descriptions={},
+    parameter_descriptions={
+        "url": (
+            "URL of the library. Can point to a mirror, a local file server or a "
+            "local file (file://) for systems without internet access."
+        ),
+        "sha256": "Expected SHA-256 checksum of the library.",
+    },
     name="Fetch MassBank spectral library",
     description=(
         "Fetch the latest MassBank spectral library in NIST MSP format. It is "
-        "downloaded from github.com/MassBank/MassBank-data."
+        "downloaded from github.com/MassBank/MassBank-data. The download is "
+        "streamed to disk, resumed after interruptions and cached, so the library "
+        "is only downloaded again if a new release is available. The cache "
+        "directory can be set with the environment variable Q2_MS_DOWNLOAD_CACHE."
+    ),
+    citations=[],
+)
+
+plugin.methods.register_function(
+    function=compile_msp,
+    inputs={"library": MSP},
+    outputs=[("compiled_library", CompiledMSP)],
+    parameters={"fragment_bin_width": Float % Range(0, None, inclusive_start=False)},
+    input_descriptions={"library": "Spectral library in NIST MSP format."},
+    output_descriptions={
+        "compiled_library": (
+            "Spectral library with columnar metadata and memory-mappable peak "
+            "arrays."
+        )
+    },
+    parameter_descriptions={
+        "fragment_bin_width": (
+            "Width of the m/z bins of a fragment-ion inverted index that is added "
+            "to the library. The index is used by 'match-spectra' for open "
+            "searches. No index is built if this is not set."
+        )
+    },
+    name="Compile spectral library",
+    description=(
+        "Convert a spectral library in MSP format into a columnar library. The "
+        "metadata is stored as a table and the peaks of all spectra as contiguous "
+        "m/z and intensity arrays, which can be loaded without parsing."
+    ),
+    citations=[],
+)
+
+plugin.methods.register_function(
+    function=filter_matched_spectra,
+    inputs={"matched_spectra": MatchedSpectra},
+    outputs=[("filtered_matched_spectra", MatchedSpectra)],
+    parameters={
+        "top_k": Int % Range(1, None),
+        "min_score": Float % Range(0, 1, inclusive_end=True),
+    },
+    input_descriptions={"matched_spectra": "Matched spectra to filter."},
+    output_descriptions={"filtered_matched_spectra": "Filtered matched spectra."},
+    parameter_descriptions={
+        "top_k": "Number of matches with the highest scores to keep per query.",
+        "min_score": "Minimum score of the matches to keep.",
+    },
+    name="Filter matched spectra",
+    description=(
+        "Filter matched spectra by score. Matches below the minimum score are "
+        "removed and only the best matches per query are kept. The table is "
+        "processed in chunks so that large tables can be filtered with limited "
+        "memory."
+    ),
+    citations=[],
+)
+
+plugin.methods.register_function(
+    function=match_spectra,
+    inputs={
+        "xcms_experiment": XCMSExperiment % Properties("MS2")
+        | XCMSExperimentParquet % Properties("MS2"),
+        "library": MSP | CompiledMSP,
+        "spectra": SampleData[mzML],
+    },
+    outputs=[("matched_spectra", MatchedSpectra)],
+    parameters={
+        "ppm": Float % Range(0, None),
+        "tolerance": Float % Range(0, None),
+        "method": Str % Choices("cosine", "modified_cosine"),
+        "min_score": Float % Range(0, 1, inclusive_end=True),
+        "precursor_tolerance": Float % Range(0, None),
+        "open_search": Bool,
+        "n_jobs": Int % Range(1, None),
+    },
+    input_descriptions={
+        "xcms_experiment": "XCMSExperiment with MS2 spectra.",
+        "library": "Spectral library.",
+        "spectra": (
+            "The mzML files the XCMSExperiment was read from. Only needed if the "
+            "XCMSExperiment does not store its spectra files."
+        ),
+    },
+    output_descriptions={
+        "matched_spectra": "Matches between MS2 spectra and library spectra."
+    },
+    parameter_descriptions={
+        "ppm": (
+            "Relative tolerance in parts per million for matching precursor and "
+            "fragment m/z values."
+        ),
+        "tolerance": (
+            "Absolute tolerance for matching precursor and fragment m/z values. It "
+            "is added to the relative tolerance."
+        ),
+        "method": (
+            "Similarity score. 'modified_cosine' also matches fragments that are "
+            "shifted by the difference of the precursor m/z values."
+        ),
+        "min_score": "Minimum score of the matches to keep.",
+        "precursor_tolerance": (
+            "Absolute tolerance for matching precursor m/z values. Defaults to the "
+            "fragment tolerance given by 'ppm' and 'tolerance'. With "
+            "'modified_cosine' it is the mass window of analog searches, e.g. 100 "
+            "to score library spectra with a precursor m/z difference of up to 100."
+        ),
+        "open_search": (
+            "Ignore the precursor m/z and score all library spectra that share "
+            "fragments with a query. The candidates are looked up in the "
+            "fragment-ion index of the library, see 'compile-msp'."
+        ),
+        "n_jobs": (
+            "Number of worker processes. The output does not depend on the number "
+            "of workers."
+        ),
+    },
+    name="Match spectra",
+    description=(
+        "Match the MS2 spectra of an XCMSExperiment against a spectral library. "
+        "Library spectra with a precursor m/z within the tolerance are scored with "
+        "the cosine similarity of their square root scaled intensities."
     ),
     citations=[],
 )
@@ -68,8 +239,15 @@ plugin.methods.register_function(
     function=read_ms_experiment,
     inputs={"spectra": SampleData[mzML]},
     outputs=[("xcms_experiment", XCMSExperiment)],
-    parameters={"sample_metadata": Metadata},
-    input_descriptions={"spectra": "Spectra data as mzML files."},
+    parameters={
+        "sample_metadata": Metadata,
+        "n_jobs": Int % Range(1, None),
+        "chunk_size": Int % Range(1, None),
+        "engine": Str % Choices("r", "python"),
+    },
+    input_descriptions={
+        "spectra": "Spectra data as mzML files, optionally gzip- or zstd-compressed."
+    },
     output_descriptions={
         "xcms_experiment": "XCMSExperiment object exported to plain text."
     },
@@ -80,6 +258,16 @@ plugin.methods.register_function(
             "alignment with 'adjust-retention-time-obiwarp'. Samples should be ordered "
             "by injection index for subset-based alignment. "
         ),
+        "n_jobs": (
+            "Number of parallel workers used to read the mzML files. The 'r' "
+            "engine uses BiocParallel workers and the 'python' engine processes."
+        ),
+        "chunk_size": (
+            "Number of spectra that are processed at once by later processing "
+            "steps (processingChunkSize). Smaller chunks need less memory. By "
+            "default all spectra are processed at once."
+        ),
+        "engine": ENGINE_DESCRIPTION,
     },
     name="Read spectra into XCMS experiment",
     description=(
@@ -93,11 +281,229 @@ plugin.methods.register_function(
     ],
 )
 
+plugin.methods.register_function(
+    function=append_ms_experiment,
+    inputs={"xcms_experiment": XCMSExperiment, "spectra": SampleData[mzML]},
+    outputs=[("extended_xcms_experiment", XCMSExperiment)],
+    parameters={
+        "sample_metadata": Metadata,
+        "n_jobs": Int % Range(1, None),
+        "engine": Str % Choices("r", "python"),
+    },
+    input_descriptions={
+        "xcms_experiment": (
+            "XCMSExperiment created with 'read-ms-experiment' before peak detection."
+        ),
+        "spectra": (
+            "Spectra data of the new samples as mzML files, optionally gzip- or "
+            "zstd-compressed."
+        ),
+    },
+    output_descriptions={
+        "extended_xcms_experiment": "XCMSExperiment with the existing and new samples."
+    },
+    parameter_descriptions={
+        "sample_metadata": (
+            "Sample metadata of the new samples. Required if the XCMSExperiment "
+            "was read with sample metadata and must have the same columns."
+        ),
+        "n_jobs": "Number of parallel workers used to read the mzML files.",
+        "engine": ENGINE_DESCRIPTION,
+    },
+    name="Append samples to XCMS experiment",
+    description=(
+        "Append new samples to an XCMSExperiment. Only the new mzML files are read "
+        "and their spectra, sample data and links are appended to the tables of "
+        "the experiment, so the cost of adding samples does not grow with the "
+        "number of samples in the experiment."
+    ),
+    citations=[
+        citations["smith2006xcms"],
+        citations["msexperiment2024"],
+    ],
+)
+
+plugin.methods.register_function(
+    function=split_ms_experiment,
+    inputs={"xcms_experiment": XCMSExperiment},
+    outputs=[("xcms_experiments", Collection[XCMSExperiment])],
+    parameters={"samples_per_shard": Int % Range(1, None)},
+    input_descriptions={"xcms_experiment": "XCMSExperiment to split."},
+    output_descriptions={
+        "xcms_experiments": "XCMSExperiments with the samples of every shard."
+    },
+    parameter_descriptions={
+        "samples_per_shard": (
+            "Number of consecutive samples per shard. The last shard can have "
+            "fewer samples."
+        )
+    },
+    name="Split XCMS experiment into shards",
+    description=(
+        "Split an XCMSExperiment into shards of consecutive samples, for example "
+        "to process the shards on several nodes. Spectra, samples and "
+        "chromatographic peaks are renumbered within every shard. Features are "
+        "dropped because they relate the peaks of different samples."
+    ),
+    citations=[],
+)
+
+plugin.methods.register_function(
+    function=merge_ms_experiments,
+    inputs={"xcms_experiments": Collection[XCMSExperiment]},
+    outputs=[("merged_xcms_experiment", XCMSExperiment)],
+    parameters={},
+    input_descriptions={
+        "xcms_experiments": (
+            "XCMSExperiments without features that were processed with the same "
+            "steps, e.g. the shards created by 'split-ms-experiment'."
+        )
+    },
+    output_descriptions={
+        "merged_xcms_experiment": "XCMSExperiment with the samples of all shards."
+    },
+    parameter_descriptions={},
+    name="Merge XCMS experiments",
+    description=(
+        "Merge XCMSExperiments into one experiment with the samples of all "
+        "experiments in the order of the collection. Spectra, samples and "
+        "chromatographic peaks are renumbered and the sample indices of the peaks "
+        "and the process history are updated."
+    ),
+    citations=[],
+)
+
+plugin.pipelines.register_function(
+    function=read_ms_experiment_sharded,
+    inputs={"spectra": SampleData[mzML]},
+    outputs=[("xcms_experiment", XCMSExperiment)],
+    parameters={
+        "sample_metadata": Metadata,
+        "samples_per_shard": Int % Range(1, None),
+        "n_jobs": Int % Range(1, None),
+        "chunk_size": Int % Range(1, None),
+        "engine": Str % Choices("r", "python"),
+    },
+    input_descriptions={
+        "spectra": "Spectra data as mzML files, optionally gzip- or zstd-compressed."
+    },
+    output_descriptions={
+        "xcms_experiment": "XCMSExperiment object exported to plain text."
+    },
+    parameter_descriptions={
+        "sample_metadata": "Optional sample metadata, see 'read-ms-experiment'.",
+        "samples_per_shard": "Number of mzML files that are read by one job.",
+        "n_jobs": "Number of parallel workers used to read the files of a job.",
+        "chunk_size": (
+            "Number of spectra that are processed at once by later processing "
+            "steps, see 'read-ms-experiment'."
+        ),
+        "engine": ENGINE_DESCRIPTION,
+    },
+    name="Read spectra into XCMS experiment in shards",
+    description=(
+        "Read the mzML files in shards with 'read-ms-experiment' and merge the "
+        "shards with 'merge-ms-experiments'. The shards are read in parallel if "
+        "the pipeline is run with parallel execution (--parallel)."
+    ),
+    citations=[
+        citations["smith2006xcms"],
+        citations["msexperiment2024"],
+    ],
+)
+
+plugin.methods.register_function(
+    function=extract_feature_table,
+    inputs={"xcms_experiment": XCMSExperiment | XCMSExperimentParquet},
+    outputs=[("feature_table", FeatureTable[Frequency])],
+    parameters={
+        "value": Str % Choices("into", "maxo"),
+        "method": Str % Choices("medret", "maxint", "sum"),
+    },
+    input_descriptions={"xcms_experiment": "XCMSExperiment with grouped features."},
+    output_descriptions={
+        "feature_table": "Abundances of the features in every sample."
+    },
+    parameter_descriptions={
+        "value": (
+            "Column of the chromatographic peaks that is used as abundance. 'into' "
+            "is the integrated peak intensity and 'maxo' the maximum intensity."
+        ),
+        "method": (
+            "How to handle features with several peaks in the same sample. "
+            "'medret' uses the peak closest to the median retention time of the "
+            "feature, 'maxint' the peak with the highest intensity and 'sum' the "
+            "sum of all peaks."
+        ),
+    },
+    name="Extract feature table",
+    description=(
+        "Build a sample by feature abundance table from the features of an "
+        "XCMSExperiment as done by xcms::featureValues. The table is created as a "
+        "sparse matrix, so features without a peak in a sample have an abundance "
+        "of 0."
+    ),
+    citations=[citations["smith2006xcms"]],
+)
+
+T_text_in, T_parquet_out = TypeMap(
+    {
+        XCMSExperiment % Properties("MS2"): XCMSExperimentParquet % Properties("MS2"),
+        XCMSExperiment: XCMSExperimentParquet,
+    }
+)
+
+plugin.methods.register_function(
+    function=convert_ms_experiment_to_parquet,
+    inputs={"xcms_experiment": T_text_in},
+    outputs=[("parquet_xcms_experiment", T_parquet_out)],
+    parameters={},
+    input_descriptions={"xcms_experiment": "XCMSExperiment to convert."},
+    output_descriptions={
+        "parquet_xcms_experiment": "XCMSExperiment with Parquet tables."
+    },
+    name="Convert XCMS experiment to Parquet",
+    description=(
+        "Store the spectra and chromatographic peaks of an XCMSExperiment as "
+        "zstd-compressed Parquet tables with one row group per sample. "
+        "'match-spectra' and 'extract-feature-table' read these typed tables "
+        "without parsing text. Use 'convert-ms-experiment-to-text' to process "
+        "the experiment with the other actions."
+    ),
+    citations=[],
+)
+
+T_parquet_in, T_text_out = TypeMap(
+    {
+        XCMSExperimentParquet % Properties("MS2"): XCMSExperiment % Properties("MS2"),
+        XCMSExperimentParquet: XCMSExperiment,
+    }
+)
+
+plugin.methods.register_function(
+    function=convert_ms_experiment_to_text,
+    inputs={"xcms_experiment": T_parquet_in},
+    outputs=[("text_xcms_experiment", T_text_out)],
+    parameters={},
+    input_descriptions={"xcms_experiment": "XCMSExperiment with Parquet tables."},
+    output_descriptions={
+        "text_xcms_experiment": "XCMSExperiment exported to plain text."
+    },
+    name="Convert XCMS experiment to plain text",
+    description=(
+        "Write the Parquet tables of an XCMSExperiment back to the plain text "
+        "files that are read by R."
+    ),
+    citations=[],
+)
+
 # Registrations
 plugin.register_semantic_types(
     mzML,
     XCMSExperiment,
+    XCMSExperimentParquet,
     MSP,
+    CompiledMSP,
     MatchedSpectra,
 )
 
@@ -105,7 +511,11 @@ plugin.register_semantic_type_to_format(SampleData[mzML], artifact_format=mzMLDi
 plugin.register_semantic_type_to_format(
     XCMSExperiment, artifact_format=XCMSExperimentDirFmt
 )
+plugin.register_semantic_type_to_format(
+    XCMSExperimentParquet, artifact_format=XCMSExperimentParquetDirFmt
+)
 plugin.register_semantic_type_to_format(MSP, artifact_format=MSPDirFmt)
+plugin.register_semantic_type_to_format(CompiledMSP, artifact_format=CompiledMSPDirFmt)
 plugin.register_semantic_type_to_format(
     MatchedSpectra, artifact_format=MatchedSpectraDirFmt
 )
@@ -125,10 +535,18 @@ plugin.register_formats(
     XCMSExperimentFeatureDefinitionsFormat,
     XCMSExperimentFeaturePeakIndexFormat,
     XCMSExperimentJSONFormat,
+    ParquetFormat,
+    XCMSExperimentParquetDirFmt,
+    ResourceUsageFormat,
     MSPFormat,
+    MSPIndexFormat,
     MSPDirFmt,
+    NPYFormat,
+    CompiledMSPMetadataFormat,
+    CompiledMSPDirFmt,
     MatchedSpectraFormat,
     MatchedSpectraDirFmt,
 )
 
+importlib.import_module("q2_ms.types._transformer")
 importlib.import_module("q2_ms.types._validators")
@@ -5,66 +5,122 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import json
+import os
 import subprocess
-import unittest
+import sys
 from unittest.mock import call, patch
 
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_ms.utils import EXTERNAL_CMD_WARNING, run_command, run_r_script
+from q2_ms.utils import (
+    EXTERNAL_CMD_WARNING,
+    R_WORKER_ENV,
+    RESOURCE_LOG_ENV,
+    RESOURCE_USAGE_FILENAME,
+    STORE_RESOURCE_USAGE_ENV,
+    RWorker,
+    link_file,
+    link_tree,
+    run_command,
+    run_r_script,
+    store_resource_usage,
+)
+
+# Worker that speaks the protocol of r_worker.R. RUN writes the arguments to the
+# file given as script path, or fails for the script path "fail". With --intruder
+# another connection without the token is opened first.
+FAKE_R_WORKER = """
+import os
+import socket
+import sys
+
+port = int(sys.argv[sys.argv.index("--port") + 1])
+if "--intruder" in sys.argv:
+    intruder = socket.create_connection(("127.0.0.1", port))
+    intruder.sendall(b"PING\\n")
+connection = socket.create_connection(("127.0.0.1", port))
+f = connection.makefile("rw")
+f.write("HELLO\\t" + os.environ["Q2_MS_R_WORKER_TOKEN"] + "\\n")
+f.flush()
+for line in f:
+    fields = line.rstrip("\\n").split("\\t")
+    if fields[0] == "RUN" and fields[1] == "fail":
+        f.write("ERROR\\tscript failed\\n")
+    elif fields[0] == "RUN":
+        with open(fields[1], "w") as out:
+            out.write(" ".join(fields[2:]))
+        f.write("OK\\t0.5\\t0.1\\n")
+    else:
+        f.write("OK\\n")
+    f.flush()
+    if fields[0] == "QUIT":
+        break
+"""
 
 
 class TestRunCommand(TestPluginBase):
     package = "q2_ms.tests"
 
-    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_run_command_verbose(self, mock_print, mock_subprocess_run):
-        # Mock command and working directory
-        cmd = ["echo", "Hello"]
-        cwd = "/test/directory"
+    def test_run_command_verbose(self, mock_print):
+        cmd = [sys.executable, "-c", "print('Hello')"]
 
         # Run the function with verbose=True
-        run_command(cmd, cwd=cwd, verbose=True)
-
-        # Check if subprocess.run was called with the correct arguments
-        mock_subprocess_run.assert_called_once_with(cmd, check=True, cwd=cwd, env=None)
+        usage = run_command(cmd, cwd=self.temp_dir.name, verbose=True)
 
         # Check if the correct print statements were called
         mock_print.assert_has_calls(
             [
                 call(EXTERNAL_CMD_WARNING),
                 call("\nCommand:", end=" "),
-                call("echo Hello", end="\n\n"),
+                call(" ".join(cmd), end="\n\n"),
+                call(f"Resource usage: {json.dumps(usage)}", file=sys.stderr),
             ]
         )
 
-    @patch("subprocess.run")
     @patch("builtins.print")
-    def test_run_command_non_verbose(self, mock_print, mock_subprocess_run):
-        # Mock command and working directory
-        cmd = ["echo", "Hello"]
-        cwd = "/test/directory"
-
-        # Run the function with verbose=False
-        run_command(cmd, cwd=cwd, verbose=False)
-
-        # Check if subprocess.run was called with the correct arguments
-        mock_subprocess_run.assert_called_once_with(cmd, check=True, cwd=cwd, env=None)
+    def test_run_command_non_verbose(self, mock_print):
+        run_command([sys.executable, "-c", "pass"], cwd=None, verbose=False)
 
         # Ensure no print statements were made
         mock_print.assert_not_called()
 
-    @patch("subprocess.run")
-    def test_run_r_script_success(self, mock_subprocess):
+    def test_run_command_resource_usage(self):
+        # Allocate about 100 MB and write the load time like the R scripts do
+        script = (
+            "import os, time\n"
+            "with open(os.environ['Q2_MS_TIMING_FILE'], 'w') as f:\n"
+            "    f.write('load_time\\t0.01\\nxcms_version\\t4.0.0\\n')\n"
+            "data = bytearray(100 * 1024 * 1024)\n"
+            "time.sleep(0.1)\n"
+        )
+        log_path = os.path.join(self.temp_dir.name, "usage.jsonl")
+        with patch.dict(os.environ, {RESOURCE_LOG_ENV: log_path}):
+            usage = run_command([sys.executable, "-c", script], None, verbose=False)
+
+        self.assertGreaterEqual(usage["wall_time"], 0.1)
+        self.assertGreater(usage["max_rss_mb"], 100)
+        self.assertEqual(usage["load_time"], 0.01)
+        self.assertEqual(usage["xcms_version"], "4.0.0")
+        self.assertAlmostEqual(usage["compute_time"], usage["wall_time"] - 0.01)
+        with open(log_path) as f:
+            self.assertEqual(json.loads(f.read()), usage)
+
+    def test_run_command_failure(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            run_command([sys.executable, "-c", "exit(3)"], None, verbose=False)
+
+    @patch("q2_ms.utils.run_command")
+    def test_run_r_script_success(self, mock_run_command):
         # Call function
-        run_r_script(
+        usage = run_r_script(
             params={"param1": "value1", "param2": 42, "param3": None},
             script_name="test_script",
             package_name="q2_ms",
         )
 
-        # Check if subprocess.run was called correctly
+        # Check if run_command was called correctly
         expected_cmd = [
             "test_script.R",
             "--param1",
@@ -73,13 +129,132 @@ class TestRunCommand(TestPluginBase):
             "42",
         ]
 
-        mock_subprocess.assert_called_once_with(
-            expected_cmd, check=True, cwd=None, env=unittest.mock.ANY
-        )
+        mock_run_command.assert_called_once_with(expected_cmd, verbose=True, cwd=None)
+        self.assertIs(usage, mock_run_command.return_value)
 
-    @patch("subprocess.run", side_effect=subprocess.CalledProcessError(1, "cmd"))
-    def test_run_r_script_failure(self, mock_subprocess):
+    @patch(
+        "q2_ms.utils.run_command", side_effect=subprocess.CalledProcessError(1, "cmd")
+    )
+    def test_run_r_script_failure(self, mock_run_command):
         with self.assertRaises(Exception) as context:
             run_r_script("", {}, "q2_ms")
 
         self.assertIn("q2_ms", str(context.exception))
+
+    def test_store_resource_usage(self):
+        usage = {"command": ["test_script.R"], "wall_time": 1.0}
+        store_resource_usage(self.temp_dir.name, usage)
+        path = os.path.join(self.temp_dir.name, RESOURCE_USAGE_FILENAME)
+        self.assertFalse(os.path.exists(path))
+
+        with patch.dict(os.environ, {STORE_RESOURCE_USAGE_ENV: "1"}):
+            store_resource_usage(self.temp_dir.name, usage)
+            store_resource_usage(self.temp_dir.name, usage)
+        with open(path) as f:
+            self.assertEqual(json.load(f), [usage, usage])
+
+
+class TestRWorker(TestPluginBase):
+    package = "q2_ms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.script = os.path.join(self.temp_dir.name, "fake_r_worker.py")
+        with open(self.script, "w") as f:
+            f.write(FAKE_R_WORKER)
+        self.worker = RWorker([sys.executable, self.script])
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.close()
+        super().tearDown()
+
+    def test_r_worker_run_script(self):
+        output_path = os.path.join(self.temp_dir.name, "output.txt")
+        usage = self.worker.run_script(output_path, ["--spectra", "a b"])
+        self.assertEqual(usage, {"user_time": 0.5, "system_time": 0.1})
+        self.worker.run_script(output_path, ["--spectra", "c"])
+        with open(output_path) as f:
+            self.assertEqual(f.read(), "--spectra c")
+
+    def test_r_worker_rejects_connection_without_token(self):
+        worker = RWorker([sys.executable, self.script, "--intruder"])
+        worker.start()
+        try:
+            self.assertTrue(worker.is_alive())
+            output_path = os.path.join(self.temp_dir.name, "output.txt")
+            worker.run_script(output_path, ["--spectra", "a"])
+            self.assertTrue(os.path.exists(output_path))
+        finally:
+            worker.close()
+
+    def test_r_worker_error(self):
+        with self.assertRaisesRegex(RuntimeError, "script failed"):
+            self.worker.run_script("fail", [])
+        self.assertTrue(self.worker.is_alive())
+
+    def test_r_worker_invalid_argument(self):
+        with self.assertRaisesRegex(ValueError, "tabs or newlines"):
+            self.worker.run_script("script.R", ["a\tb"])
+
+    def test_r_worker_health_check(self):
+        self.assertTrue(self.worker.is_alive())
+        self.worker.process.kill()
+        self.worker.process.wait()
+        self.assertFalse(self.worker.is_alive())
+
+    @patch("q2_ms.utils.get_r_worker")
+    @patch("q2_ms.utils.run_command")
+    def test_run_r_script_worker(self, mock_run_command, mock_get_r_worker):
+        mock_get_r_worker.return_value.run_script.return_value = {"user_time": 1.0}
+        with patch.dict(os.environ, {R_WORKER_ENV: "1"}):
+            usage = run_r_script("test_script", {"param1": "value1"}, "q2_ms")
+
+        mock_run_command.assert_not_called()
+        mock_get_r_worker.return_value.run_script.assert_called_once_with(
+            "test_script.R", ["--param1", "value1"]
+        )
+        self.assertTrue(usage["r_worker"])
+        self.assertEqual(usage["user_time"], 1.0)
+        self.assertEqual(usage["load_time"], 0.0)
+
+    @patch("q2_ms.utils.get_r_worker")
+    def test_run_r_script_worker_failure(self, mock_get_r_worker):
+        mock_get_r_worker.return_value.run_script.side_effect = RuntimeError("oops")
+        with patch.dict(os.environ, {R_WORKER_ENV: "1"}):
+            with self.assertRaisesRegex(Exception, "q2_ms.*oops"):
+                run_r_script("test_script", {}, "q2_ms")
+
+    @patch("q2_ms.utils.get_r_worker")
+    def test_run_r_script_worker_crash(self, mock_get_r_worker):
+        mock_get_r_worker.return_value.run_script.side_effect = ConnectionError(
+            "The R worker closed the connection."
+        )
+        with patch.dict(os.environ, {R_WORKER_ENV: "1"}):
+            with self.assertRaisesRegex(Exception, "q2_ms.*closed the connection"):
+                run_r_script("test_script", {}, "q2_ms")
+        mock_get_r_worker.return_value.run_script.assert_called_once()
+
+
+class TestLinkFile(TestPluginBase):
+    package = "q2_ms.tests"
+
+    def test_link_file(self):
+        src = os.path.join(self.temp_dir.name, "src", "a.mzML")
+        os.mkdir(os.path.dirname(src))
+        with open(src, "w") as f:
+            f.write("spectra")
+
+        dst = os.path.join(self.temp_dir.name, "dst")
+        link_tree(os.path.dirname(src), dst)
+        self.assertTrue(os.path.samefile(src, os.path.join(dst, "a.mzML")))
+
+    @patch("os.link", side_effect=OSError("Invalid cross-device link"))
+    @patch("fcntl.ioctl", side_effect=OSError("Operation not supported"))
+    def test_link_file_not_possible(self, mock_ioctl, mock_link):
+        src = os.path.join(self.temp_dir.name, "a.mzML")
+        dst = os.path.join(self.temp_dir.name, "b.mzML")
+        open(src, "w").close()
+        with self.assertRaisesRegex(OSError, "neither be hardlinked nor reflinked"):
+            link_file(src, dst)
+        self.assertFalse(os.path.exists(dst))
@@ -6,6 +6,8 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 from q2_ms.types._format import (
+    CompiledMSPDirFmt,
+    CompiledMSPMetadataFormat,
     MatchedSpectraDirFmt,
     MatchedSpectraFormat,
     MSBackendDataFormat,
@@ -14,6 +16,10 @@ from q2_ms.types._format import (
     MSExperimentSampleDataLinksSpectra,
     MSPDirFmt,
     MSPFormat,
+    MSPIndexFormat,
+    NPYFormat,
+    ParquetFormat,
+    ResourceUsageFormat,
     SpectraSlotsFormat,
     XCMSExperimentChromPeakDataFormat,
     XCMSExperimentChromPeaksFormat,
@@ -21,10 +27,19 @@ from q2_ms.types._format import (
     XCMSExperimentFeatureDefinitionsFormat,
     XCMSExperimentFeaturePeakIndexFormat,
     XCMSExperimentJSONFormat,
+    XCMSExperimentParquetDirFmt,
     mzMLDirFmt,
     mzMLFormat,
 )
-from q2_ms.types._type import MSP, MatchedSpectra, XCMSExperiment, mzML
+from q2_ms.types._type import (
+    MSP,
+    CompiledMSP,
+    MatchedSpectra,
+    XCMSExperiment,
+    XCMSExperimentParquet,
+    mzML,
+)
+from q2_ms.types._xcms_experiment import XCMSExperimentReader
 
 __all__ = [
     "mzMLFormat",
@@ -35,16 +50,26 @@ __all__ = [
     "MSExperimentSampleDataFormat",
     "MSExperimentSampleDataLinksSpectra",
     "SpectraSlotsFormat",
+    "ResourceUsageFormat",
     "XCMSExperimentChromPeakDataFormat",
     "XCMSExperimentChromPeaksFormat",
     "XCMSExperimentDirFmt",
     "XCMSExperimentFeatureDefinitionsFormat",
     "XCMSExperimentFeaturePeakIndexFormat",
     "XCMSExperimentJSONFormat",
+    "XCMSExperimentParquetDirFmt",
+    "ParquetFormat",
     "XCMSExperiment",
+    "XCMSExperimentParquet",
+    "XCMSExperimentReader",
     "MSPFormat",
     "MSPDirFmt",
+    "MSPIndexFormat",
     "MSP",
+    "NPYFormat",
+    "CompiledMSPMetadataFormat",
+    "CompiledMSPDirFmt",
+    "CompiledMSP",
     "MatchedSpectraFormat",
     "MatchedSpectraDirFmt",
     "MatchedSpectra",
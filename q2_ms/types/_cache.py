@@ -0,0 +1,211 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import functools
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+
+from qiime2.core.exceptions import ValidationError
+
+from q2_ms import __version__
+from q2_ms.types._validation import get_validation_max_errors
+
+VALIDATION_CACHE_ENV = "Q2_MS_VALIDATION_CACHE"
+VALIDATION_CACHE_MODE_ENV = "Q2_MS_VALIDATION_CACHE_MODE"
+VALIDATION_CACHE_SIZE_ENV = "Q2_MS_VALIDATION_CACHE_SIZE"
+
+DEFAULT_CACHE_SIZE = 10000
+CACHE_MODES = ("stat", "hash")
+
+# Number of entries stored by this process per cache directory since the last
+# eviction
+_stores_since_eviction = Counter()
+
+
+class ValidationCache:
+    """
+    On-disk cache of validation results. Every entry is a small JSON file in the
+    cache directory named after the key of the validated file. The least recently
+    used entries are evicted once the cache holds more than `max_entries` entries.
+    The directory is only scanned for eviction after every tenth of `max_entries`
+    stored entries, so the cache can exceed `max_entries` by up to a tenth.
+
+    Parameters:
+        directory (str):
+            Path to the cache directory. It is created if it does not exist.
+        mode (str):
+            Fingerprint mode. "hash" (default) hashes the file content, which
+            reads the whole file on every lookup, even for "min" validations that
+            only read its beginning. "stat" is a fast mode that uses the device,
+            inode, size and modification time of the file. It does not read the
+            file, but returns stale results for files that are rewritten with the
+            same size and modification time or that reuse the inode of a removed
+            file.
+        max_entries (int):
+            Maximum number of cached results.
+    """
+
+    def __init__(self, directory, mode="hash", max_entries=DEFAULT_CACHE_SIZE):
+        if mode not in CACHE_MODES:
+            raise ValueError(
+                f"Validation cache mode must be one of {', '.join(CACHE_MODES)}, "
+                f"not {mode}."
+            )
+        if max_entries < 1:
+            raise ValueError("The validation cache size must be at least 1.")
+
+        self.directory = directory
+        self.mode = mode
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def fingerprint(self, path):
+        if self.mode == "stat":
+            stat = os.stat(path)
+            return (
+                f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}:"
+                f"{os.path.realpath(path)}"
+            )
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, format_name, path, level):
+        # The plugin version is part of the key so that results are not reused
+        # after the validators have changed. The error limit changes the reported
+        # errors.
+        fields = [
+            __version__,
+            self.mode,
+            format_name,
+            level,
+            str(get_validation_max_errors()),
+            self.fingerprint(path),
+        ]
+        return hashlib.sha256("\0".join(fields).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached error message of an entry, an empty string if the file
+        was valid or None if there is no entry for `key`.
+        """
+        result = self.load(key)
+        if result is None:
+            return None
+        return result.get("error") or ""
+
+    def set(self, key, error=None):
+        self.store(key, {"error": error})
+
+    def load(self, key):
+        """
+        Returns the JSON object stored for `key` or None if there is no entry.
+        """
+        entry = os.path.join(self.directory, f"{key}.json")
+        try:
+            with open(entry, "r") as f:
+                result = json.load(f)
+            # Mark the entry as recently used
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def store(self, key, value):
+        """
+        Stores a JSON-serializable object for `key`.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        # Replace atomically so that concurrent readers never see partial entries
+        os.replace(tmp_path, os.path.join(self.directory, f"{key}.json"))
+
+        _stores_since_eviction[self.directory] += 1
+        if _stores_since_eviction[self.directory] >= max(1, self.max_entries // 10):
+            _stores_since_eviction[self.directory] = 0
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    continue
+
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def get_validation_cache():
+    """
+    Returns the validation cache configured with the environment variables
+    Q2_MS_VALIDATION_CACHE (cache directory), Q2_MS_VALIDATION_CACHE_MODE ("hash"
+    or the fast "stat" mode, see ValidationCache, defaults to "hash") and
+    Q2_MS_VALIDATION_CACHE_SIZE (maximum number of entries). Returns None if no
+    cache directory is set.
+    """
+    directory = os.environ.get(VALIDATION_CACHE_ENV)
+    if not directory:
+        return None
+
+    mode = os.environ.get(VALIDATION_CACHE_MODE_ENV, "hash")
+    value = os.environ.get(VALIDATION_CACHE_SIZE_ENV, str(DEFAULT_CACHE_SIZE))
+    try:
+        max_entries = int(value)
+    except ValueError:
+        raise ValueError(
+            f"{VALIDATION_CACHE_SIZE_ENV} must be an integer. Found instead: {value}"
+        )
+    return ValidationCache(directory, mode, max_entries)
+
+
+def cached_validation(validate):
+    """
+    Decorator for the `_validate_` method of file formats that stores the result of
+    a validation in the validation cache and reuses it for files with the same
+    fingerprint that are validated with the same level again.
+    """
+
+    @functools.wraps(validate)
+    def wrapper(self, level):
+        cache = get_validation_cache()
+        if cache is None:
+            return validate(self, level)
+
+        key = cache.key(type(self).__name__, str(self), level)
+        error = cache.get(key)
+        if error is not None:
+            if error:
+                raise ValidationError(error)
+            return
+
+        try:
+            validate(self, level)
+        except ValidationError as e:
+            cache.set(key, str(e))
+            raise
+        cache.set(key)
+
+    return wrapper
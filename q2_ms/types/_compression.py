@@ -0,0 +1,137 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import gzip
+import io
+import os
+import shutil
+
+import pyarrow as pa
+
+# Optional file name suffix of compressed files for the pathspecs of formats
+COMPRESSION_SUFFIX_PATTERN = r"(\.gz|\.zst)?"
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+_MAGIC_NUMBERS = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def get_compression(path):
+    """
+    Returns "gzip" or "zstd" if the file is compressed and None otherwise. The
+    compression is detected from the first bytes of the file and not from its
+    name.
+    """
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, compression in _MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_compression_suffix(filename):
+    """
+    Removes a .gz or .zst suffix from a file name.
+    """
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if filename.endswith(suffix):
+            return filename[: -len(suffix)]
+    return filename
+
+
+def open_compressed(path, mode="rb"):
+    """
+    Opens a plain, gzip- or zstd-compressed file for reading. Compressed files are
+    decompressed while they are read. The returned file supports seeking, but
+    seeking backwards in a compressed file restarts the decompression from the
+    beginning of the file.
+
+    Parameters:
+        path (str):
+            Path to the file.
+        mode (str):
+            "rb" for binary or "r" for UTF-8 text.
+    """
+    if mode not in ("r", "rb"):
+        raise ValueError(f"Mode must be 'r' or 'rb', not {mode}.")
+    encoding = None if mode == "rb" else "utf-8"
+
+    compression = get_compression(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding)
+    if compression == "gzip":
+        return gzip.open(path, "rb" if mode == "rb" else "rt", encoding=encoding)
+
+    f = io.BufferedReader(_ZstdReader(path), buffer_size=BUFFER_SIZE)
+    return f if mode == "rb" else io.TextIOWrapper(f, encoding=encoding)
+
+
+def decompress(path, output_path):
+    """
+    Writes the decompressed content of a plain, gzip- or zstd-compressed file to
+    `output_path` without loading it into memory.
+    """
+    with open_compressed(path) as src, open(output_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, BUFFER_SIZE)
+
+
+class _ZstdReader(io.RawIOBase):
+    """
+    Decompressing reader for zstd files that emulates seeking like
+    gzip.GzipFile. Seeking forwards decompresses and discards the skipped data,
+    seeking backwards reopens the file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._stream = pa.input_stream(path, compression="zstd")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._stream.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self._position += n
+        return n
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence != os.SEEK_SET:
+            raise io.UnsupportedOperation(
+                "Seeking from the end of a zstd-compressed file is not supported."
+            )
+
+        if offset < self._position:
+            self._stream.close()
+            self._stream = pa.input_stream(self._path, compression="zstd")
+            self._position = 0
+        while self._position < offset:
+            n = len(self._stream.read(min(offset - self._position, BUFFER_SIZE)))
+            if not n:
+                break
+            self._position += n
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
@@ -7,80 +7,118 @@
 # ----------------------------------------------------------------------------
 import json
 import os
-import re
-import sys
+import tempfile
 
+import numpy as np
 import pandas as pd
-import pymzml
+import pyarrow.parquet as pq
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin import model
 
-
-class mzMLFormat(model.TextFileFormat):
-    def _validate(self, n_records=None):
-        try:
-            # Suppressing warning print "Not index found and build_index_from_scratch
-            # is False". This could also be solved with setting build_index_from_scratch
-            # to True but this builds the index and slows down validation.
-            sys.stdout = open(os.devnull, "w")
-            pymzml.run.Reader(str(self))
-            sys.stdout = sys.__stdout__
-        except Exception as e:
-            raise ValidationError(e)
-
+from q2_ms.types._cache import cached_validation
+from q2_ms.types._compression import COMPRESSION_SUFFIX_PATTERN, get_compression
+from q2_ms.types._fragment_index import (
+    FRAGMENT_INDEX_FILES,
+    build_fragment_index,
+    read_fragment_index,
+)
+from q2_ms.types._matched_spectra import validate_matched_spectra
+from q2_ms.types._ms_backend import (
+    MS_BACKEND_HEADER,
+    read_ms_backend_header,
+    summarize_ms_backend_data,
+)
+from q2_ms.types._msp import (
+    MSP_INDEX_COLUMNS,
+    build_msp_index,
+    read_msp_record,
+    validate_msp,
+)
+from q2_ms.types._mzml import validate_mzml
+from q2_ms.types._parquet import read_parquet_table
+from q2_ms.types._validation import (
+    DeferredValidationMixin,
+    ParallelValidationMixin,
+    get_validation_jobs,
+    get_validation_max_errors,
+)
+from q2_ms.types._xcms_experiment import SPECTRA_DIRNAME
+
+MS_BACKEND_DATA_COLUMNS = [
+    "msLevel",
+    "rtime",
+    "acquisitionNum",
+    "dataOrigin",
+    "polarity",
+    "peaksCount",
+    "totIonCurrent",
+    "basePeakMZ",
+    "basePeakIntensity",
+    "ionisationEnergy",
+    "lowMZ",
+    "highMZ",
+    "injectionTime",
+    "spectrumId",
+    "dataStorage",
+    "scanIndex",
+]
+
+CHROM_PEAKS_COLUMNS = [
+    "mz",
+    "mzmin",
+    "mzmax",
+    "rt",
+    "rtmin",
+    "rtmax",
+    "into",
+    "intb",
+    "maxo",
+    "sn",
+    "sample",
+]
+
+
+class mzMLFormat(DeferredValidationMixin, model.TextFileFormat):
+    def _validate(self, n_spectra=None):
+        validate_mzml(str(self), n_spectra)
+
+    @cached_validation
     def _validate_(self, level):
-        self._validate()
+        self._validate({"min": 10, "max": None}[level])
 
 
-class mzMLDirFmt(model.DirectoryFormat):
-    mzml = model.FileCollection(r".*\.mzML$", format=mzMLFormat)
+class mzMLDirFmt(ParallelValidationMixin, model.DirectoryFormat):
+    mzml = model.FileCollection(
+        rf".*\.mzML{COMPRESSION_SUFFIX_PATTERN}$", format=mzMLFormat
+    )
 
     @mzml.set_path_maker
     def mzml_path_maker(self, sample_id):
         return f"{sample_id}.mzML"
 
 
-class MSBackendDataFormat(model.TextFileFormat):
+class MSBackendDataFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
-        header_exp = [
-            "msLevel",
-            "rtime",
-            "acquisitionNum",
-            "dataOrigin",
-            "polarity",
-            "peaksCount",
-            "totIonCurrent",
-            "basePeakMZ",
-            "basePeakIntensity",
-            "ionisationEnergy",
-            "lowMZ",
-            "highMZ",
-            "injectionTime",
-            "spectrumId",
-            "dataStorage",
-            "scanIndex",
-        ]
+        header_exp = MS_BACKEND_DATA_COLUMNS
 
-        header_obs_1 = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
-        header_obs_2 = pd.read_csv(
-            str(self), sep="\t", skiprows=1, nrows=1
-        ).columns.tolist()
+        first_line, header_obs = read_ms_backend_header(str(self))
 
-        if (not set(header_exp).issubset(set(header_obs_2))) or header_obs_1[
-            0
-        ] != "# MsBackendMzR":
+        if (
+            not set(header_exp).issubset(set(header_obs))
+            or first_line != MS_BACKEND_HEADER
+        ):
             raise ValidationError(
                 "Header does not match MSBackendDataFormat. It must consist of the "
                 "following two lines with at least these columns:\n"
-                "# MsBackendMzR\n" + "\t".join(header_exp) + "\n\nFound instead:\n"
-                f"{header_obs_1[0]}\n" + "\t".join(header_obs_2)
+                f"{MS_BACKEND_HEADER}\n" + "\t".join(header_exp) + "\n\nFound "
+                f"instead:\n{first_line}\n" + "\t".join(header_obs)
             )
 
     def _validate_(self, level):
         self._validate()
 
 
-class MSExperimentLinkMColsFormat(model.TextFileFormat):
+class MSExperimentLinkMColsFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         with open(str(self), "r") as file:
             first_line = file.readline().strip()
@@ -98,7 +136,7 @@ class MSExperimentLinkMColsFormat(model.TextFileFormat):
         self._validate()
 
 
-class MSExperimentSampleDataLinksSpectra(model.TextFileFormat):
+class MSExperimentSampleDataLinksSpectra(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         first_line = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
 
@@ -112,7 +150,7 @@ class MSExperimentSampleDataLinksSpectra(model.TextFileFormat):
         self._validate()
 
 
-class MSExperimentSampleDataFormat(model.TextFileFormat):
+class MSExperimentSampleDataFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         header_obs = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
 
@@ -128,7 +166,7 @@ class MSExperimentSampleDataFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentJSONFormat(model.TextFileFormat):
+class XCMSExperimentJSONFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         try:
             with self.open() as file:
@@ -157,7 +195,33 @@ class XCMSExperimentJSONFormat(model.TextFileFormat):
         self._validate()
 
 
-class SpectraSlotsFormat(model.TextFileFormat):
+class ResourceUsageFormat(DeferredValidationMixin, model.TextFileFormat):
+    """
+    Resource usage of the external commands that created an artifact, see
+    q2_ms.utils.store_resource_usage.
+    """
+
+    def _validate(self):
+        try:
+            with self.open() as file:
+                records = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValidationError(f"File is not valid JSON: {e}")
+
+        if not isinstance(records, list) or not all(
+            isinstance(record, dict) and {"command", "wall_time"} <= record.keys()
+            for record in records
+        ):
+            raise ValidationError(
+                "The resource usage must be a list of objects with the keys "
+                "command and wall_time."
+            )
+
+    def _validate_(self, level):
+        self._validate()
+
+
+class SpectraSlotsFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         expected_keys = {
             "processingQueueVariables",
@@ -191,7 +255,7 @@ class SpectraSlotsFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentChromPeakDataFormat(model.TextFileFormat):
+class XCMSExperimentChromPeakDataFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
         header_exp = ["ms_level", "is_filled"]
         header_obs = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
@@ -209,21 +273,9 @@ class XCMSExperimentChromPeakDataFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentChromPeaksFormat(model.TextFileFormat):
+class XCMSExperimentChromPeaksFormat(DeferredValidationMixin, model.TextFileFormat):
     def _validate(self):
-        header_exp = [
-            "mz",
-            "mzmin",
-            "mzmax",
-            "rt",
-            "rtmin",
-            "rtmax",
-            "into",
-            "intb",
-            "maxo",
-            "sn",
-            "sample",
-        ]
+        header_exp = CHROM_PEAKS_COLUMNS
         header_obs = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
 
         if not set(header_exp).issubset(set(header_obs)):
@@ -239,7 +291,9 @@ class XCMSExperimentChromPeaksFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentFeatureDefinitionsFormat(model.TextFileFormat):
+class XCMSExperimentFeatureDefinitionsFormat(
+    DeferredValidationMixin, model.TextFileFormat
+):
     def _validate(self):
         header_exp = [
             "mzmed",
@@ -267,7 +321,9 @@ class XCMSExperimentFeatureDefinitionsFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentFeaturePeakIndexFormat(model.TextFileFormat):
+class XCMSExperimentFeaturePeakIndexFormat(
+    DeferredValidationMixin, model.TextFileFormat
+):
     def _validate(self):
         header_exp = ["feature_index", "peak_index"]
         header_obs = pd.read_csv(str(self), sep="\t", nrows=0).columns.tolist()
@@ -285,7 +341,7 @@ class XCMSExperimentFeaturePeakIndexFormat(model.TextFileFormat):
         self._validate()
 
 
-class XCMSExperimentDirFmt(model.DirectoryFormat):
+class XCMSExperimentDirFmt(ParallelValidationMixin, model.DirectoryFormat):
     ms_backend_data = model.File(
         pathspec="ms_backend_data.txt",
         format=MSBackendDataFormat,
@@ -335,10 +391,151 @@ class XCMSExperimentDirFmt(model.DirectoryFormat):
         format=XCMSExperimentFeaturePeakIndexFormat,
         optional=True,
     )
+    resource_usage = model.File(
+        pathspec="resource_usage.json",
+        format=ResourceUsageFormat,
+        optional=True,
+    )
+    spectra = model.FileCollection(
+        rf"{SPECTRA_DIRNAME}/.+\.mzML{COMPRESSION_SUFFIX_PATTERN}",
+        format=mzMLFormat,
+        optional=True,
+    )
 
+    @spectra.set_path_maker
+    def spectra_path_maker(self, filename):
+        return f"{SPECTRA_DIRNAME}/{filename}"
 
-class MSPFormat(model.TextFileFormat):
+    def summary(self):
+        """
+        Returns the MS levels and the number of spectra per sample of the
+        experiment. The summary is cached, see summarize_ms_backend_data.
+        """
+        return summarize_ms_backend_data(os.path.join(str(self), "ms_backend_data.txt"))
+
+
+class ParquetFormat(DeferredValidationMixin, model.BinaryFileFormat):
     def _validate(self):
+        with open(str(self), "rb") as f:
+            magic = f.read(4)
+            f.seek(max(os.path.getsize(str(self)) - 4, 0))
+            footer = f.read(4)
+
+        if magic != b"PAR1" or footer != b"PAR1":
+            raise ValidationError("File is not a Parquet file.")
+
+    def _validate_(self, level):
+        self._validate()
+
+
+class XCMSExperimentParquetDirFmt(ParallelValidationMixin, model.DirectoryFormat):
+    ms_backend_data = model.File(
+        pathspec="ms_backend_data.parquet",
+        format=ParquetFormat,
+    )
+    ms_experiment_link_mcols = model.File(
+        pathspec="ms_experiment_link_mcols.txt",
+        format=MSExperimentLinkMColsFormat,
+    )
+    ms_experiment_sample_data_links_spectra = model.File(
+        pathspec="ms_experiment_sample_data_links_spectra.txt",
+        format=MSExperimentSampleDataLinksSpectra,
+    )
+    ms_experiment_sample_data = model.File(
+        pathspec="ms_experiment_sample_data.txt",
+        format=MSExperimentSampleDataFormat,
+    )
+    spectra_processing_queue = model.File(
+        pathspec="spectra_processing_queue.json",
+        format=XCMSExperimentJSONFormat,
+    )
+    spectra_slots = model.File(
+        pathspec="spectra_slots.txt",
+        format=SpectraSlotsFormat,
+    )
+    xcms_experiment_process_history = model.File(
+        pathspec="xcms_experiment_process_history.json",
+        format=XCMSExperimentJSONFormat,
+        optional=True,
+    )
+    xcms_experiment_chrom_peak_data = model.File(
+        pathspec="xcms_experiment_chrom_peak_data.txt",
+        format=XCMSExperimentChromPeakDataFormat,
+        optional=True,
+    )
+    xcms_experiment_chrom_peaks = model.File(
+        pathspec="xcms_experiment_chrom_peaks.parquet",
+        format=ParquetFormat,
+        optional=True,
+    )
+    xcms_experiment_feature_definitions = model.File(
+        pathspec="xcms_experiment_feature_definitions.txt",
+        format=XCMSExperimentFeatureDefinitionsFormat,
+        optional=True,
+    )
+    xcms_experiment_feature_peak_index = model.File(
+        pathspec="xcms_experiment_feature_peak_index.txt",
+        format=XCMSExperimentFeaturePeakIndexFormat,
+        optional=True,
+    )
+    resource_usage = model.File(
+        pathspec="resource_usage.json",
+        format=ResourceUsageFormat,
+        optional=True,
+    )
+    spectra = model.FileCollection(
+        rf"{SPECTRA_DIRNAME}/.+\.mzML{COMPRESSION_SUFFIX_PATTERN}",
+        format=mzMLFormat,
+        optional=True,
+    )
+
+    @spectra.set_path_maker
+    def spectra_path_maker(self, filename):
+        return f"{SPECTRA_DIRNAME}/{filename}"
+
+    def read_backend_data(self, columns=None, filters=None):
+        """
+        Reads the MS backend data. Only the requested `columns` are read and row
+        groups (samples) that do not match `filters` are skipped, e.g.
+        columns=["rtime", "msLevel", "dataOrigin"], filters=[("msLevel", "==", 2)].
+        """
+        return read_parquet_table(
+            os.path.join(str(self), "ms_backend_data.parquet"), columns, filters
+        )
+
+    def read_chrom_peaks(self, columns=None, filters=None):
+        """
+        Reads the chromatographic peaks, see read_backend_data.
+        """
+        return read_parquet_table(
+            os.path.join(str(self), "xcms_experiment_chrom_peaks.parquet"),
+            columns,
+            filters,
+        )
+
+    def _validate_(self):
+        columns = pq.read_schema(
+            os.path.join(str(self), "ms_backend_data.parquet")
+        ).names
+        missing = set(MS_BACKEND_DATA_COLUMNS) - set(columns)
+        if missing:
+            raise ValidationError(
+                "ms_backend_data.parquet is missing the following columns:\n"
+                + ", ".join(sorted(missing))
+            )
+
+        path = os.path.join(str(self), "xcms_experiment_chrom_peaks.parquet")
+        if os.path.exists(path):
+            missing = set(CHROM_PEAKS_COLUMNS) - set(pq.read_schema(path).names)
+            if missing:
+                raise ValidationError(
+                    "xcms_experiment_chrom_peaks.parquet is missing the following "
+                    "columns:\n" + ", ".join(sorted(missing))
+                )
+
+
+class MSPFormat(model.TextFileFormat):
+    def _validate(self, n_records=None):
         """
         MSP format that adheres to the rules listed in the MsBackendMsp R package.
         - Comment lines are expected to start with a #.
@@ -353,92 +550,308 @@ class MSPFormat(model.TextFileFormat):
         on the number of spectra, number of peaks per spectra or number of metadata
         lines.
         """
-        errors = []
-        peak_section = False
-
-        metadata_pattern = re.compile(r"^.*:.*$")  # Faster metadata detection
-        peak_pattern = re.compile(r"^\d+(\.\d+)?[ \t]+\d+(\.\d+)?(?:[ \t]+.*)?$")
-
-        with open(self.path, "r", encoding="utf-8") as f:
-            for i, line in enumerate(f):
-                line = line.strip()
-
-                # Switch to metadata section at empty lines
-                if not line:
-                    peak_section = False
-                    continue
-
-                # Check if the line is a comment
-                if line.startswith("#"):
-                    continue
-
-                # Switch to peak section if pattern matches
-                if not peak_section and peak_pattern.match(line):
-                    peak_section = True
-
-                # Metadata validation (must have "key: value" format)
-                if not peak_section and not metadata_pattern.match(line):
-                    errors.append(
-                        f"Line {i}: Invalid metadata format (should be 'key: value')."
-                        f"\n{line}"
+        validate_msp(
+            str(self),
+            n_records,
+            n_jobs=get_validation_jobs(),
+            max_errors=get_validation_max_errors(),
+        )
+
+    @cached_validation
+    def _validate_(self, level):
+        self._validate({"min": 10, "max": None}[level])
+
+
+# Number of records of an MSP index that are checked against the MSP file
+MSP_INDEX_SPOT_CHECKS = 10
+
+
+class MSPIndexFormat(model.TextFileFormat):
+    def _validate(self, n_rows=None):
+        with open(str(self), "r") as f:
+            header = f.readline().rstrip("\n").split("\t")
+            if header != MSP_INDEX_COLUMNS:
+                raise ValidationError(
+                    "Header does not match MSPIndexFormat. It must consist of the "
+                    "following columns:\n"
+                    + ", ".join(MSP_INDEX_COLUMNS)
+                    + "\n\nFound instead:\n"
+                    + ", ".join(header)
+                )
+
+            for i, line in enumerate(f, 2):
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != len(MSP_INDEX_COLUMNS):
+                    raise ValidationError(
+                        f"Line {i} does not have {len(MSP_INDEX_COLUMNS)} columns."
                     )
-                # Peak data validation (must be m/z and intensity, whitespace or
-                # tab-separated, and allow additional values)
-                if peak_section and len(line.split()) < 2:
-                    errors.append(
-                        f"Line {i}: Peak data must have at least m/z and intensity "
-                        f"values.\n{line}"
+                if not (parts[0].isdigit() and parts[1].isdigit()):
+                    raise ValidationError(
+                        f"Line {i} has a non-integer offset or length: "
+                        f"{parts[0]}, {parts[1]}"
                     )
+                if n_rows is not None and i - 1 >= n_rows:
+                    break
+
+    def _validate_(self, level):
+        self._validate({"min": 50, "max": None}[level])
+
+
+class MSPDirFmt(model.DirectoryFormat):
+    # A file collection because the name of the MSP file is kept on import. It
+    # holds exactly one file, see _validate_.
+    msp = model.FileCollection(
+        rf".+\.msp{COMPRESSION_SUFFIX_PATTERN}$", format=MSPFormat
+    )
+    index = model.File("msp_index.tsv", format=MSPIndexFormat, optional=True)
+
+    @msp.set_path_maker
+    def msp_path_maker(self, filename):
+        return filename
+
+    @property
+    def msp_path(self):
+        return str(self._msp_files()[0])
+
+    def _msp_files(self):
+        return [msp for _, msp in self.msp.iter_views(MSPFormat)]
+
+    @property
+    def index_path(self):
+        return os.path.join(str(self), "msp_index.tsv")
+
+    def build_index(self):
+        """
+        Writes the record index of the MSP library to msp_index.tsv.
+        """
+        build_msp_index(self.msp_path, self.index_path)
+
+    def read_index(self):
+        """
+        Returns the record index as a DataFrame with the columns offset, length,
+        name, precursor_mz and ion_mode. If the directory has no index, it is built
+        in a temporary directory, as the directory of an artifact must not change.
+        """
+        if os.path.exists(self.index_path):
+            return _read_msp_index(self.index_path)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, "msp_index.tsv")
+            build_msp_index(self.msp_path, index_path)
+            return _read_msp_index(index_path)
+
+    def read_record(self, offset, length):
+        """
+        Returns the text of the spectrum record with the given byte offset and
+        length from the index.
+        """
+        return read_msp_record(self.msp_path, int(offset), int(length))
+
+    def _validate_(self):
+        n_files = len(self._msp_files())
+        if n_files != 1:
+            raise ValidationError(
+                f"The directory must contain exactly one MSP file. Found: {n_files}"
+            )
+
+        # The offsets of compressed libraries refer to the decompressed content
+        if not os.path.exists(self.index_path) or get_compression(self.msp_path):
+            return
+
+        with open(self.index_path, "r") as f:
+            n_records = sum(1 for _ in f) - 1
+        if n_records < 1:
+            return
+        # Spot-check evenly spaced records including the first and the last one
+        checked = set(
+            np.linspace(0, n_records - 1, min(n_records, MSP_INDEX_SPOT_CHECKS))
+            .round()
+            .astype(int)
+        )
+
+        size = os.path.getsize(self.msp_path)
+        with open(self.index_path, "r") as index, open(self.msp_path, "rb") as msp:
+            next(index)
+            for i, line in enumerate(index):
+                if i in checked:
+                    offset, length, name = line.split("\t")[:3]
+                    _check_msp_record(msp, int(offset), int(length), name, size)
+
+
+def _read_msp_index(path):
+    return pd.read_csv(
+        path,
+        sep="\t",
+        dtype={"name": str, "ion_mode": str},
+        keep_default_na=False,
+        na_values={"precursor_mz": [""]},
+    )
 
-        if errors:
-            raise ValidationError("\n".join(errors))
+
+def _check_msp_record(f, offset, length, name, size):
+    """
+    Checks that a record of the MSP index lies within the MSP file and starts at
+    the beginning of its NAME line.
+    """
+    if offset + length > size:
+        raise ValidationError(
+            "The MSP index does not match the MSP file. The record at byte "
+            f"{offset} ends at byte {offset + length} but the file has {size} bytes."
+        )
+
+    f.seek(max(offset - 1, 0))
+    previous = f.read(1) if offset > 0 else b"\n"
+    key = f.readline().split(b":", 1)[0]
+    if previous != b"\n" or (
+        name and key.decode("utf-8", "replace").strip().lower() != "name"
+    ):
+        raise ValidationError(
+            "The MSP index does not match the MSP file. The record at byte "
+            f"{offset} does not start with the NAME line of '{name}'."
+        )
+
+
+class NPYFormat(model.BinaryFileFormat):
+    def _validate(self):
+        with open(str(self), "rb") as f:
+            magic = f.read(6)
+
+        if magic != b"\x93NUMPY":
+            raise ValidationError("File is not a NumPy array (.npy) file.")
 
     def _validate_(self, level):
         self._validate()
 
 
-MSPDirFmt = model.SingleFileDirectoryFormat("MSPDirFmt", r".+\.msp$", MSPFormat)
+class CompiledMSPMetadataFormat(model.TextFileFormat):
+    def _validate(self):
+        with open(str(self), "r") as f:
+            header = f.readline().rstrip("\n").split("\t")
 
+        if len(header) != len(set(header)):
+            raise ValidationError(
+                "Header of CompiledMSPMetadataFormat must not contain duplicate "
+                "columns. Found:\n" + ", ".join(header)
+            )
 
-class MatchedSpectraFormat(model.TextFileFormat):
-    def _validate(self, lines=None):
-        header_exp = [".original_query_index", "target_spectrum_id", "score"]
+    def _validate_(self, level):
+        self._validate()
 
-        with open(str(self), "r") as f:
-            for i, line in enumerate(f, 1):
-                parts = line.rstrip("\n").split("\t")
 
-                # Header check
-                if i == 1:
-                    if parts != header_exp:
-                        raise ValidationError(
-                            "Header does not match MatchedSpectraFormat. It must "
-                            "at least consist of the following columns:\n"
-                            + ", ".join(header_exp)
-                            + "\n\nFound instead:\n"
-                            + ", ".join(parts)
-                        )
-                    continue
-
-                # Column count check
-                if len(parts) != 3:
-                    raise ValidationError(f"Line {i} does not have 3 columns.")
-
-                # Score value check
-                try:
-                    score = float(parts[2])
-                    if not (0 <= score <= 1):
-                        raise ValidationError(
-                            "The values in the score column have to be between 0 and "
-                            f"1. Line {i} has an out-of-range score: {score}"
-                        )
-                except ValueError:
-                    raise ValidationError(
-                        f"Line {i} has a non-numeric score: {parts[2]}"
-                    )
-                if lines is not None and i - 1 >= lines:
-                    break
+class CompiledMSPDirFmt(model.DirectoryFormat):
+    metadata = model.File("metadata.tsv", format=CompiledMSPMetadataFormat)
+    mz = model.File("mz.npy", format=NPYFormat)
+    intensity = model.File("intensity.npy", format=NPYFormat)
+    offsets = model.File("offsets.npy", format=NPYFormat)
+    fragment_index_bin_width = model.File(
+        FRAGMENT_INDEX_FILES["bin_width"], format=NPYFormat, optional=True
+    )
+    fragment_index_offsets = model.File(
+        FRAGMENT_INDEX_FILES["offsets"], format=NPYFormat, optional=True
+    )
+    fragment_index_spectra = model.File(
+        FRAGMENT_INDEX_FILES["spectra"], format=NPYFormat, optional=True
+    )
+    fragment_index_weights = model.File(
+        FRAGMENT_INDEX_FILES["weights"], format=NPYFormat, optional=True
+    )
+
+    def read_metadata(self):
+        """
+        Returns the spectrum metadata as a DataFrame of strings with one row per
+        spectrum.
+        """
+        return pd.read_csv(
+            os.path.join(str(self), "metadata.tsv"),
+            sep="\t",
+            dtype=str,
+            keep_default_na=False,
+        )
+
+    def read_peaks(self, mmap_mode="r"):
+        """
+        Returns the offsets, m/z and intensity arrays of the library. The arrays are
+        memory-mapped by default so that they are shared between processes. The
+        peaks of spectrum i are at offsets[i]:offsets[i + 1].
+        """
+        return tuple(
+            np.load(os.path.join(str(self), f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ("offsets", "mz", "intensity")
+        )
+
+    @property
+    def has_fragment_index(self):
+        return all(
+            os.path.exists(os.path.join(str(self), filename))
+            for filename in FRAGMENT_INDEX_FILES.values()
+        )
+
+    def build_fragment_index(self, bin_width):
+        """
+        Writes the fragment-ion inverted index of the library with m/z bins of
+        `bin_width`, see q2_ms.types._fragment_index.
+        """
+        build_fragment_index(*self.read_peaks(), str(self), bin_width)
+
+    def read_fragment_index(self, mmap_mode="r"):
+        """
+        Returns the bin width and the offsets, spectra and weights arrays of the
+        fragment index. The postings of bin b are at offsets[b]:offsets[b + 1].
+        """
+        return read_fragment_index(str(self), mmap_mode)
+
+    def _validate_(self):
+        offsets, mz, intensity = self.read_peaks()
+
+        if offsets.ndim != 1 or mz.ndim != 1 or intensity.ndim != 1:
+            raise ValidationError("The peak arrays must be one-dimensional.")
+        if mz.shape != intensity.shape:
+            raise ValidationError(
+                f"The m/z array has {mz.size} values but the intensity array has "
+                f"{intensity.size} values."
+            )
+        if offsets.size == 0 or offsets[0] != 0 or offsets[-1] != mz.size:
+            raise ValidationError(
+                "The offsets must start at 0 and end at the number of peaks "
+                f"({mz.size})."
+            )
+        if np.any(np.diff(offsets) < 0):
+            raise ValidationError("The offsets must not be decreasing.")
+
+        n_spectra = len(self.read_metadata())
+        if n_spectra != offsets.size - 1:
+            raise ValidationError(
+                f"The metadata describes {n_spectra} spectra but the offsets "
+                f"describe {offsets.size - 1} spectra."
+            )
+
+        present = [
+            os.path.exists(os.path.join(str(self), filename))
+            for filename in FRAGMENT_INDEX_FILES.values()
+        ]
+        if any(present) and not all(present):
+            raise ValidationError(
+                "The fragment index is incomplete. It consists of the files: "
+                + ", ".join(FRAGMENT_INDEX_FILES.values())
+            )
+        if all(present):
+            _, bin_offsets, spectra, weights = self.read_fragment_index()
+            if (
+                bin_offsets[-1] != mz.size
+                or spectra.size != mz.size
+                or weights.size != mz.size
+            ):
+                raise ValidationError(
+                    f"The fragment index must hold one entry for each of the "
+                    f"{mz.size} peaks of the library."
+                )
+
+
+class MatchedSpectraFormat(model.TextFileFormat):
+    def _validate(self, lines=None):
+        validate_matched_spectra(str(self), lines)
 
+    @cached_validation
     def _validate_(self, level):
         self._validate({"min": 50, "max": None}[level])
 
@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+
+import numpy as np
+
+DEFAULT_BIN_WIDTH = 0.01
+
+# Files of the fragment index within a CompiledMSPDirFmt
+FRAGMENT_INDEX_FILES = {
+    "bin_width": "fragment_index_bin_width.npy",
+    "offsets": "fragment_index_offsets.npy",
+    "spectra": "fragment_index_spectra.npy",
+    "weights": "fragment_index_weights.npy",
+}
+
+
+def build_fragment_index(offsets, mz, intensity, output_dir, bin_width):
+    """
+    Writes an inverted index of the fragments of a columnar library. The
+    fragments are assigned to m/z bins of `bin_width` and every bin lists the
+    spectra with a fragment in it. The postings of bin b are at
+    offsets[b]:offsets[b + 1] of the spectra (int32) and weights (float32) arrays.
+    The weights are the square root scaled intensities normalised to unit length
+    per spectrum, so summing the products of the weights of shared bins gives a
+    binned cosine similarity.
+
+    Parameters:
+        offsets (np.ndarray):
+            Start of the peaks of every spectrum followed by the number of peaks.
+        mz (np.ndarray):
+            m/z values of all spectra.
+        intensity (np.ndarray):
+            Intensity values of all spectra.
+        output_dir (str):
+            Directory the index files are written to.
+        bin_width (float):
+            Width of the m/z bins.
+    """
+    if bin_width <= 0:
+        raise ValueError("The bin width of the fragment index must be positive.")
+
+    counts = np.diff(offsets)
+    spectra = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    weights = np.sqrt(np.asarray(intensity, dtype=np.float64))
+    norms = np.sqrt(np.bincount(spectra, weights**2, minlength=len(counts)))
+    weights = np.divide(
+        weights, norms[spectra], out=np.zeros(len(weights)), where=norms[spectra] > 0
+    )
+
+    bins = np.floor(np.asarray(mz, dtype=np.float64) / bin_width).astype(np.int64)
+    order = np.argsort(bins, kind="stable")
+    n_bins = int(bins.max()) + 1 if len(bins) else 0
+    bin_offsets = np.zeros(n_bins + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bins, minlength=n_bins), out=bin_offsets[1:])
+
+    arrays = {
+        "bin_width": np.array(bin_width, dtype=np.float64),
+        "offsets": bin_offsets,
+        "spectra": spectra[order],
+        "weights": weights[order].astype(np.float32),
+    }
+    for name, filename in FRAGMENT_INDEX_FILES.items():
+        np.save(os.path.join(output_dir, filename), arrays[name])
+
+
+def read_fragment_index(directory, mmap_mode="r"):
+    """
+    Returns the bin width and the memory-mapped offsets, spectra and weights of a
+    fragment index written by build_fragment_index.
+    """
+    bin_width, offsets, spectra, weights = (
+        np.load(os.path.join(directory, filename), mmap_mode=mmap_mode)
+        for filename in FRAGMENT_INDEX_FILES.values()
+    )
+    return float(bin_width), offsets, spectra, weights
@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+from qiime2.core.exceptions import ValidationError
+
+MATCHED_SPECTRA_COLUMNS = [".original_query_index", "target_spectrum_id", "score"]
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def validate_matched_spectra(path, n_lines=None):
+    """
+    Validates a MatchedSpectra table in blocks of BLOCK_SIZE bytes. The column
+    counts and scores of all lines of a block are checked with array operations,
+    so memory usage only depends on the block size.
+
+    Parameters:
+        path (str):
+            Path to the MatchedSpectra table.
+        n_lines (int):
+            Number of lines after the header to validate. All lines are validated
+            if None.
+
+    Raises:
+        ValidationError:
+            If the header is wrong or if a line does not have three columns or a
+            score between 0 and 1. The error refers to the first invalid line.
+    """
+    with open(path, "rb") as f:
+        header = f.readline().rstrip(b"\r\n").decode("utf-8").split("\t")
+        if header != MATCHED_SPECTRA_COLUMNS:
+            raise ValidationError(
+                "Header does not match MatchedSpectraFormat. It must "
+                "at least consist of the following columns:\n"
+                + ", ".join(MATCHED_SPECTRA_COLUMNS)
+                + "\n\nFound instead:\n"
+                + ", ".join(header)
+            )
+
+        first_line = 2
+        while n_lines is None or first_line - 2 < n_lines:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            # Complete the last line of the block
+            if not block.endswith(b"\n"):
+                block += f.readline()
+                if not block.endswith(b"\n"):
+                    block += b"\n"
+            if n_lines is not None:
+                block = _head(block, n_lines - (first_line - 2))
+
+            first_line += _validate_block(block, first_line)
+
+
+def _head(block, n_lines):
+    newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+    if newlines.size <= n_lines:
+        return block
+    return block[: newlines[n_lines - 1] + 1]
+
+
+def _validate_block(block, first_line):
+    """
+    Validates a block of complete lines and returns the number of lines.
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    line_ends = np.flatnonzero(data == ord("\n"))
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    tabs = np.flatnonzero(data == ord("\t"))
+
+    n_tabs = np.searchsorted(tabs, line_ends) - np.searchsorted(tabs, line_starts)
+    bad_columns = np.flatnonzero(n_tabs != 2)
+    # Scores are only checked up to the first line with a wrong column count
+    n_valid = bad_columns[0] if bad_columns.size else line_ends.size
+
+    if n_valid:
+        raw = pd.read_csv(
+            io.BytesIO(block[: line_ends[n_valid - 1] + 1]),
+            sep="\t",
+            header=None,
+            usecols=[2],
+            dtype=str,
+            na_filter=False,
+            quoting=csv.QUOTE_NONE,
+        )[2]
+        scores = pd.to_numeric(raw, errors="coerce").to_numpy()
+
+        non_numeric = np.isnan(scores)
+        if non_numeric.any():
+            i = np.argmax(non_numeric)
+            out_of_range = (scores[:i] < 0) | (scores[:i] > 1)
+        else:
+            i = None
+            out_of_range = (scores < 0) | (scores > 1)
+
+        if out_of_range.any():
+            j = np.argmax(out_of_range)
+            raise ValidationError(
+                "The values in the score column have to be between 0 and 1. "
+                f"Line {first_line + j} has an out-of-range score: {scores[j]}"
+            )
+        if i is not None:
+            raise ValidationError(
+                f"Line {first_line + i} has a non-numeric score: {raw.iloc[i]}"
+            )
+
+    if bad_columns.size:
+        raise ValidationError(
+            f"Line {first_line + bad_columns[0]} does not have 3 columns."
+        )
+
+    return line_ends.size
+
+
+def read_matched_spectra(path):
+    """
+    Reads a MatchedSpectra table into a DataFrame with compact dtypes: the query
+    index as uint32, the target spectrum IDs as a categorical and the scores as
+    float32.
+    """
+    return pd.read_csv(
+        path,
+        sep="\t",
+        dtype={
+            ".original_query_index": "uint32",
+            "target_spectrum_id": "category",
+            "score": "float32",
+        },
+    )
@@ -0,0 +1,153 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import csv
+import os
+from collections import OrderedDict
+
+from q2_ms.types._cache import get_validation_cache
+
+MS_BACKEND_HEADER = "# MsBackendMzR"
+
+# Number of summaries kept in memory
+MAX_SUMMARIES = 256
+
+# Least recently used summaries of ms_backend_data.txt files keyed by path, size and
+# modification time
+_summaries = OrderedDict()
+
+
+def read_ms_backend_header(path):
+    """
+    Returns the first line and the column names of an ms_backend_data.txt file.
+    """
+    with open(path, "r") as f:
+        first_line = f.readline().rstrip("\r\n")
+        columns = next(csv.reader([f.readline()], delimiter="\t"), [])
+    return first_line, columns
+
+
+def _iter_columns(path, columns):
+    """
+    Yields the values of `columns` of every spectrum in an ms_backend_data.txt
+    file. Only the fields up to the last requested column are split. Missing
+    columns are returned as None.
+    """
+    with open(path, "r") as f:
+        f.readline()
+        header = next(csv.reader([f.readline()], delimiter="\t"))
+        indices = None
+
+        for line in f:
+            if indices is None:
+                # Data rows start with an additional row name column
+                shift = line.count("\t") + 1 - len(header)
+                indices = [
+                    header.index(column) + shift if column in header else None
+                    for column in columns
+                ]
+                max_split = max(i for i in indices if i is not None) + 1
+            fields = line.rstrip("\r\n").split("\t", max_split)
+            yield tuple(None if i is None else fields[i].strip('"') for i in indices)
+
+
+def summarize_ms_backend_data(path):
+    """
+    Returns the MS levels and the number of spectra per sample (dataOrigin) of an
+    ms_backend_data.txt file. Summaries are kept in memory and in the validation
+    cache (see Q2_MS_VALIDATION_CACHE) so that the file is only read once.
+
+    Returns:
+        dict: {"ms_levels": sorted list of MS levels,
+               "spectra_per_sample": {sample: number of spectra}}
+    """
+    summary = _load_summary(path)
+    if summary is None or "spectra_per_sample" not in summary:
+        _, summary = _scan(path)
+    return summary
+
+
+def has_ms_level(path, ms_level):
+    """
+    Checks whether an ms_backend_data.txt file contains spectra of `ms_level`. A
+    cached summary is used if available. Otherwise the file is streamed until the
+    first matching spectrum is found.
+    """
+    summary = _load_summary(path)
+    if summary is not None and (
+        ms_level in summary["ms_levels"] or "spectra_per_sample" in summary
+    ):
+        return ms_level in summary["ms_levels"]
+
+    found, _ = _scan(path, stop_at=str(ms_level))
+    return found
+
+
+def _scan(path, stop_at=None):
+    """
+    Reads the MS levels and samples of all spectra. Returns True as soon as a
+    spectrum with the MS level `stop_at` is found, and caches a partial summary
+    with the MS levels read so far and without spectra_per_sample. Otherwise the
+    full summary is built, cached and returned.
+    """
+    ms_levels = set()
+    spectra_per_sample = {}
+    for ms_level, sample in _iter_columns(path, ["msLevel", "dataOrigin"]):
+        if ms_level == stop_at:
+            ms_levels.add(ms_level)
+            summary = {"ms_levels": _sort_ms_levels(ms_levels)}
+            _store_summary(path, summary)
+            return True, summary
+        ms_levels.add(ms_level)
+        if sample is not None:
+            spectra_per_sample[sample] = spectra_per_sample.get(sample, 0) + 1
+
+    summary = {
+        "ms_levels": _sort_ms_levels(ms_levels),
+        "spectra_per_sample": spectra_per_sample,
+    }
+    _store_summary(path, summary)
+    return False, summary
+
+
+def _sort_ms_levels(ms_levels):
+    return sorted(int(level) for level in ms_levels if level.isdigit())
+
+
+def _summary_key(path):
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+
+def _remember_summary(key, summary):
+    _summaries[key] = summary
+    _summaries.move_to_end(key)
+    while len(_summaries) > MAX_SUMMARIES:
+        _summaries.popitem(last=False)
+
+
+def _load_summary(path):
+    key = _summary_key(path)
+    summary = _summaries.get(key)
+    if summary is not None:
+        _summaries.move_to_end(key)
+        return summary
+
+    cache = get_validation_cache()
+    if cache is not None:
+        summary = cache.load(cache.key("MSBackendDataSummary", path, "summary"))
+        if summary is not None:
+            _remember_summary(key, summary)
+    return summary
+
+
+def _store_summary(path, summary):
+    _remember_summary(_summary_key(path), summary)
+
+    cache = get_validation_cache()
+    if cache is not None:
+        cache.store(cache.key("MSBackendDataSummary", path, "summary"), summary)
@@ -0,0 +1,377 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import array
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from qiime2.core.exceptions import ValidationError
+
+from q2_ms.types._compression import get_compression, open_compressed
+
+MIN_CHUNK_SIZE = 16 * 1024 * 1024
+
+_METADATA_PATTERN = re.compile(r"^.*:.*$")
+_PEAK_PATTERN = re.compile(r"^\d+(\.\d+)?[ \t]+\d+(\.\d+)?(?:[ \t]+.*)?$")
+
+
+def validate_msp(path, n_records=None, n_jobs=1, max_errors=None):
+    """
+    Validates an MSP file.
+
+    If `n_records` is set only the first `n_records` spectrum records are
+    validated. Otherwise the file is split into chunks that end at record
+    boundaries (empty lines) and the chunks are validated in `n_jobs` worker
+    processes. Validation stops once `max_errors` errors have been found.
+    Compressed files are streamed in a single process as they cannot be split
+    into chunks without decompressing them.
+
+    Parameters:
+        path (str):
+            Path to the MSP file.
+        n_records (int):
+            Number of spectrum records to validate. All records are validated if
+            None.
+        n_jobs (int):
+            Number of worker processes.
+        max_errors (int):
+            Maximum number of reported errors. All errors are reported if None.
+
+    Raises:
+        ValidationError:
+            If any line does not follow the MSP format.
+    """
+    # One more error than reported is collected to know if validation stopped
+    limit = None if max_errors is None else max_errors + 1
+    chunks = []
+    if n_records is None and n_jobs > 1 and get_compression(path) is None:
+        chunks = _find_chunks(path, n_jobs)
+
+    if len(chunks) < 2:
+        with open_compressed(path, "r") as f:
+            errors = [
+                _format_error(*error) for error in _iter_errors(f, limit, n_records)
+            ]
+    else:
+        errors = []
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as executor:
+            futures = [
+                executor.submit(_validate_chunk, path, start, end, limit)
+                for start, end in chunks
+            ]
+            # Line numbers of a chunk are only known once all previous chunks
+            # have been counted, so the chunks return relative line numbers
+            line_offset = 0
+            for future in futures:
+                chunk_errors, n_lines = future.result()
+                errors.extend(
+                    _format_error(line_offset + i, message, line)
+                    for i, message, line in chunk_errors
+                )
+                line_offset += n_lines
+                if limit is not None and len(errors) >= limit:
+                    for other in futures:
+                        other.cancel()
+                    break
+
+    if errors:
+        if limit is not None and len(errors) >= limit:
+            errors = errors[:max_errors]
+            errors.append(f"Validation stopped after {max_errors} errors.")
+        raise ValidationError("\n".join(errors))
+
+
+def _iter_errors(lines, max_errors=None, n_records=None):
+    """
+    Yields (line index, message, line) for every invalid line.
+    """
+    peak_section = False
+    in_record = False
+    n_found_records = 0
+    n_errors = 0
+
+    for i, line in enumerate(lines):
+        line = line.strip()
+
+        # Switch to metadata section at empty lines
+        if not line:
+            peak_section = False
+            if in_record:
+                in_record = False
+                n_found_records += 1
+                if n_records is not None and n_found_records >= n_records:
+                    break
+            continue
+
+        # Check if the line is a comment
+        if line.startswith("#"):
+            continue
+
+        in_record = True
+
+        # Switch to peak section if pattern matches
+        if not peak_section and _PEAK_PATTERN.match(line):
+            peak_section = True
+
+        # Metadata validation (must have "key: value" format)
+        if not peak_section and not _METADATA_PATTERN.match(line):
+            message = "Invalid metadata format (should be 'key: value')."
+        # Peak data validation (must be m/z and intensity, whitespace or tab-
+        # separated, and allow additional values)
+        elif peak_section and len(line.split()) < 2:
+            message = "Peak data must have at least m/z and intensity values."
+        else:
+            continue
+
+        yield i, message, line
+        n_errors += 1
+        if max_errors is not None and n_errors >= max_errors:
+            break
+
+
+def _validate_chunk(path, start, end, max_errors):
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lines = io.StringIO(data.decode("utf-8"), newline=None)
+    # The number of lines is needed to turn the line indices of the following
+    # chunks into absolute line numbers
+    return list(_iter_errors(lines, max_errors)), data.count(b"\n")
+
+
+def _find_chunks(path, n_jobs):
+    """
+    Splits a file into byte ranges that start at the beginning of a spectrum
+    record.
+    """
+    size = os.path.getsize(path)
+    chunk_size = max(MIN_CHUNK_SIZE, -(-size // (n_jobs * 4)))
+
+    chunks = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            # Skip the rest of the current line and move to the next empty line
+            f.readline()
+            while True:
+                line = f.readline()
+                if not line or not line.strip():
+                    break
+            end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _format_error(i, message, line):
+    return f"Line {i}: {message}\n{line}"
+
+
+MSP_INDEX_COLUMNS = ["offset", "length", "name", "precursor_mz", "ion_mode"]
+
+# Normalised metadata keys (lower case without "_" and spaces) of the indexed fields
+_INDEX_KEYS = {
+    "name": "name",
+    "precursormz": "precursor_mz",
+    "ionmode": "ion_mode",
+}
+
+
+def build_msp_index(msp_path, index_path):
+    """
+    Writes a tab-separated index of all spectrum records of an MSP file. The index
+    holds the byte offset and length of every record together with its name,
+    precursor m/z and ion mode, which allows to read single records without
+    scanning the file. For compressed files the offsets refer to the decompressed
+    content.
+
+    Parameters:
+        msp_path (str):
+            Path to the MSP file.
+        index_path (str):
+            Path of the index file that is written.
+    """
+    with open_compressed(msp_path) as f, open(index_path, "w") as out:
+        out.write("\t".join(MSP_INDEX_COLUMNS) + "\n")
+        for offset, length, fields in _iter_records(f):
+            row = [str(offset), str(length)] + [
+                fields.get(column, "") for column in MSP_INDEX_COLUMNS[2:]
+            ]
+            out.write("\t".join(row) + "\n")
+
+
+def read_msp_record(msp_path, offset, length):
+    """
+    Returns the text of the spectrum record at `offset` of an MSP file. Offsets of
+    compressed files refer to the decompressed content, so every record read from
+    them decompresses the file up to the record.
+    """
+    with open_compressed(msp_path) as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8")
+
+
+def _iter_records(f):
+    """
+    Yields (offset, length, indexed metadata fields) for every record of a binary
+    MSP file handle.
+    """
+    start = end = None
+    fields = {}
+    position = 0
+
+    for line in f:
+        stripped = line.strip()
+
+        if not stripped:
+            if start is not None:
+                yield start, end - start, fields
+                start = None
+                fields = {}
+        elif not stripped.startswith(b"#"):
+            if start is None:
+                start = position
+            end = position + len(line.rstrip(b"\r\n"))
+
+            if b":" in stripped:
+                key, value = stripped.split(b":", 1)
+                key = key.decode("utf-8").lower().replace("_", "").replace(" ", "")
+                column = _INDEX_KEYS.get(key)
+                if column is not None and column not in fields:
+                    # Tabs would break the columns of the index
+                    fields[column] = " ".join(value.decode("utf-8").split())
+
+        position += len(line)
+
+    if start is not None:
+        yield start, end - start, fields
+
+
+def iter_msp_spectra(msp_path):
+    """
+    Yields the metadata as a list of (key, value) tuples and the m/z and intensity
+    values of every spectrum record of an MSP file. Additional peak values beyond
+    m/z and intensity are ignored.
+    """
+    metadata, mz, intensity = [], [], []
+    peak_section = False
+
+    with open_compressed(msp_path, "r") as f:
+        for line in f:
+            line = line.strip()
+
+            if not line:
+                if metadata or mz:
+                    yield metadata, mz, intensity
+                    metadata, mz, intensity = [], [], []
+                peak_section = False
+                continue
+
+            if line.startswith("#"):
+                continue
+
+            if not peak_section and _PEAK_PATTERN.match(line):
+                peak_section = True
+
+            if peak_section:
+                parts = line.split()
+                mz.append(float(parts[0]))
+                intensity.append(float(parts[1]))
+            else:
+                key, value = line.split(":", 1)
+                metadata.append((key.strip(), value.strip()))
+
+    if metadata or mz:
+        yield metadata, mz, intensity
+
+
+def write_compiled_msp(msp_path, output_dir):
+    """
+    Writes the spectra of an MSP file as a columnar library. The metadata is
+    written to metadata.tsv with one row per spectrum and one column per metadata
+    key. Repeated keys of a spectrum are joined with newlines. The peaks of all
+    spectra are written to the contiguous arrays mz.npy and intensity.npy
+    (float64), so that the library can be written back to MSP without loss, see
+    write_msp. The peaks of spectrum i are found at
+    offsets[i]:offsets[i + 1] with the offsets from offsets.npy (int64).
+
+    Parameters:
+        msp_path (str):
+            Path to the MSP file.
+        output_dir (str):
+            Directory the library files are written to.
+    """
+    rows = []
+    mz = array.array("d")
+    intensity = array.array("d")
+    offsets = array.array("q", [0])
+
+    for metadata, peak_mz, peak_intensity in iter_msp_spectra(msp_path):
+        row = {}
+        for key, value in metadata:
+            row[key] = f"{row[key]}\n{value}" if key in row else value
+        rows.append(row)
+        mz.extend(peak_mz)
+        intensity.extend(peak_intensity)
+        offsets.append(len(mz))
+
+    pd.DataFrame(rows).to_csv(
+        os.path.join(output_dir, "metadata.tsv"), sep="\t", index=False
+    )
+    np.save(os.path.join(output_dir, "mz.npy"), np.frombuffer(mz, dtype=np.float64))
+    np.save(
+        os.path.join(output_dir, "intensity.npy"),
+        np.frombuffer(intensity, dtype=np.float64),
+    )
+    np.save(
+        os.path.join(output_dir, "offsets.npy"), np.frombuffer(offsets, dtype=np.int64)
+    )
+
+
+def write_msp(metadata, mz, intensity, offsets, msp_path):
+    """
+    Writes a columnar library back to an MSP file. Peaks are written with the
+    shortest representation that reads back as the same float64 value.
+
+    Parameters:
+        metadata (pd.DataFrame):
+            Metadata with one row per spectrum. Empty values are skipped.
+        mz (np.ndarray):
+            m/z values of all spectra.
+        intensity (np.ndarray):
+            Intensity values of all spectra.
+        offsets (np.ndarray):
+            Start of the peaks of every spectrum in `mz` and `intensity` followed
+            by the total number of peaks.
+        msp_path (str):
+            Path of the MSP file that is written.
+    """
+    columns = metadata.columns.tolist()
+
+    with open(msp_path, "w", encoding="utf-8") as f:
+        for i, values in enumerate(metadata.itertuples(index=False, name=None)):
+            if i > 0:
+                f.write("\n")
+            for key, value in zip(columns, values):
+                if value:
+                    for part in value.split("\n"):
+                        f.write(f"{key}: {part}\n")
+            start, end = offsets[i], offsets[i + 1]
+            for peak_mz, peak_intensity in zip(
+                mz[start:end].tolist(), intensity[start:end].tolist()
+            ):
+                f.write(f"{_format_peak(peak_mz)} {_format_peak(peak_intensity)}\n")
+
+
+def _format_peak(value):
+    return np.format_float_positional(value, trim="-")
@@ -0,0 +1,564 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import base64
+import os
+import re
+import xml.etree.ElementTree as ET
+import zlib
+from xml.sax.saxutils import unescape
+
+import numpy as np
+from qiime2.core.exceptions import ValidationError
+
+from q2_ms.types._compression import get_compression, open_compressed
+
+MZML_NAMESPACE = "http://psi.hupo.org/ms/mzml"
+
+_ID_PATTERN = re.compile(rb'\bid="([^"]*)"')
+_SCAN_NUMBER_PATTERN = re.compile(r"\bscan=(\d+)")
+_INDEX_LIST_OFFSET_PATTERN = re.compile(
+    rb"<indexListOffset>\s*(\d+)\s*</indexListOffset>"
+)
+_SPECTRUM_INDEX_PATTERN = re.compile(
+    rb"<index\s+name=[\"']spectrum[\"']\s*>(.*?)</index>", re.DOTALL
+)
+_OFFSET_PATTERN = re.compile(rb"<offset[^>]*>\s*(\d+)\s*</offset>")
+
+# Bytes read at once when seeking spectra via the index. The metadata of most
+# spectra fits into a single block.
+_BLOCK_SIZE = 4096
+_BINARY_DATA_ARRAY_LIST_TAG = b"<binaryDataArrayList"
+_SPECTRUM_END_TAG = b"</spectrum>"
+_XML_DECLARATION_PATTERN = re.compile(rb"<\?xml[^>]*\?>")
+_FRAGMENT_START = f'<mzML xmlns="{MZML_NAMESPACE}">'.encode()
+_FRAGMENT_END = b"</mzML>"
+
+_NS = {"mzml": MZML_NAMESPACE}
+
+MS_LEVEL = "MS:1000511"
+SCAN_START_TIME = "MS:1000016"
+SELECTED_ION_MZ = "MS:1000744"
+PEAK_INTENSITY = "MS:1000042"
+CHARGE_STATE = "MS:1000041"
+COLLISION_ENERGY = "MS:1000045"
+POSITIVE_SCAN = "MS:1000130"
+NEGATIVE_SCAN = "MS:1000129"
+TOTAL_ION_CURRENT = "MS:1000285"
+BASE_PEAK_MZ = "MS:1000504"
+BASE_PEAK_INTENSITY = "MS:1000505"
+LOWEST_OBSERVED_MZ = "MS:1000528"
+HIGHEST_OBSERVED_MZ = "MS:1000527"
+ION_INJECTION_TIME = "MS:1000927"
+ION_MOBILITY_DRIFT_TIME = "MS:1002476"
+MZ_ARRAY = "MS:1000514"
+INTENSITY_ARRAY = "MS:1000515"
+ZLIB_COMPRESSION = "MS:1000574"
+NO_COMPRESSION = "MS:1000576"
+MINUTE = "UO:0000031"
+
+_BINARY_DTYPES = {
+    "MS:1000519": "<i4",
+    "MS:1000521": "<f4",
+    "MS:1000522": "<i8",
+    "MS:1000523": "<f8",
+}
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def validate_mzml(path, n_spectra=None):
+    """
+    Validates an mzML file with an incremental XML parser.
+
+    Only the document header and the first `n_spectra` spectra are parsed if
+    `n_spectra` is set. Otherwise the whole file is streamed spectrum by spectrum
+    and every parsed element is discarded right away, which keeps memory usage
+    constant regardless of file size. For indexed mzML files the offsets in the
+    <indexList> are checked as well when the whole file is validated. gzip- and
+    zstd-compressed files are decompressed while they are parsed and the offsets
+    refer to the decompressed content.
+
+    Parameters:
+        path (str):
+            Path to the mzML file.
+        n_spectra (int):
+            Number of spectra to validate. All spectra are validated if None.
+
+    Raises:
+        ValidationError:
+            If the file is not well-formed XML or does not follow the mzML
+            structure.
+    """
+    root_found = False
+    indexed = False
+    run_found = False
+    list_elem = None
+    spectrum_count = 0
+    declared_count = None
+    index_tag = None
+    index_file = None
+    source = open_compressed(path)
+
+    try:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            name = _local_name(elem.tag)
+
+            if event == "start":
+                if not root_found:
+                    root_found = True
+                    if elem.tag not in (
+                        f"{{{MZML_NAMESPACE}}}mzML",
+                        f"{{{MZML_NAMESPACE}}}indexedmzML",
+                    ):
+                        raise ValidationError(
+                            "Root element must be <mzML> or <indexedmzML> in the "
+                            f"namespace '{MZML_NAMESPACE}'. Found instead: "
+                            f"{elem.tag}"
+                        )
+                    indexed = name == "indexedmzML"
+                elif name == "run":
+                    run_found = True
+                elif name in ("spectrumList", "chromatogramList"):
+                    list_elem = elem
+                    if name == "spectrumList":
+                        declared_count = elem.get("count")
+                elif name == "index" and indexed and n_spectra is None:
+                    list_elem = elem
+                    index_tag = f"<{elem.get('name')}".encode()
+                    if index_file is None:
+                        index_file = open_compressed(path)
+                continue
+
+            if list_elem is None and name in ("spectrum", "chromatogram", "offset"):
+                raise ValidationError(
+                    f"Found a <{name}> element outside of a <{name}List> or "
+                    "<index> element."
+                )
+            if name == "spectrum":
+                _validate_spectrum(elem, spectrum_count)
+                spectrum_count += 1
+                # Drop the parsed spectrum to keep memory usage constant
+                elem.clear()
+                del list_elem[:]
+                if n_spectra is not None and spectrum_count >= n_spectra:
+                    return
+            elif name == "chromatogram":
+                elem.clear()
+                del list_elem[:]
+            elif name == "spectrumList":
+                if n_spectra is not None:
+                    return
+                _validate_spectrum_count(declared_count, spectrum_count)
+            elif name == "offset" and index_tag is not None:
+                _validate_offset(index_file, elem.get("idRef"), elem.text, index_tag)
+                del list_elem[:]
+            elif name == "index":
+                index_tag = None
+                elem.clear()
+    except ET.ParseError as e:
+        raise ValidationError(f"File is not valid XML: {e}")
+    finally:
+        source.close()
+        if index_file is not None:
+            index_file.close()
+
+    if not run_found:
+        raise ValidationError("File does not contain a <run> element.")
+
+
+def _validate_spectrum(elem, position):
+    for attribute in ("id", "index", "defaultArrayLength"):
+        if elem.get(attribute) is None:
+            raise ValidationError(
+                f"Spectrum {position} is missing the required attribute "
+                f"'{attribute}'."
+            )
+    try:
+        index = int(elem.get("index"))
+        int(elem.get("defaultArrayLength"))
+    except ValueError:
+        raise ValidationError(
+            f"Spectrum '{elem.get('id')}' has a non-integer 'index' or "
+            "'defaultArrayLength' attribute."
+        )
+    if index != position:
+        raise ValidationError(
+            f"Spectrum '{elem.get('id')}' has index {index} but is at position "
+            f"{position} of the spectrum list."
+        )
+
+
+def _validate_spectrum_count(declared_count, spectrum_count):
+    if declared_count is not None and declared_count != str(spectrum_count):
+        raise ValidationError(
+            f"The spectrum list declares {declared_count} spectra but "
+            f"{spectrum_count} were found."
+        )
+
+
+def _validate_offset(file, id_ref, offset, tag):
+    """
+    Checks that an offset of an indexedmzML index points to the start of the
+    element with the referenced id.
+    """
+    try:
+        file.seek(int(offset))
+    except (TypeError, ValueError):
+        raise ValidationError(
+            f"Index offset for '{id_ref}' is not an integer: {offset}"
+        )
+    head = file.read(4096)
+    match = _ID_PATTERN.search(head[: head.find(b">") + 1])
+    if (
+        not head.startswith(tag)
+        or match is None
+        or unescape(match.group(1).decode("utf-8", "replace"), {"&quot;": '"'})
+        != id_ref
+    ):
+        raise ValidationError(
+            f"Index offset {offset} for '{id_ref}' does not point to the start of "
+            f"the <{tag.decode()[1:]}> element with this id."
+        )
+
+
+def iter_mzml_spectra(path, ms_levels=None):
+    """
+    Yields the spectra of a plain or compressed mzML file in the order of the
+    spectrum list. The peak arrays are only decoded for spectra of `ms_levels`.
+    For plain indexed mzML files with `ms_levels` set, only the metadata of the
+    other spectra is read via the offsets in the <indexList>, see
+    _read_spectrum_offsets.
+
+    Parameters:
+        path (str):
+            Path to the mzML file.
+        ms_levels (set of int):
+            MS levels of the spectra to yield. All spectra are yielded if None.
+
+    Yields:
+        tuple: (index, MS level, retention time in seconds, precursor m/z, m/z
+            array, intensity array). The precursor m/z is NaN if the spectrum has
+            no selected ion and the arrays are float64.
+    """
+    index = None if ms_levels is None else _read_spectrum_offsets(path)
+    if index is not None:
+        offsets, declaration = index
+        with open(path, "rb") as f:
+            for offset in offsets:
+                elem = _read_indexed_spectrum(f, offset, declaration, True)
+                ms_level = _ms_level(elem)
+                if ms_level in ms_levels:
+                    elem = _read_indexed_spectrum(f, offset, declaration, False)
+                    yield _read_spectrum(elem, ms_level)
+        return
+
+    list_elem = None
+    with open_compressed(path) as source:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            name = _local_name(elem.tag)
+            if event == "start":
+                if name == "spectrumList":
+                    list_elem = elem
+                continue
+
+            if name == "spectrum":
+                ms_level = _ms_level(elem)
+                if ms_levels is None or ms_level in ms_levels:
+                    yield _read_spectrum(elem, ms_level)
+                elem.clear()
+                del list_elem[:]
+            elif name == "spectrumList":
+                return
+
+
+def _ms_level(elem):
+    ms_level = _cv_value(elem, MS_LEVEL)
+    return int(ms_level) if ms_level is not None else None
+
+
+def _read_spectrum_offsets(path):
+    """
+    Returns the sorted offsets of the spectra from the <indexList> of an
+    indexedmzML file and the XML declaration of the file, which declares the
+    encoding of the spectra. The index is found via the <indexListOffset> at the
+    end of the file, so the spectra themselves are not read. None is returned for
+    compressed files, which can't be seeked efficiently, and for files without a
+    usable index.
+    """
+    if get_compression(path) is not None:
+        return None
+
+    with open(path, "rb") as f:
+        declaration = _XML_DECLARATION_PATTERN.match(f.read(_BLOCK_SIZE))
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - _BLOCK_SIZE))
+        match = _INDEX_LIST_OFFSET_PATTERN.search(f.read())
+        if match is None or int(match.group(1)) >= size:
+            return None
+        f.seek(int(match.group(1)))
+        index = _SPECTRUM_INDEX_PATTERN.search(f.read())
+        if index is None:
+            return None
+        offsets = sorted(int(o) for o in _OFFSET_PATTERN.findall(index.group(1)))
+        # Files with prefixed or shifted elements are streamed instead
+        if offsets:
+            f.seek(offsets[0])
+            if not f.read(len(b"<spectrum ")).startswith(b"<spectrum"):
+                return None
+    return offsets, declaration.group(0) if declaration else b""
+
+
+def _read_indexed_spectrum(f, offset, declaration, headers_only):
+    """
+    Reads and parses the spectrum element that starts at `offset` of an indexed
+    mzML file with the XML `declaration`. With `headers_only` the file is only
+    read up to the <binaryDataArrayList>, so the peak arrays are neither read nor
+    decoded.
+
+    Raises:
+        ValueError: If the offset does not point to a complete spectrum element.
+    """
+    f.seek(offset)
+    data = b""
+    while True:
+        block = f.read(_BLOCK_SIZE)
+        # Search the end tags in the new block and across the block boundary
+        start = max(0, len(data) - len(_BINARY_DATA_ARRAY_LIST_TAG))
+        data += block
+        end = data.find(_SPECTRUM_END_TAG, start)
+        if headers_only:
+            arrays = data.find(_BINARY_DATA_ARRAY_LIST_TAG, start)
+            if arrays != -1 and (end == -1 or arrays < end):
+                data = data[:arrays] + _SPECTRUM_END_TAG
+                break
+        if end != -1:
+            data = data[: end + len(_SPECTRUM_END_TAG)]
+            break
+        if not block:
+            raise ValueError(
+                f"Index offset {offset} does not point to a complete spectrum."
+            )
+
+    if not data.startswith(b"<spectrum"):
+        raise ValueError(f"Index offset {offset} does not point to a spectrum.")
+    return ET.fromstring(declaration + _FRAGMENT_START + data + _FRAGMENT_END)[0]
+
+
+def _cv_value(elem, accession, path="mzml:cvParam"):
+    param = elem.find(f"{path}[@accession='{accession}']", _NS)
+    return None if param is None else param.get("value")
+
+
+def _read_spectrum(elem, ms_level):
+    rt = _scan_start_time(elem)
+
+    precursor_mz = _cv_value(
+        elem,
+        SELECTED_ION_MZ,
+        "mzml:precursorList/mzml:precursor/mzml:selectedIonList/mzml:selectedIon/"
+        "mzml:cvParam",
+    )
+    precursor_mz = np.nan if precursor_mz is None else float(precursor_mz)
+
+    arrays = {}
+    for array in elem.iterfind("mzml:binaryDataArrayList/mzml:binaryDataArray", _NS):
+        accessions = {
+            param.get("accession") for param in array.iterfind("mzml:cvParam", _NS)
+        }
+        kind = accessions & {MZ_ARRAY, INTENSITY_ARRAY}
+        if kind:
+            text = array.findtext("mzml:binary", "", _NS)
+            arrays[kind.pop()] = _decode_array(text, accessions)
+
+    empty = np.empty(0, dtype=np.float64)
+    return (
+        int(elem.get("index")),
+        ms_level,
+        rt,
+        precursor_mz,
+        arrays.get(MZ_ARRAY, empty),
+        arrays.get(INTENSITY_ARRAY, empty),
+    )
+
+
+def _scan_start_time(elem):
+    """
+    Returns the scan start time of a spectrum in seconds or NaN.
+    """
+    scan_time = elem.find(
+        f"mzml:scanList/mzml:scan/mzml:cvParam[@accession='{SCAN_START_TIME}']", _NS
+    )
+    if scan_time is None:
+        return np.nan
+    rt = float(scan_time.get("value"))
+    if scan_time.get("unitAccession") == MINUTE:
+        rt *= 60
+    return rt
+
+
+def scan_number(native_id, index):
+    """
+    Returns the scan number of a spectrum from its native ID, e.g. 19 for
+    "scan=19" or "controllerType=0 controllerNumber=1 scan=19". The 1-based
+    position of the spectrum is used for IDs without scan number, as done by
+    ProteoWizard, or None if `index` is None.
+    """
+    match = _SCAN_NUMBER_PATTERN.search(native_id or "")
+    if match:
+        return int(match.group(1))
+    return None if index is None else index + 1
+
+
+def iter_mzml_headers(path):
+    """
+    Yields the headers of the spectra of a plain or compressed mzML file in the
+    order of the spectrum list. The peak arrays are not decoded. The cvParams of
+    referenceable param groups, e.g. the polarity, are resolved. The spectra of
+    plain indexed mzML files are seeked via the offsets in the <indexList> and
+    read up to their <binaryDataArrayList> only, see _read_indexed_spectrum.
+    Other files are streamed.
+
+    Parameters:
+        path (str):
+            Path to the mzML file.
+
+    Yields:
+        dict: Header of the spectrum, see _read_header.
+    """
+    index = _read_spectrum_offsets(path)
+    if index is not None:
+        offsets, declaration = index
+        groups = _read_param_groups(path)
+        with open(path, "rb") as f:
+            for offset in offsets:
+                elem = _read_indexed_spectrum(f, offset, declaration, True)
+                yield _read_header(elem, groups)
+        return
+
+    groups = {}
+    list_elem = None
+    with open_compressed(path) as source:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            name = _local_name(elem.tag)
+            if event == "start":
+                if name == "spectrumList":
+                    list_elem = elem
+                continue
+
+            if name == "referenceableParamGroup":
+                groups[elem.get("id")] = _cv_params(elem)
+            elif name == "spectrum":
+                yield _read_header(elem, groups)
+                elem.clear()
+                del list_elem[:]
+            elif name == "spectrumList":
+                return
+
+
+def _read_param_groups(path):
+    """
+    Returns the cvParams of the referenceable param groups of an mzML file by
+    their ids. Only the document header before the <run> is parsed.
+    """
+    groups = {}
+    with open_compressed(path) as source:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            name = _local_name(elem.tag)
+            if event == "start":
+                if name == "run":
+                    break
+            elif name == "referenceableParamGroup":
+                groups[elem.get("id")] = _cv_params(elem)
+    return groups
+
+
+def _cv_params(elem):
+    if elem is None:
+        return {}
+    return {
+        param.get("accession"): param.get("value")
+        for param in elem.iterfind("mzml:cvParam", _NS)
+    }
+
+
+def _float(value):
+    return None if value is None or value == "" else float(value)
+
+
+def _read_header(elem, groups):
+    """
+    Returns the header of a spectrum element as a dict with the keys "index",
+    "id", "ms_level", "rtime" (seconds), "polarity" (1 positive, 0 negative),
+    "peaks_count", "total_ion_current", "base_peak_mz", "base_peak_intensity",
+    "lowest_mz", "highest_mz", "injection_time", "ion_mobility_drift_time",
+    "precursor_id", "precursor_mz", "precursor_intensity", "precursor_charge"
+    and "collision_energy". Missing values are None.
+    """
+    params = {}
+    for ref in elem.iterfind("mzml:referenceableParamGroupRef", _NS):
+        params.update(groups.get(ref.get("ref"), {}))
+    params.update(_cv_params(elem))
+    scan = _cv_params(elem.find("mzml:scanList/mzml:scan", _NS))
+    precursor = elem.find("mzml:precursorList/mzml:precursor", _NS)
+    selected_ion = activation = {}
+    precursor_id = None
+    if precursor is not None:
+        precursor_id = precursor.get("spectrumRef")
+        selected_ion = _cv_params(
+            precursor.find("mzml:selectedIonList/mzml:selectedIon", _NS)
+        )
+        activation = _cv_params(precursor.find("mzml:activation", _NS))
+
+    if POSITIVE_SCAN in params:
+        polarity = 1
+    elif NEGATIVE_SCAN in params:
+        polarity = 0
+    else:
+        polarity = None
+    rt = _scan_start_time(elem)
+    ms_level = params.get(MS_LEVEL)
+    charge = selected_ion.get(CHARGE_STATE)
+
+    return {
+        "index": int(elem.get("index")),
+        "id": elem.get("id"),
+        "ms_level": int(ms_level) if ms_level is not None else None,
+        "rtime": None if np.isnan(rt) else rt,
+        "polarity": polarity,
+        "peaks_count": int(elem.get("defaultArrayLength")),
+        "total_ion_current": _float(params.get(TOTAL_ION_CURRENT)),
+        "base_peak_mz": _float(params.get(BASE_PEAK_MZ)),
+        "base_peak_intensity": _float(params.get(BASE_PEAK_INTENSITY)),
+        "lowest_mz": _float(params.get(LOWEST_OBSERVED_MZ)),
+        "highest_mz": _float(params.get(HIGHEST_OBSERVED_MZ)),
+        "injection_time": _float(scan.get(ION_INJECTION_TIME)),
+        "ion_mobility_drift_time": _float(scan.get(ION_MOBILITY_DRIFT_TIME)),
+        "precursor_id": precursor_id,
+        "precursor_mz": _float(selected_ion.get(SELECTED_ION_MZ)),
+        "precursor_intensity": _float(selected_ion.get(PEAK_INTENSITY)),
+        "precursor_charge": int(charge) if charge else None,
+        "collision_energy": _float(activation.get(COLLISION_ENERGY)),
+    }
+
+
+def _decode_array(text, accessions):
+    dtype = next((_BINARY_DTYPES[a] for a in accessions if a in _BINARY_DTYPES), None)
+    if dtype is None:
+        raise ValueError("Binary data arrays must hold 32- or 64-bit numbers.")
+    if not accessions & {ZLIB_COMPRESSION, NO_COMPRESSION}:
+        raise ValueError(
+            "Binary data arrays must be uncompressed or zlib-compressed. Other "
+            "compressions such as MS-Numpress are not supported."
+        )
+
+    data = base64.b64decode(text)
+    if ZLIB_COMPRESSION in accessions:
+        data = zlib.decompress(data)
+    return np.frombuffer(data, dtype=dtype).astype(np.float64)
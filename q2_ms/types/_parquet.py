@@ -0,0 +1,173 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from q2_ms.types._ms_backend import MS_BACKEND_HEADER
+
+ROW_NAME_COLUMN = "row_name"
+
+# Tables that are stored as Parquet with the column that defines their samples
+PARQUET_TABLES = {
+    "ms_backend_data": "dataOrigin",
+    "xcms_experiment_chrom_peaks": "sample",
+}
+
+READ_CHUNK_SIZE = 1_000_000
+WRITE_CHUNK_SIZE = 100_000
+
+
+def text_to_parquet(text_path, parquet_path, sample_column):
+    """
+    Converts a tab-separated table written by R into a zstd-compressed Parquet
+    file. The R row names are stored in the column "row_name". Every run of
+    consecutive rows of the same sample is written to its own row group so that
+    readers can skip samples without decompressing them. The table is streamed
+    in chunks of READ_CHUNK_SIZE rows, so only the rows of the current sample are
+    held in memory.
+
+    Parameters:
+        text_path (str):
+            Path to the text table.
+        parquet_path (str):
+            Path of the Parquet file that is written.
+        sample_column (str):
+            Column identifying the sample of a row.
+    """
+    with open(text_path, "r") as f:
+        first_line = f.readline()
+    # The MS backend data starts with an additional comment line
+    skiprows = 1 if first_line.rstrip("\r\n") == MS_BACKEND_HEADER else 0
+
+    # The types are inferred from the whole table first, as a column can look
+    # like integers in one chunk and hold floats in a later one
+    dtypes = {}
+    for df in _read_text_chunks(text_path, skiprows):
+        for column, dtype in df.dtypes.items():
+            if df[column].notna().any():
+                dtypes[column] = _promote_dtype(dtypes.get(column), dtype)
+
+    writer = None
+    run, run_sample = [], None
+    for df in _read_text_chunks(text_path, skiprows, dtypes):
+        df.index = df.index.astype(str)
+        df = df.rename_axis(ROW_NAME_COLUMN).reset_index()
+
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            if skiprows:
+                # Keep the comment line so that the text file can be restored
+                schema = schema.with_metadata(
+                    {**schema.metadata, b"q2_ms.comment": MS_BACKEND_HEADER.encode()}
+                )
+            writer = pq.ParquetWriter(parquet_path, schema, compression="zstd")
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+        samples = table.column(sample_column).to_pylist()
+        boundaries = [
+            0,
+            *(i for i in range(1, len(samples)) if samples[i] != samples[i - 1]),
+            len(samples),
+        ]
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            if run and samples[start] != run_sample:
+                writer.write_table(pa.concat_tables(run))
+                run = []
+            run.append(table.slice(start, end - start))
+            run_sample = samples[start]
+
+    if run:
+        writer.write_table(pa.concat_tables(run))
+    writer.close()
+
+
+def _read_text_chunks(text_path, skiprows, dtypes=None):
+    return pd.read_csv(
+        text_path,
+        sep="\t",
+        skiprows=skiprows,
+        escapechar="\\",
+        dtype=dtypes,
+        dtype_backend="numpy_nullable",
+        chunksize=READ_CHUNK_SIZE,
+    )
+
+
+def _promote_dtype(dtype, other):
+    """
+    Returns a dtype that holds the values of both dtypes: integers are promoted to
+    floats and any other mix of types to strings.
+    """
+    if dtype is None or dtype == other:
+        return other
+    if not any(pd.api.types.is_bool_dtype(d) for d in (dtype, other)) and all(
+        pd.api.types.is_numeric_dtype(d) for d in (dtype, other)
+    ):
+        return pd.Float64Dtype()
+    return pd.StringDtype()
+
+
+def parquet_to_text(parquet_path, text_path):
+    """
+    Writes a Parquet table created by text_to_parquet back into the tab-separated
+    layout of R's write.table, see _format_r_column. The values are restored, but
+    the text is not guaranteed to be identical to the original file, e.g. numbers
+    are written with up to 15 significant digits.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    metadata = parquet_file.schema_arrow.metadata or {}
+    columns = [
+        name for name in parquet_file.schema_arrow.names if name != ROW_NAME_COLUMN
+    ]
+
+    with open(text_path, "w") as f:
+        if b"q2_ms.comment" in metadata:
+            f.write(metadata[b"q2_ms.comment"].decode() + "\n")
+        f.write("\t".join(f'"{column}"' for column in columns) + "\n")
+
+        for batch in parquet_file.iter_batches(batch_size=WRITE_CHUNK_SIZE):
+            df = batch.to_pandas()
+            lines = _format_r_column(df[ROW_NAME_COLUMN]).str.cat(
+                [_format_r_column(df[column]) for column in columns], sep="\t"
+            )
+            f.write("\n".join(lines) + "\n")
+
+
+def _format_r_column(series):
+    """
+    Formats a column like R's write.table and q2_ms.xcms.ms_backend._format_value:
+    strings are quoted with embedded quotes escaped, logicals are written as
+    TRUE/FALSE, numbers with up to 15 significant digits, infinite values as
+    Inf/-Inf and missing values as NA.
+    """
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(series):
+        values = series.map({True: "TRUE", False: "FALSE"})
+    elif pd.api.types.is_float_dtype(series):
+        values = series.map(_format_r_float, na_action="ignore")
+    elif pd.api.types.is_numeric_dtype(series):
+        values = series.astype(object).astype(str)
+    else:
+        values = '"' + series.astype(object).astype(str).str.replace('"', '\\"') + '"'
+    return values.astype(object).where(~missing, "NA").astype(str)
+
+
+def _format_r_float(value):
+    if np.isinf(value):
+        return "Inf" if value > 0 else "-Inf"
+    return f"{value:.15g}"
+
+
+def read_parquet_table(parquet_path, columns=None, filters=None):
+    """
+    Reads a Parquet table. Only the requested `columns` are read and row groups
+    that do not match `filters` (see pyarrow.parquet.read_table) are skipped.
+    """
+    return pq.read_table(parquet_path, columns=columns, filters=filters).to_pandas()
@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import re
+import shutil
+
+import pandas as pd
+
+from q2_ms.plugin_setup import plugin
+from q2_ms.types import (
+    CompiledMSPDirFmt,
+    MatchedSpectraDirFmt,
+    MatchedSpectraFormat,
+    MSPDirFmt,
+    MSPFormat,
+    XCMSExperimentDirFmt,
+    XCMSExperimentParquetDirFmt,
+    XCMSExperimentReader,
+)
+from q2_ms.types._compression import COMPRESSION_SUFFIXES, get_compression
+from q2_ms.types._matched_spectra import read_matched_spectra
+from q2_ms.types._msp import write_compiled_msp, write_msp
+from q2_ms.types._parquet import PARQUET_TABLES, parquet_to_text, text_to_parquet
+from q2_ms.utils import link_tree
+
+
+@plugin.register_transformer
+def _1(ff: MSPFormat) -> MSPDirFmt:
+    """
+    Imports a single MSP file and builds its record index.
+    """
+    result = MSPDirFmt()
+    filename = os.path.basename(str(ff))
+    if not re.fullmatch(MSPDirFmt.msp.pathspec, filename):
+        compression = get_compression(str(ff))
+        filename = "library.msp" + COMPRESSION_SUFFIXES.get(compression, "")
+    shutil.copyfile(str(ff), os.path.join(str(result), filename))
+    result.build_index()
+    return result
+
+
+@plugin.register_transformer
+def _2(ff: MSPDirFmt) -> CompiledMSPDirFmt:
+    result = CompiledMSPDirFmt()
+    write_compiled_msp(ff.msp_path, str(result))
+    return result
+
+
+@plugin.register_transformer
+def _3(ff: CompiledMSPDirFmt) -> MSPDirFmt:
+    result = MSPDirFmt()
+    offsets, mz, intensity = ff.read_peaks()
+    write_msp(
+        ff.read_metadata(),
+        mz,
+        intensity,
+        offsets,
+        os.path.join(str(result), "library.msp"),
+    )
+    result.build_index()
+    return result
+
+
+@plugin.register_transformer
+def _4(ff: MatchedSpectraDirFmt) -> pd.DataFrame:
+    return read_matched_spectra(os.path.join(str(ff), "matched_spectra.txt"))
+
+
+@plugin.register_transformer
+def _5(ff: MatchedSpectraFormat) -> pd.DataFrame:
+    return read_matched_spectra(str(ff))
+
+
+@plugin.register_transformer
+def _6(df: pd.DataFrame) -> MatchedSpectraFormat:
+    ff = MatchedSpectraFormat()
+    df.to_csv(str(ff), sep="\t", index=False)
+    return ff
+
+
+@plugin.register_transformer
+def _7(ff: XCMSExperimentDirFmt) -> XCMSExperimentReader:
+    return XCMSExperimentReader(str(ff))
+
+
+@plugin.register_transformer
+def _8(ff: XCMSExperimentDirFmt) -> XCMSExperimentParquetDirFmt:
+    result = XCMSExperimentParquetDirFmt()
+    for filename in os.listdir(str(ff)):
+        name, _ = os.path.splitext(filename)
+        src = os.path.join(str(ff), filename)
+        if os.path.isdir(src):
+            # The spectra files of self-contained experiments are linked
+            link_tree(src, os.path.join(str(result), filename))
+        elif name in PARQUET_TABLES:
+            text_to_parquet(
+                src,
+                os.path.join(str(result), f"{name}.parquet"),
+                PARQUET_TABLES[name],
+            )
+        else:
+            shutil.copyfile(src, os.path.join(str(result), filename))
+    return result
+
+
+@plugin.register_transformer
+def _9(ff: XCMSExperimentParquetDirFmt) -> XCMSExperimentDirFmt:
+    result = XCMSExperimentDirFmt()
+    for filename in os.listdir(str(ff)):
+        name, extension = os.path.splitext(filename)
+        src = os.path.join(str(ff), filename)
+        if os.path.isdir(src):
+            link_tree(src, os.path.join(str(result), filename))
+        elif extension == ".parquet":
+            parquet_to_text(src, os.path.join(str(result), f"{name}.txt"))
+        else:
+            shutil.copyfile(src, os.path.join(str(result), filename))
+    return result
+
+
+@plugin.register_transformer
+def _10(ff: XCMSExperimentParquetDirFmt) -> XCMSExperimentReader:
+    return XCMSExperimentReader(str(ff))
+
+
+@plugin.register_transformer
+def _11(ff: MSPDirFmt) -> MSPFormat:
+    """
+    Views the MSP file of a library, as for single file directory formats.
+    """
+    return MSPFormat(ff.msp_path, mode="r")
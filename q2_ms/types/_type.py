@@ -10,5 +10,7 @@ from qiime2.core.type import SemanticType
 
 mzML = SemanticType("mzML", variant_of=SampleData.field["type"])
 XCMSExperiment = SemanticType("XCMSExperiment")
+XCMSExperimentParquet = SemanticType("XCMSExperimentParquet")
 MSP = SemanticType("MSP")
+CompiledMSP = SemanticType("CompiledMSP")
 MatchedSpectra = SemanticType("MatchedSpectra_valid")
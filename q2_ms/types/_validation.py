@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import contextvars
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from qiime2.core.exceptions import ValidationError
+
+VALIDATION_JOBS_ENV = "Q2_MS_VALIDATION_JOBS"
+VALIDATION_MAX_ERRORS_ENV = "Q2_MS_VALIDATION_MAX_ERRORS"
+
+# Member files whose validation is deferred while a directory format is validated
+_deferred_files = contextvars.ContextVar("deferred_files", default=None)
+
+
+def get_validation_jobs():
+    """
+    Returns the number of worker processes used to validate the member files of a
+    directory format. It is read from the environment variable
+    Q2_MS_VALIDATION_JOBS and defaults to 1. A value of 0 uses all available CPUs.
+    """
+    value = os.environ.get(VALIDATION_JOBS_ENV, "1")
+    try:
+        n_jobs = int(value)
+    except ValueError:
+        raise ValueError(
+            f"{VALIDATION_JOBS_ENV} must be an integer. Found instead: {value}"
+        )
+    if n_jobs < 0:
+        raise ValueError(f"{VALIDATION_JOBS_ENV} must not be negative.")
+    return n_jobs or os.cpu_count() or 1
+
+
+def get_validation_max_errors():
+    """
+    Returns the maximum number of errors that are reported when a file is
+    validated. It is read from the environment variable
+    Q2_MS_VALIDATION_MAX_ERRORS and defaults to 100. A value of 0 reports all
+    errors.
+    """
+    value = os.environ.get(VALIDATION_MAX_ERRORS_ENV, "100")
+    try:
+        max_errors = int(value)
+    except ValueError:
+        raise ValueError(
+            f"{VALIDATION_MAX_ERRORS_ENV} must be an integer. Found instead: {value}"
+        )
+    if max_errors < 0:
+        raise ValueError(f"{VALIDATION_MAX_ERRORS_ENV} must not be negative.")
+    return max_errors or None
+
+
+def _validate_file(format_cls, path, level):
+    try:
+        format_cls(path, mode="r").validate(level)
+    except ValidationError as e:
+        return str(e)
+
+
+def validate_files(files, level, n_jobs=1):
+    """
+    Validates files with their file formats, optionally in a process pool.
+
+    All files are validated, even if some of them are invalid, so that the
+    errors of all files can be reported at once.
+
+    Parameters:
+        files (list):
+            List of (format class, path) tuples.
+        level (str):
+            Validation level, either "min" or "max".
+        n_jobs (int):
+            Number of worker processes.
+
+    Returns:
+        list: Error messages of all invalid files in the order of `files`.
+    """
+    format_classes = [format_cls for format_cls, _ in files]
+    paths = [path for _, path in files]
+    levels = [level] * len(files)
+
+    if n_jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(files))) as executor:
+            results = list(executor.map(_validate_file, format_classes, paths, levels))
+    else:
+        results = list(map(_validate_file, format_classes, paths, levels))
+
+    return [error for error in results if error is not None]
+
+
+class DeferredValidationMixin:
+    """
+    Mixin for file formats whose validation is deferred while a directory format
+    with the ParallelValidationMixin is validated. The file is recorded instead
+    and validated afterwards together with the other member files.
+    """
+
+    def validate(self, level="max"):
+        files = _deferred_files.get()
+        if files is None:
+            return super().validate(level)
+        files.append((type(self), str(self)))
+
+
+class ParallelValidationMixin:
+    """
+    Mixin for directory formats that validates all member files in a process pool
+    and collects the errors of all invalid files into a single ValidationError.
+    The structure of the directory is validated by DirectoryFormat.validate, which
+    defers the validation of member files with the DeferredValidationMixin. The
+    number of workers is set with the environment variable Q2_MS_VALIDATION_JOBS.
+    """
+
+    def validate(self, level="max"):
+        files = []
+        token = _deferred_files.set(files)
+        try:
+            super().validate(level)
+        finally:
+            _deferred_files.reset(token)
+
+        errors = validate_files(files, level, get_validation_jobs())
+        if errors:
+            raise ValidationError(
+                f"{len(errors)} of {len(files)} files in {self.path} are invalid:"
+                "\n\n" + "\n\n".join(errors)
+            )
@@ -7,28 +7,22 @@
 # ----------------------------------------------------------------------------
 import os
 
-import pandas as pd
 from qiime2.core.exceptions import ValidationError
 from qiime2.core.type import Properties
 
 from q2_ms.plugin_setup import plugin
 from q2_ms.types import XCMSExperiment, XCMSExperimentDirFmt
+from q2_ms.types._ms_backend import has_ms_level
 
 
 @plugin.register_validator(XCMSExperiment % Properties("MS2"))
 def validate_xcms_experiment_ms2(data: XCMSExperimentDirFmt, level):
     """
     Validates that the XCMSExperiment contains MS2-level spectra. Checks for any "2"
-    values in the "msLevel" column in the file "ms_backend_data.txt".
+    values in the "msLevel" column in the file "ms_backend_data.txt". The file is
+    read until the first MS2 spectrum is found.
     """
-    df = pd.read_csv(
-        os.path.join(data.path, "ms_backend_data.txt"),
-        sep="\t",
-        usecols=["msLevel"],
-        skiprows=1,
-        index_col=0,
-    )
-    if not (df["msLevel"] == 2).any():
+    if not has_ms_level(os.path.join(data.path, "ms_backend_data.txt"), 2):
         raise ValidationError(
             "The property 'MS2' requires MS2-level spectra to be present in the "
             "XCMSExperiment."
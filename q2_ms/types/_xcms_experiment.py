@@ -0,0 +1,249 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from q2_ms.types._compression import strip_compression_suffix
+from q2_ms.types._mzml import iter_mzml_spectra
+from q2_ms.types._parquet import ROW_NAME_COLUMN, read_parquet_table
+
+# Directory of the spectra files of a self-contained XCMSExperiment
+SPECTRA_DIRNAME = "spectra"
+
+CHROM_PEAK_FLOAT_COLUMNS = [
+    "mz",
+    "mzmin",
+    "mzmax",
+    "rt",
+    "rtmin",
+    "rtmax",
+    "into",
+    "intb",
+    "maxo",
+    "sn",
+]
+FEATURE_FLOAT_COLUMNS = ["mzmed", "mzmin", "mzmax", "rtmed", "rtmin", "rtmax"]
+
+# Columns of the sample data that are added by MsExperiment and XCMS
+_SAMPLE_DATA_COLUMNS = ["spectraOrigin", "sample_index"]
+
+
+class XCMSExperimentReader:
+    """
+    Lazy reader for the files of an XCMSExperimentDirFmt or an
+    XCMSExperimentParquetDirFmt. Every table is parsed on first access and cached.
+    Tables of optional files that are not present are None.
+
+    Chromatographic peaks and features are indexed by their 0-based position and
+    their R identifiers (e.g. "CP0001", "FT001") are kept in the columns
+    "chrom_peak_id" and "feature_id". The feature-peak index refers to these
+    0-based positions.
+
+    Parameters:
+        path (str):
+            Path to the XCMSExperimentDirFmt directory.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def _file(self, filename):
+        path = os.path.join(self.path, filename)
+        return path if os.path.exists(path) else None
+
+    @functools.cached_property
+    def backend_data(self):
+        """
+        Spectra metadata from ms_backend_data.txt with one row per spectrum.
+        """
+        parquet_path = self._file("ms_backend_data.parquet")
+        if parquet_path is not None:
+            df = read_parquet_table(parquet_path).drop(columns=ROW_NAME_COLUMN)
+            return df.astype({"msLevel": "int32", "dataOrigin": "category"})
+
+        df = pd.read_csv(
+            os.path.join(self.path, "ms_backend_data.txt"),
+            sep="\t",
+            skiprows=1,
+            dtype={"msLevel": "int32", "rtime": "float64", "dataOrigin": "category"},
+        )
+        return df.reset_index(drop=True)
+
+    @property
+    def spectra_path(self):
+        """
+        Directory with the spectra files of a self-contained XCMSExperiment or None.
+        The spectra paths in the backend and sample data of such an experiment are
+        relative to the experiment directory.
+        """
+        return self._file(SPECTRA_DIRNAME)
+
+    def iter_spectra(self, ms_levels=None):
+        """
+        Reads the peaks of the spectra from the spectra files stored in the
+        experiment. Only the files of the experiment are read and no spectra are
+        kept in memory.
+
+        Parameters:
+            ms_levels (set):
+                MS levels of the spectra to read. All spectra are read if None.
+
+        Yields:
+            tuple: Position of the spectrum in `backend_data`, precursor m/z and
+                the m/z and intensity arrays.
+        """
+        if self.spectra_path is None:
+            raise ValueError(
+                "The XCMSExperiment does not contain its spectra files. Only "
+                "experiments created with read-ms-experiment store them."
+            )
+
+        df = self.backend_data
+        rows = {
+            (storage, int(scan_index)): row
+            for row, (storage, scan_index) in enumerate(
+                zip(df["dataStorage"], df["scanIndex"])
+            )
+        }
+        for storage in pd.unique(df["dataStorage"]):
+            for index, _, _, precursor_mz, mz, intensity in iter_mzml_spectra(
+                os.path.join(self.path, storage), ms_levels
+            ):
+                # The scan index is the 1-based position of a spectrum in its file
+                row = rows.get((storage, index + 1))
+                if row is not None:
+                    yield row, precursor_mz, mz, intensity
+
+    @functools.cached_property
+    def sample_data(self):
+        """
+        Sample data from ms_experiment_sample_data.txt with one row per sample.
+        """
+        df = pd.read_csv(
+            os.path.join(self.path, "ms_experiment_sample_data.txt"),
+            sep="\t",
+            dtype=str,
+        )
+        return df.reset_index(drop=True)
+
+    @functools.cached_property
+    def sample_ids(self):
+        """
+        Sample IDs in the order of `sample_data`. These are the IDs of the sample
+        metadata passed to read_ms_experiment (its first column) or otherwise the
+        names of the spectra files without extensions.
+        """
+        df = self.sample_data
+        columns = [c for c in df.columns if c not in _SAMPLE_DATA_COLUMNS]
+        if columns:
+            return df[columns[0]].tolist()
+        return [
+            os.path.splitext(strip_compression_suffix(os.path.basename(path)))[0]
+            for path in df["spectraOrigin"]
+        ]
+
+    @functools.cached_property
+    def chrom_peaks(self):
+        """
+        Chromatographic peaks from xcms_experiment_chrom_peaks.txt joined with the
+        columns of xcms_experiment_chrom_peak_data.txt. The "sample" column holds
+        the 1-based sample index used by XCMS.
+        """
+        dtype = {
+            **{column: "float64" for column in CHROM_PEAK_FLOAT_COLUMNS},
+            "sample": "int32",
+        }
+        parquet_path = self._file("xcms_experiment_chrom_peaks.parquet")
+        path = self._file("xcms_experiment_chrom_peaks.txt")
+        if parquet_path is not None:
+            df = read_parquet_table(parquet_path).set_index(ROW_NAME_COLUMN)
+            df = df.astype(dtype)
+        elif path is not None:
+            df = pd.read_csv(path, sep="\t", dtype=dtype)
+        else:
+            return None
+        df = _ids_to_column(df, "chrom_peak_id")
+
+        data_path = self._file("xcms_experiment_chrom_peak_data.txt")
+        if data_path is not None:
+            data = pd.read_csv(
+                data_path,
+                sep="\t",
+                dtype={"ms_level": "int32", "is_filled": "bool"},
+            )
+            df = df.join(data.reset_index(drop=True))
+        return df
+
+    @functools.cached_property
+    def feature_definitions(self):
+        """
+        Feature definitions from xcms_experiment_feature_definitions.txt. The
+        "peakidx" column is dropped as its content is stored in the feature-peak
+        index.
+        """
+        path = self._file("xcms_experiment_feature_definitions.txt")
+        if path is None:
+            return None
+
+        df = pd.read_csv(
+            path,
+            sep="\t",
+            dtype={
+                **{column: "float64" for column in FEATURE_FLOAT_COLUMNS},
+                "npeaks": "int32",
+                "ms_level": "int32",
+            },
+        )
+        df = df.drop(columns="peakidx", errors="ignore")
+        return _ids_to_column(df, "feature_id")
+
+    @functools.cached_property
+    def feature_peak_index(self):
+        """
+        Assignment of chromatographic peaks to features from
+        xcms_experiment_feature_peak_index.txt as 0-based int64 positions in
+        `feature_definitions` and `chrom_peaks`.
+        """
+        path = self._file("xcms_experiment_feature_peak_index.txt")
+        if path is None:
+            return None
+
+        df = pd.read_csv(
+            path,
+            sep="\t",
+            dtype={"feature_index": "int64", "peak_index": "int64"},
+        )
+        return pd.DataFrame(
+            {
+                "feature_index": df["feature_index"].to_numpy() - 1,
+                "peak_index": df["peak_index"].to_numpy() - 1,
+            }
+        )
+
+    def feature_peaks(self, feature):
+        """
+        Returns the 0-based positions of the chromatographic peaks of a feature.
+        """
+        index = self.feature_peak_index
+        return index["peak_index"].to_numpy()[
+            index["feature_index"].to_numpy() == feature
+        ]
+
+
+def _ids_to_column(df, name):
+    """
+    Moves the row names written by R into a column and replaces them with 0-based
+    integer positions.
+    """
+    ids = df.index.astype(str)
+    df = df.reset_index(drop=True)
+    df.insert(0, name, np.asarray(ids))
+    return df
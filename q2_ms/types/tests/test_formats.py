@@ -5,10 +5,20 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import gzip
+import json
+import os
+import shutil
+from unittest.mock import patch
+
+import numpy as np
+import pyarrow as pa
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin.testing import TestPluginBase
 
+from q2_ms.types._cache import ValidationCache
 from q2_ms.types._format import (
+    CompiledMSPDirFmt,
     MatchedSpectraDirFmt,
     MatchedSpectraFormat,
     MSBackendDataFormat,
@@ -17,6 +27,9 @@ from q2_ms.types._format import (
     MSExperimentSampleDataLinksSpectra,
     MSPDirFmt,
     MSPFormat,
+    MSPIndexFormat,
+    ParquetFormat,
+    ResourceUsageFormat,
     SpectraSlotsFormat,
     XCMSExperimentChromPeakDataFormat,
     XCMSExperimentChromPeaksFormat,
@@ -27,6 +40,26 @@ from q2_ms.types._format import (
     mzMLDirFmt,
     mzMLFormat,
 )
+from q2_ms.types._mzml import (
+    MZML_NAMESPACE,
+    _read_indexed_spectrum,
+    _read_spectrum_offsets,
+    iter_mzml_headers,
+    iter_mzml_spectra,
+    scan_number,
+)
+
+
+def _compress(path, output_path, compression):
+    with open(path, "rb") as f:
+        data = f.read()
+    if compression == "gzip":
+        with gzip.open(output_path, "wb") as f:
+            f.write(data)
+    else:
+        with pa.output_stream(output_path, compression=compression) as f:
+            f.write(data)
+    return output_path
 
 
 class TestmzMLFormats(TestPluginBase):
@@ -36,6 +69,57 @@ class TestmzMLFormats(TestPluginBase):
         format = mzMLDirFmt(self.get_data_path("mzML_valid"), mode="r")
         format.validate()
 
+    def test_mzml_dir_fmt_validate_parallel_positive(self):
+        for sample_id in ("a", "b", "c"):
+            shutil.copy(
+                self.get_data_path("mzML_valid/tiny.mzML"),
+                os.path.join(self.temp_dir.name, f"{sample_id}.mzML"),
+            )
+        format = mzMLDirFmt(self.temp_dir.name, mode="r")
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_JOBS": "2"}):
+            format.validate()
+
+    def test_mzml_dir_fmt_validate_defers_members(self):
+        format = mzMLDirFmt(self.get_data_path("mzML_valid"), mode="r")
+        with patch(
+            "q2_ms.types._validation.validate_files", return_value=[]
+        ) as mock_validate_files:
+            format.validate("min")
+
+        files, level, _ = mock_validate_files.call_args.args
+        self.assertEqual(
+            [(cls, os.path.basename(path)) for cls, path in files],
+            [(mzMLFormat, "tiny.mzML")],
+        )
+        self.assertEqual(level, "min")
+
+    def test_mzml_dir_fmt_validate_collects_all_errors(self):
+        shutil.copy(
+            self.get_data_path("mzML_valid/tiny.mzML"),
+            os.path.join(self.temp_dir.name, "a.mzML"),
+        )
+        for sample_id in ("b", "c"):
+            shutil.copy(
+                self.get_data_path("mzML_invalid/invalid.mzML"),
+                os.path.join(self.temp_dir.name, f"{sample_id}.mzML"),
+            )
+        format = mzMLDirFmt(self.temp_dir.name, mode="r")
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_JOBS": "2"}):
+            with self.assertRaisesRegex(
+                ValidationError, r"(?s)2 of 3 files.*b\.mzML.*c\.mzML"
+            ):
+                format.validate()
+
+    def test_mzml_dir_fmt_validate_negative_unrecognized(self):
+        shutil.copy(self.get_data_path("mzML_valid/tiny.mzML"), self.temp_dir.name)
+        shutil.copy(
+            self.get_data_path("mzML_valid/tiny.mzML"),
+            os.path.join(self.temp_dir.name, "a.txt"),
+        )
+        format = mzMLDirFmt(self.temp_dir.name, mode="r")
+        with self.assertRaisesRegex(ValidationError, "Unrecognized file"):
+            format.validate()
+
     def test_mzml_format_validate_positive(self):
         filepath = self.get_data_path("mzML_valid/tiny.mzML")
         format = mzMLFormat(filepath, mode="r")
@@ -47,6 +131,172 @@ class TestmzMLFormats(TestPluginBase):
         with self.assertRaises(ValidationError):
             format.validate()
 
+    def test_mzml_format_validate_positive_min(self):
+        filepath = self.get_data_path("mzML_valid/tiny.mzML")
+        format = mzMLFormat(filepath, mode="r")
+        format.validate("min")
+
+    def test_mzml_format_validate_negative_min(self):
+        filepath = self.get_data_path("mzML_invalid/invalid.mzML")
+        format = mzMLFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "not valid XML"):
+            format.validate("min")
+
+    def test_mzml_format_validate_negative_offset(self):
+        filepath = self.get_data_path("mzML_invalid/invalid_offset.mzML")
+        format = mzMLFormat(filepath, mode="r")
+        with self.assertRaisesRegex(
+            ValidationError, "Index offset 10425 for 'scan=20' does not point"
+        ):
+            format.validate()
+
+    def test_mzml_format_validate_min_skips_offsets(self):
+        filepath = self.get_data_path("mzML_invalid/invalid_offset.mzML")
+        format = mzMLFormat(filepath, mode="r")
+        format.validate("min")
+
+    def test_mzml_format_validate_negative_spectrum_count(self):
+        filepath = self.get_data_path("mzML_invalid/invalid_spectrum_count.mzML")
+        format = mzMLFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "declares 5 spectra but 4"):
+            format.validate()
+
+    def test_mzml_format_validate_negative_misplaced_spectrum(self):
+        filepath = os.path.join(self.temp_dir.name, "misplaced.mzML")
+        with open(filepath, "w") as f:
+            f.write(
+                '<mzML xmlns="http://psi.hupo.org/ms/mzml"><run>'
+                '<spectrum index="0" id="scan=1" defaultArrayLength="0"/>'
+                "</run></mzML>"
+            )
+        format = mzMLFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "<spectrum> element outside"):
+            format.validate()
+
+    def test_mzml_dir_fmt_validate_compressed_positive(self):
+        for filename, compression in [("a.mzML.gz", "gzip"), ("b.mzML.zst", "zstd")]:
+            _compress(
+                self.get_data_path("mzML_valid/tiny.mzML"),
+                os.path.join(self.temp_dir.name, filename),
+                compression,
+            )
+        format = mzMLDirFmt(self.temp_dir.name, mode="r")
+        format.validate()
+
+    def test_iter_mzml_spectra(self):
+        spectra = list(
+            iter_mzml_spectra(self.get_data_path("mzML_valid/tiny.mzML"), {2})
+        )
+        self.assertEqual(len(spectra), 1)
+        index, ms_level, rt, precursor_mz, mz, intensity = spectra[0]
+        self.assertEqual((index, ms_level, precursor_mz), (1, 2, 445.34))
+        self.assertAlmostEqual(rt, 359.43)
+        self.assertEqual(mz.tolist(), list(range(0, 20, 2)))
+        self.assertEqual(intensity.tolist(), list(range(20, 0, -2)))
+
+    def test_iter_mzml_headers(self):
+        headers = list(iter_mzml_headers(self.get_data_path("mzML_valid/tiny.mzML")))
+        self.assertEqual(len(headers), 4)
+        header = headers[1]
+        self.assertEqual(
+            (header["index"], header["id"], header["ms_level"], header["polarity"]),
+            (1, "scan=20", 2, 1),
+        )
+        self.assertAlmostEqual(header["rtime"], 359.43)
+        self.assertEqual(header["peaks_count"], 10)
+        self.assertEqual(header["base_peak_mz"], 456.347)
+        self.assertEqual(header["precursor_id"], "scan=19")
+        self.assertEqual(
+            (
+                header["precursor_mz"],
+                header["precursor_charge"],
+                header["collision_energy"],
+            ),
+            (445.34, 2, 35.0),
+        )
+        self.assertIsNone(headers[0]["precursor_mz"])
+
+    def test_iter_mzml_headers_indexed(self):
+        path = self.get_data_path("mzML_valid/tiny.mzML")
+        compressed = _compress(
+            path, os.path.join(self.temp_dir.name, "tiny.mzML.gz"), "gzip"
+        )
+        # The index of the plain file is used and the compressed file is streamed
+        self.assertIsNotNone(_read_spectrum_offsets(path))
+        self.assertIsNone(_read_spectrum_offsets(compressed))
+
+        indexed = list(iter_mzml_headers(path))
+        streamed = list(iter_mzml_headers(compressed))
+
+        self.assertEqual(indexed, streamed)
+
+    def test_iter_mzml_spectra_indexed(self):
+        path = self.get_data_path("mzML_valid/tiny.mzML")
+        compressed = _compress(
+            path, os.path.join(self.temp_dir.name, "tiny.mzML.gz"), "gzip"
+        )
+
+        indexed = list(iter_mzml_spectra(path, {2}))
+        streamed = list(iter_mzml_spectra(compressed, {2}))
+
+        self.assertEqual(len(indexed), 1)
+        self.assertEqual(indexed[0][:4], streamed[0][:4])
+        self.assertEqual(indexed[0][4].tolist(), streamed[0][4].tolist())
+        self.assertEqual(indexed[0][5].tolist(), streamed[0][5].tolist())
+
+    def test_read_spectrum_offsets(self):
+        offsets, declaration = _read_spectrum_offsets(
+            self.get_data_path("mzML_valid/tiny.mzML")
+        )
+        self.assertEqual(offsets, [6883, 10424, 15411, 16940])
+        self.assertEqual(declaration, b'<?xml version="1.0" encoding="ISO-8859-1"?>')
+
+    def test_read_spectrum_offsets_not_indexed(self):
+        path = os.path.join(self.temp_dir.name, "not_indexed.mzML")
+        with open(path, "w") as f:
+            f.write(f'<mzML xmlns="{MZML_NAMESPACE}"><run/></mzML>')
+        self.assertIsNone(_read_spectrum_offsets(path))
+
+    def test_read_indexed_spectrum_headers_only(self):
+        path = self.get_data_path("mzML_valid/tiny.mzML")
+        offsets, declaration = _read_spectrum_offsets(path)
+        with open(path, "rb") as f:
+            header = _read_indexed_spectrum(f, offsets[1], declaration, True)
+            spectrum = _read_indexed_spectrum(f, offsets[1], declaration, False)
+
+        arrays = f"{{{MZML_NAMESPACE}}}binaryDataArrayList"
+        self.assertEqual(header.get("id"), "scan=20")
+        self.assertIsNone(header.find(arrays))
+        self.assertIsNotNone(spectrum.find(arrays))
+
+    def test_iter_mzml_headers_invalid_offset(self):
+        with self.assertRaisesRegex(ValueError, "offset 10425 does not point"):
+            list(
+                iter_mzml_headers(
+                    self.get_data_path("mzML_invalid/invalid_offset.mzML")
+                )
+            )
+
+    def test_scan_number(self):
+        self.assertEqual(scan_number("scan=20", 1), 20)
+        self.assertEqual(
+            scan_number("controllerType=0 controllerNumber=1 scan=5", 0), 5
+        )
+        self.assertEqual(scan_number("sample=1 period=1 cycle=22", 3), 4)
+        self.assertIsNone(scan_number("sample=1 period=1 cycle=22", None))
+
+    def test_mzml_format_validate_compressed_negative_offset(self):
+        filepath = _compress(
+            self.get_data_path("mzML_invalid/invalid_offset.mzML"),
+            os.path.join(self.temp_dir.name, "invalid_offset.mzML.zst"),
+            "zstd",
+        )
+        format = mzMLFormat(filepath, mode="r")
+        with self.assertRaisesRegex(
+            ValidationError, "Index offset 10425 for 'scan=20' does not point"
+        ):
+            format.validate()
+
 
 class TestXCMSExperimentFormats(TestPluginBase):
     package = "q2_ms.types.tests"
@@ -126,6 +376,17 @@ class TestXCMSExperimentFormats(TestPluginBase):
         with self.assertRaisesRegex(ValidationError, "File is not valid JSON"):
             format.validate()
 
+    def test_resource_usage_format_validate(self):
+        filepath = os.path.join(self.temp_dir.name, "resource_usage.json")
+        with open(filepath, "w") as f:
+            json.dump([{"command": ["read_ms_experiment.R"], "wall_time": 1.5}], f)
+        ResourceUsageFormat(filepath, mode="r").validate()
+
+        with open(filepath, "w") as f:
+            json.dump([{"command": ["read_ms_experiment.R"]}], f)
+        with self.assertRaisesRegex(ValidationError, "command and wall_time"):
+            ResourceUsageFormat(filepath, mode="r").validate()
+
     def test_spectra_processing_queue_validate_negative_list(self):
         filepath = self.get_data_path(
             "XCMSExperiment_json_invalid/spectra_processing_queue_list_check.json"
@@ -226,6 +487,23 @@ class TestXCMSExperimentFormats(TestPluginBase):
         format = XCMSExperimentDirFmt(filepath, mode="r")
         format.validate()
 
+    def test_xcms_experiment_dir_fmt_stored_spectra(self):
+        filepath = os.path.join(self.temp_dir.name, "XCMSExperiment")
+        shutil.copytree(self.get_data_path("XCMSExperiment"), filepath)
+        os.mkdir(os.path.join(filepath, "spectra"))
+        for filename in os.listdir(self.get_data_path("mzML_valid")):
+            shutil.copyfile(
+                self.get_data_path(f"mzML_valid/{filename}"),
+                os.path.join(filepath, "spectra", filename),
+            )
+        XCMSExperimentDirFmt(filepath, mode="r").validate()
+
+    def test_parquet_format_negative(self):
+        filepath = self.get_data_path("XCMSExperiment/ms_backend_data.txt")
+        format = ParquetFormat(filepath, mode="r")
+        with self.assertRaisesRegex(ValidationError, "not a Parquet file"):
+            format.validate()
+
 
 class TestMSPFormat(TestPluginBase):
     package = "q2_ms.types.tests"
@@ -240,10 +518,216 @@ class TestMSPFormat(TestPluginBase):
         with self.assertRaisesRegex(ValidationError, pattern):
             format.validate()
 
+    def _concat_msp(self, *names):
+        path = os.path.join(self.temp_dir.name, "library.msp")
+        with open(path, "w") as out:
+            for name in names:
+                with open(self.get_data_path(name)) as f:
+                    out.write(f.read().rstrip("\n") + "\n\n")
+        return path
+
+    def test_msp_validate_positive_min(self):
+        path = self._concat_msp(*["MSP_valid/valid.msp"] * 4, "MSP_invalid/invalid.msp")
+        format = MSPFormat(path, mode="r")
+        format.validate("min")
+        with self.assertRaises(ValidationError):
+            format.validate("max")
+
+    @patch("q2_ms.types._msp.MIN_CHUNK_SIZE", 1000)
+    def test_msp_validate_negative_parallel(self):
+        path = self._concat_msp(*["MSP_invalid/invalid.msp"] * 3)
+        format = MSPFormat(path, mode="r")
+        with self.assertRaises(ValidationError) as sequential:
+            format.validate()
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_JOBS": "2"}):
+            with self.assertRaises(ValidationError) as parallel:
+                format.validate()
+        self.assertEqual(str(sequential.exception), str(parallel.exception))
+        self.assertIn("Line 149: Invalid metadata", str(parallel.exception))
+
+    def test_msp_validate_negative_max_errors(self):
+        format = MSPFormat(self.get_data_path("MSP_invalid/invalid.msp"), mode="r")
+        pattern = r"Line 6: Inv.+\n.+\nValidation stopped after 1 errors\.$"
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_MAX_ERRORS": "1"}):
+            with self.assertRaisesRegex(ValidationError, pattern):
+                format.validate()
+
+    def test_msp_validate_negative_max_errors_all_found(self):
+        # The file has exactly 3 errors, so validation did not stop early
+        format = MSPFormat(self.get_data_path("MSP_invalid/invalid.msp"), mode="r")
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_MAX_ERRORS": "3"}):
+            with self.assertRaisesRegex(ValidationError, "Line 92") as cm:
+                format.validate()
+        self.assertNotIn("Validation stopped", str(cm.exception))
+
     def test_msp_directory_format_validate_positive(self):
         format = MSPDirFmt(self.get_data_path("MSP_valid"), mode="r")
         format.validate()
 
+    def _indexed_msp_dir(self):
+        shutil.copy(self.get_data_path("MSP_valid/valid.msp"), self.temp_dir.name)
+        format = MSPDirFmt(self.temp_dir.name, mode="r")
+        format.build_index()
+        return format
+
+    def test_msp_directory_format_with_index_validate_positive(self):
+        format = self._indexed_msp_dir()
+        format.validate()
+        MSPIndexFormat(format.index_path, mode="r").validate()
+
+    def test_msp_directory_format_with_index_validate_negative(self):
+        format = self._indexed_msp_dir()
+        with open(format.msp_path, "r+") as f:
+            f.truncate(1591)
+        with self.assertRaisesRegex(ValidationError, "index does not match"):
+            format.validate()
+
+    def test_msp_directory_format_with_index_validate_negative_offset(self):
+        format = self._indexed_msp_dir()
+        index = format.read_index()
+        # Shift the offset of the second record into the first one
+        index.loc[1, "offset"] -= 10
+        index.to_csv(format.index_path, sep="\t", index=False)
+        with self.assertRaisesRegex(
+            ValidationError, r"byte \d+ does not start with the NAME line"
+        ):
+            format.validate()
+
+    def test_msp_directory_format_validate_negative_two_files(self):
+        shutil.copy(self.get_data_path("MSP_valid/valid.msp"), self.temp_dir.name)
+        shutil.copy(
+            self.get_data_path("MSP_valid/valid.msp"),
+            os.path.join(self.temp_dir.name, "other.msp"),
+        )
+        format = MSPDirFmt(self.temp_dir.name, mode="r")
+        with self.assertRaisesRegex(ValidationError, "exactly one MSP file"):
+            format.validate()
+
+    def test_msp_index_format_validate_negative(self):
+        format = self._indexed_msp_dir()
+        with open(format.index_path, "a") as f:
+            f.write("x\t10\tname\t100.0\tPOSITIVE\n")
+        with self.assertRaisesRegex(ValidationError, "Line 5 has a non-integer"):
+            MSPIndexFormat(format.index_path, mode="r").validate()
+
+    def test_msp_directory_format_read_index(self):
+        index = self._indexed_msp_dir().read_index()
+        self.assertEqual(
+            index["name"].tolist(),
+            ["Scleroderolide", "Fumonisin B4", "Chaetoglobosin A"],
+        )
+        self.assertEqual(index["precursor_mz"].tolist(), [329.1014, 690.4054, 529.2692])
+        self.assertEqual(index["ion_mode"].unique().tolist(), ["POSITIVE"])
+
+    def test_msp_directory_format_read_index_without_index(self):
+        shutil.copy(self.get_data_path("MSP_valid/valid.msp"), self.temp_dir.name)
+        format = MSPDirFmt(self.temp_dir.name, mode="r")
+        os.chmod(self.temp_dir.name, 0o555)
+        try:
+            index = format.read_index()
+        finally:
+            os.chmod(self.temp_dir.name, 0o755)
+
+        self.assertEqual(len(index), 3)
+        self.assertFalse(os.path.exists(format.index_path))
+
+    def test_msp_directory_format_read_record(self):
+        format = self._indexed_msp_dir()
+        row = format.read_index().iloc[1]
+        record = format.read_record(row["offset"], row["length"])
+        self.assertTrue(record.startswith("Name: Fumonisin B4\n"))
+        self.assertTrue(record.endswith("690.4059 999"))
+
+    def test_msp_validate_compressed_negative(self):
+        path = _compress(
+            self.get_data_path("MSP_invalid/invalid.msp"),
+            os.path.join(self.temp_dir.name, "invalid.msp.gz"),
+            "gzip",
+        )
+        format = MSPFormat(path, mode="r")
+        pattern = r"Line 6: Inv.+\nPrecursor_type \[M\+H\]\+\nLine 21: Peak.+\n311.0914"
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_JOBS": "2"}):
+            with self.assertRaisesRegex(ValidationError, pattern):
+                format.validate()
+
+    def test_msp_directory_format_compressed_read_record(self):
+        _compress(
+            self.get_data_path("MSP_valid/valid.msp"),
+            os.path.join(self.temp_dir.name, "valid.msp.zst"),
+            "zstd",
+        )
+        format = MSPDirFmt(self.temp_dir.name, mode="r")
+        format.build_index()
+        format.validate()
+
+        row = format.read_index().iloc[1]
+        record = format.read_record(row["offset"], row["length"])
+        self.assertTrue(record.startswith("Name: Fumonisin B4\n"))
+        self.assertTrue(record.endswith("690.4059 999"))
+
+
+class TestCompiledMSPFormats(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def _compiled_msp_dir(self, offsets, n_peaks=3):
+        with open(os.path.join(self.temp_dir.name, "metadata.tsv"), "w") as f:
+            f.write("Name\tPrecursorMZ\na\t100.0\nb\t200.0\n")
+        np.save(
+            os.path.join(self.temp_dir.name, "mz.npy"),
+            np.arange(n_peaks, dtype=np.float64),
+        )
+        np.save(
+            os.path.join(self.temp_dir.name, "intensity.npy"),
+            np.ones(3, dtype=np.float32),
+        )
+        np.save(
+            os.path.join(self.temp_dir.name, "offsets.npy"),
+            np.array(offsets, dtype=np.int64),
+        )
+        return CompiledMSPDirFmt(self.temp_dir.name, mode="r")
+
+    def test_compiled_msp_dir_fmt_validate_positive(self):
+        self._compiled_msp_dir([0, 1, 3]).validate()
+
+    def test_compiled_msp_dir_fmt_validate_negative_offsets(self):
+        format = self._compiled_msp_dir([0, 2, 1])
+        with self.assertRaisesRegex(ValidationError, "offsets must start at 0"):
+            format.validate()
+
+    def test_compiled_msp_dir_fmt_validate_negative_decreasing(self):
+        format = self._compiled_msp_dir([0, 4, 3])
+        with self.assertRaisesRegex(ValidationError, "must not be decreasing"):
+            format.validate()
+
+    def test_compiled_msp_dir_fmt_validate_negative_spectra(self):
+        format = self._compiled_msp_dir([0, 3])
+        with self.assertRaisesRegex(ValidationError, "describes 2 spectra"):
+            format.validate()
+
+    def test_compiled_msp_dir_fmt_validate_negative_array_length(self):
+        format = self._compiled_msp_dir([0, 1, 4], n_peaks=4)
+        with self.assertRaisesRegex(ValidationError, "intensity array has 3"):
+            format.validate()
+
+    def test_compiled_msp_dir_fmt_fragment_index(self):
+        format = self._compiled_msp_dir([0, 1, 3])
+        format.build_fragment_index(0.5)
+        format.validate()
+
+        self.assertTrue(format.has_fragment_index)
+        bin_width, offsets, spectra, weights = format.read_fragment_index()
+        self.assertEqual(bin_width, 0.5)
+        np.testing.assert_array_equal(offsets, [0, 1, 1, 2, 2, 3])
+        np.testing.assert_array_equal(spectra, [0, 1, 1])
+        np.testing.assert_allclose(weights, [1, 0.5**0.5, 0.5**0.5], rtol=1e-6)
+
+    def test_compiled_msp_dir_fmt_validate_negative_fragment_index(self):
+        format = self._compiled_msp_dir([0, 1, 3])
+        format.build_fragment_index(0.5)
+        os.remove(os.path.join(self.temp_dir.name, "fragment_index_weights.npy"))
+        with self.assertRaisesRegex(ValidationError, "index is incomplete"):
+            format.validate()
+
 
 class TestMatchedSpectra(TestPluginBase):
     package = "q2_ms.types.tests"
@@ -303,8 +787,115 @@ class TestMatchedSpectra(TestPluginBase):
         ):
             format.validate()
 
+    @patch("q2_ms.types._matched_spectra.BLOCK_SIZE", 64)
+    def test_matched_spectra_format_validate_negative_blocks(self):
+        path = os.path.join(self.temp_dir.name, "matched_spectra.txt")
+        with open(path, "w") as f:
+            f.write(".original_query_index\ttarget_spectrum_id\tscore\n")
+            for i in range(100):
+                f.write(f"{i}\t{i}\t{1.5 if i in (60, 80) else 0.5}\n")
+        format = MatchedSpectraFormat(path, mode="r")
+        with self.assertRaisesRegex(
+            ValidationError, "Line 62 has an out-of-range score: 1.5"
+        ):
+            format.validate()
+        format.validate("min")
+
     def test_matched_spectra_directory_format_validate_positive(self):
         format = MatchedSpectraDirFmt(
             self.get_data_path("MatchedSpectra_valid"), mode="r"
         )
         format.validate()
+
+
+class TestValidationCache(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        self.env = patch.dict(os.environ, {"Q2_MS_VALIDATION_CACHE": self.cache_dir})
+        self.env.start()
+        self.addCleanup(self.env.stop)
+
+    def test_cache_reuses_valid_result(self):
+        format = MSPFormat(self.get_data_path("MSP_valid/valid.msp"), mode="r")
+        format.validate()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        with patch.object(MSPFormat, "_validate") as mock_validate:
+            format.validate()
+            mock_validate.assert_not_called()
+
+    def test_cache_reuses_invalid_result(self):
+        format = MatchedSpectraFormat(
+            self.get_data_path("MatchedSpectra_invalid/matched_spectra_score_type.txt"),
+            mode="r",
+        )
+        with self.assertRaisesRegex(ValidationError, "non-numeric score"):
+            format.validate()
+
+        with patch.object(MatchedSpectraFormat, "_validate") as mock_validate:
+            with self.assertRaisesRegex(ValidationError, "non-numeric score"):
+                format.validate()
+            mock_validate.assert_not_called()
+
+    def test_cache_key_depends_on_level(self):
+        format = mzMLFormat(self.get_data_path("mzML_valid/tiny.mzML"), mode="r")
+        format.validate("min")
+        format.validate("max")
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_detects_changed_content(self):
+        path = os.path.join(self.temp_dir.name, "library.msp")
+        shutil.copy(self.get_data_path("MSP_valid/valid.msp"), path)
+        MSPFormat(path, mode="r").validate()
+
+        shutil.copy(self.get_data_path("MSP_invalid/invalid.msp"), path)
+        with self.assertRaises(ValidationError):
+            MSPFormat(path, mode="r").validate()
+
+    def test_cache_key_depends_on_max_errors(self):
+        cache = ValidationCache(self.cache_dir)
+        path = self.get_data_path("MSP_valid/valid.msp")
+        key = cache.key("MSPFormat", path, "max")
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_MAX_ERRORS": "1"}):
+            self.assertNotEqual(cache.key("MSPFormat", path, "max"), key)
+
+    def test_cache_default_mode(self):
+        self.assertEqual(ValidationCache(self.cache_dir).mode, "hash")
+
+    def test_cache_stat_mode_does_not_read_file(self):
+        cache = ValidationCache(self.cache_dir, mode="stat")
+        with patch("builtins.open") as mock_open:
+            cache.key("MSPFormat", self.get_data_path("MSP_valid/valid.msp"), "min")
+            mock_open.assert_not_called()
+
+    def test_cache_detects_changed_content_stat_mode(self):
+        path = os.path.join(self.temp_dir.name, "library.msp")
+        shutil.copy(self.get_data_path("MSP_valid/valid.msp"), path)
+        with patch.dict(os.environ, {"Q2_MS_VALIDATION_CACHE_MODE": "stat"}):
+            MSPFormat(path, mode="r").validate()
+
+            shutil.copy(self.get_data_path("MSP_invalid/invalid.msp"), path)
+            with self.assertRaises(ValidationError):
+                MSPFormat(path, mode="r").validate()
+
+    def test_cache_eviction(self):
+        cache = ValidationCache(self.cache_dir, mode="stat", max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.set(key)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_eviction_interval(self):
+        cache = ValidationCache(self.cache_dir, max_entries=100)
+        with patch("q2_ms.types._cache.os.scandir", wraps=os.scandir) as mock_scandir:
+            for i in range(9):
+                cache.set(str(i))
+            mock_scandir.assert_not_called()
+            cache.set("9")
+            mock_scandir.assert_called_once()
+
+    def test_cache_invalid_mode(self):
+        with self.assertRaisesRegex(ValueError, "cache mode"):
+            ValidationCache(self.cache_dir, mode="fast")
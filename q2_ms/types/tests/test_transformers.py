@@ -0,0 +1,319 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.types import (
+    CompiledMSPDirFmt,
+    MatchedSpectraDirFmt,
+    MatchedSpectraFormat,
+    MSPDirFmt,
+    MSPFormat,
+    XCMSExperimentDirFmt,
+    XCMSExperimentParquetDirFmt,
+    XCMSExperimentReader,
+)
+from q2_ms.types._msp import iter_msp_spectra
+from q2_ms.types._parquet import parquet_to_text, text_to_parquet
+from q2_ms.xcms.parquet import (
+    convert_ms_experiment_to_parquet,
+    convert_ms_experiment_to_text,
+)
+
+
+class TestMSPTransformers(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def test_msp_format_to_msp_dir_fmt(self):
+        transformer = self.get_transformer(MSPFormat, MSPDirFmt)
+        input = MSPFormat(self.get_data_path("MSP_valid/valid.msp"), mode="r")
+
+        result = transformer(input)
+
+        self.assertTrue(os.path.exists(os.path.join(str(result), "valid.msp")))
+        self.assertEqual(len(result.read_index()), 3)
+        result.validate()
+
+    def test_msp_dir_fmt_to_msp_format(self):
+        transformer = self.get_transformer(MSPDirFmt, MSPFormat)
+        input = MSPDirFmt(self.get_data_path("MSP_valid"), mode="r")
+
+        result = transformer(input)
+
+        self.assertIsInstance(result, MSPFormat)
+        self.assertEqual(str(result), self.get_data_path("MSP_valid/valid.msp"))
+        result.validate()
+
+    def test_msp_dir_fmt_to_compiled_msp_dir_fmt(self):
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        input = MSPDirFmt(self.get_data_path("MSP_valid"), mode="r")
+
+        result = transformer(input)
+        result.validate()
+
+        metadata = result.read_metadata()
+        offsets, mz, intensity = result.read_peaks()
+        self.assertEqual(
+            metadata["Name"].tolist(),
+            ["Scleroderolide", "Fumonisin B4", "Chaetoglobosin A"],
+        )
+        self.assertEqual(metadata["PrecursorMZ"][0], "329.1014")
+        self.assertIsInstance(mz, np.memmap)
+        np.testing.assert_array_equal(offsets[:3], [0, 4, 5])
+        np.testing.assert_array_equal(mz[:4], [273.0393, 287.055, 311.0914, 329.102])
+        np.testing.assert_array_equal(intensity[:4], [163, 73, 49, 999])
+
+    def test_compiled_msp_dir_fmt_to_msp_dir_fmt(self):
+        input = MSPDirFmt(self.get_data_path("MSP_valid"), mode="r")
+        compiled = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)(input)
+
+        result = self.get_transformer(CompiledMSPDirFmt, MSPDirFmt)(compiled)
+        result.validate()
+
+        expected = iter_msp_spectra(self.get_data_path("MSP_valid/valid.msp"))
+        observed = iter_msp_spectra(result.msp_path)
+        for (exp_meta, *exp_peaks), (obs_meta, *obs_peaks) in zip(
+            expected, observed, strict=True
+        ):
+            self.assertEqual(sorted(obs_meta), sorted(exp_meta))
+            self.assertEqual(obs_peaks, exp_peaks)
+        self.assertEqual(len(result.read_index()), 3)
+
+    def test_compiled_msp_dir_fmt_to_msp_dir_fmt_precision(self):
+        msp_dir = os.path.join(self.temp_dir.name, "msp")
+        os.mkdir(msp_dir)
+        with open(os.path.join(msp_dir, "library.msp"), "w") as f:
+            f.write(
+                "Name: Precise\nNum Peaks: 2\n"
+                "100.123456789012 0.123456789012345\n"
+                "200.5 123456789.123\n"
+            )
+        input = MSPDirFmt(msp_dir, mode="r")
+        compiled = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)(input)
+
+        result = self.get_transformer(CompiledMSPDirFmt, MSPDirFmt)(compiled)
+
+        with open(result.msp_path) as f:
+            self.assertEqual(
+                f.read(),
+                "Name: Precise\nNum Peaks: 2\n"
+                "100.123456789012 0.123456789012345\n"
+                "200.5 123456789.123\n",
+            )
+
+
+class TestMatchedSpectraTransformers(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def test_matched_spectra_format_to_dataframe(self):
+        transformer = self.get_transformer(MatchedSpectraFormat, pd.DataFrame)
+        input = MatchedSpectraFormat(
+            self.get_data_path("MatchedSpectra_valid/matched_spectra.txt"), mode="r"
+        )
+
+        df = transformer(input)
+
+        self.assertEqual(df[".original_query_index"].dtype, np.uint32)
+        self.assertIsInstance(df["target_spectrum_id"].dtype, pd.CategoricalDtype)
+        self.assertEqual(df["score"].dtype, np.float32)
+        self.assertEqual(df[".original_query_index"].tolist(), [1])
+
+    def test_matched_spectra_dir_fmt_to_dataframe(self):
+        transformer = self.get_transformer(MatchedSpectraDirFmt, pd.DataFrame)
+        input = MatchedSpectraDirFmt(
+            self.get_data_path("MatchedSpectra_valid"), mode="r"
+        )
+
+        df = transformer(input)
+
+        self.assertEqual(df.shape, (1, 3))
+
+    def test_dataframe_to_matched_spectra_format(self):
+        transformer = self.get_transformer(pd.DataFrame, MatchedSpectraFormat)
+        df = pd.DataFrame(
+            {
+                ".original_query_index": [1, 2],
+                "target_spectrum_id": ["a", "b"],
+                "score": [0.5, 1.0],
+            }
+        )
+
+        result = transformer(df)
+
+        result.validate()
+
+
+class TestXCMSExperimentTransformers(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def setUp(self):
+        super().setUp()
+        transformer = self.get_transformer(XCMSExperimentDirFmt, XCMSExperimentReader)
+        self.experiment = transformer(
+            XCMSExperimentDirFmt(self.get_data_path("XCMSExperiment"), mode="r")
+        )
+
+    def test_xcms_experiment_reader_backend_data(self):
+        df = self.experiment.backend_data
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df["msLevel"].dtype, np.int32)
+        self.assertEqual(df["rtime"].tolist(), [2551.457, 2553.022])
+
+    def test_xcms_experiment_reader_sample_data(self):
+        df = self.experiment.sample_data
+        self.assertEqual(df["sample_name"].tolist()[:2], ["ko15", "ko16"])
+        self.assertEqual(df.index.tolist(), list(range(8)))
+
+    def test_xcms_experiment_reader_sample_ids(self):
+        self.assertEqual(self.experiment.sample_ids[:2], ["ko15", "ko16"])
+
+    def test_xcms_experiment_reader_chrom_peaks(self):
+        df = self.experiment.chrom_peaks
+        self.assertEqual(df["chrom_peak_id"].tolist()[:2], ["CP0001", "CP0002"])
+        self.assertEqual(df.index.tolist(), [0, 1, 2, 3])
+        self.assertEqual(df["mz"].dtype, np.float64)
+        self.assertEqual(df["is_filled"].dtype, bool)
+
+    def test_xcms_experiment_reader_features(self):
+        df = self.experiment.feature_definitions
+        self.assertEqual(df["feature_id"].tolist()[0], "FT001")
+        self.assertNotIn("peakidx", df.columns)
+        self.assertEqual(self.experiment.feature_peaks(0).tolist(), [457, 1160])
+
+    def test_xcms_experiment_reader_cached(self):
+        self.assertIs(self.experiment.chrom_peaks, self.experiment.chrom_peaks)
+
+    def test_xcms_experiment_reader_missing_optional(self):
+        experiment = XCMSExperimentReader(self.temp_dir.name)
+        self.assertIsNone(experiment.chrom_peaks)
+        self.assertIsNone(experiment.feature_peak_index)
+
+
+class TestXCMSExperimentParquetTransformers(TestPluginBase):
+    package = "q2_ms.types.tests"
+
+    def setUp(self):
+        super().setUp()
+        transformer = self.get_transformer(
+            XCMSExperimentDirFmt, XCMSExperimentParquetDirFmt
+        )
+        self.experiment = transformer(
+            XCMSExperimentDirFmt(self.get_data_path("XCMSExperiment"), mode="r")
+        )
+
+    def test_xcms_experiment_dir_fmt_to_parquet_dir_fmt(self):
+        self.experiment.validate()
+        for filename in ["ms_backend_data.txt", "xcms_experiment_chrom_peaks.txt"]:
+            path = os.path.join(str(self.experiment), filename)
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(str(self.experiment), "ms_experiment_sample_data.txt")
+            )
+        )
+
+    def test_parquet_dir_fmt_to_xcms_experiment_dir_fmt(self):
+        transformer = self.get_transformer(
+            XCMSExperimentParquetDirFmt, XCMSExperimentDirFmt
+        )
+        result = transformer(self.experiment)
+        result.validate()
+
+        for filename in ["ms_backend_data.txt", "xcms_experiment_chrom_peaks.txt"]:
+            with open(self.get_data_path(f"XCMSExperiment/{filename}")) as f:
+                expected = f.read()
+            with open(os.path.join(str(result), filename)) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_convert_ms_experiment_to_parquet_and_text(self):
+        experiment = convert_ms_experiment_to_parquet(self.experiment)
+        experiment.validate()
+
+        transformer = self.get_transformer(
+            XCMSExperimentParquetDirFmt, XCMSExperimentDirFmt
+        )
+        result = convert_ms_experiment_to_text(transformer(experiment))
+        result.validate()
+        with open(self.get_data_path("XCMSExperiment/ms_backend_data.txt")) as f:
+            expected = f.read()
+        with open(os.path.join(str(result), "ms_backend_data.txt")) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_parquet_to_text_r_values(self):
+        text = (
+            '"mz"\t"into"\t"sample"\t"note"\n'
+            '"CP1"\t594\tInf\t1\t"a \\"quoted\\" note"\n'
+            '"CP2"\t594.123456789012\t-Inf\t1\tNA\n'
+            '"CP3"\tNA\t1e-05\t2\t"plain"\n'
+        )
+        text_path = os.path.join(self.temp_dir.name, "chrom_peaks.txt")
+        parquet_path = os.path.join(self.temp_dir.name, "chrom_peaks.parquet")
+        result_path = os.path.join(self.temp_dir.name, "result.txt")
+        with open(text_path, "w") as f:
+            f.write(text)
+
+        text_to_parquet(text_path, parquet_path, "sample")
+        parquet_to_text(parquet_path, result_path)
+
+        with open(result_path) as f:
+            self.assertEqual(f.read(), text)
+
+    def test_text_to_parquet_chunks(self):
+        text = (
+            '"mz"\t"sample"\n'
+            '"CP1"\t594\t1\n'
+            '"CP2"\t594.5\t1\n'
+            '"CP3"\tNA\t2\n'
+            '"CP4"\t600\t2\n'
+            '"CP5"\t601\t3\n'
+        )
+        text_path = os.path.join(self.temp_dir.name, "chrom_peaks.txt")
+        parquet_path = os.path.join(self.temp_dir.name, "chrom_peaks.parquet")
+        result_path = os.path.join(self.temp_dir.name, "result.txt")
+        with open(text_path, "w") as f:
+            f.write(text)
+
+        # Integers in the first chunk and floats in the second one
+        with patch("q2_ms.types._parquet.READ_CHUNK_SIZE", 1):
+            text_to_parquet(text_path, parquet_path, "sample")
+        parquet_to_text(parquet_path, result_path)
+
+        metadata = pq.ParquetFile(parquet_path).metadata
+        self.assertEqual(
+            [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)],
+            [2, 2, 1],
+        )
+        with open(result_path) as f:
+            self.assertEqual(f.read(), text)
+
+    def test_parquet_dir_fmt_read_chrom_peaks_filtered(self):
+        df = self.experiment.read_chrom_peaks(
+            columns=["mz", "sample"], filters=[("sample", "==", 2)]
+        )
+        self.assertEqual(df.columns.tolist(), ["mz", "sample"])
+        self.assertTrue((df["sample"] == 2).all())
+
+    def test_parquet_dir_fmt_to_xcms_experiment_reader(self):
+        transformer = self.get_transformer(
+            XCMSExperimentParquetDirFmt, XCMSExperimentReader
+        )
+        experiment = transformer(self.experiment)
+
+        self.assertEqual(experiment.backend_data["msLevel"].dtype, np.int32)
+        self.assertEqual(
+            experiment.backend_data["rtime"].tolist(), [2551.457, 2553.022]
+        )
+        self.assertEqual(
+            experiment.chrom_peaks["chrom_peak_id"].tolist()[:2], ["CP0001", "CP0002"]
+        )
+        self.assertEqual(experiment.chrom_peaks["mz"].dtype, np.float64)
@@ -5,10 +5,13 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+from unittest.mock import patch
+
 from qiime2.core.exceptions import ValidationError
 from qiime2.plugin.testing import TestPluginBase
 
 from q2_ms.types import XCMSExperimentDirFmt
+from q2_ms.types._ms_backend import _summaries, summarize_ms_backend_data
 from q2_ms.types._validators import (
     validate_xcms_experiment_features,
     validate_xcms_experiment_ms2,
@@ -28,6 +31,48 @@ class TestValidators(TestPluginBase):
         data = XCMSExperimentDirFmt(self.get_data_path("ms_backend_MS2"), mode="r")
         validate_xcms_experiment_ms2(data, None)
 
+    def test_validate_xcms_experiment_ms2_uses_summary(self):
+        data = XCMSExperimentDirFmt(self.get_data_path("XCMSExperiment"), mode="r")
+        _summaries.clear()
+        with self.assertRaises(ValidationError):
+            validate_xcms_experiment_ms2(data, None)
+
+        # The first check read the whole file and cached the summary
+        with patch("q2_ms.types._ms_backend._iter_columns") as mock_iter:
+            with self.assertRaises(ValidationError):
+                validate_xcms_experiment_ms2(data, None)
+            mock_iter.assert_not_called()
+
+    def test_validate_xcms_experiment_ms2_caches_partial_summary(self):
+        data = XCMSExperimentDirFmt(self.get_data_path("ms_backend_MS2"), mode="r")
+        _summaries.clear()
+        validate_xcms_experiment_ms2(data, None)
+
+        # The first check stopped at the first MS2 spectrum and cached the levels
+        with patch("q2_ms.types._ms_backend._iter_columns") as mock_iter:
+            validate_xcms_experiment_ms2(data, None)
+            mock_iter.assert_not_called()
+
+        # The partial summary is completed on demand
+        self.assertIn(2, data.summary()["ms_levels"])
+        self.assertIn("spectra_per_sample", data.summary())
+
+    def test_summaries_bounded(self):
+        _summaries.clear()
+        with patch("q2_ms.types._ms_backend.MAX_SUMMARIES", 1):
+            for dirname in ["XCMSExperiment", "ms_backend_MS2"]:
+                summarize_ms_backend_data(
+                    self.get_data_path(f"{dirname}/ms_backend_data.txt")
+                )
+        self.assertEqual(len(_summaries), 1)
+        self.assertIn("ms_backend_MS2", next(iter(_summaries))[0])
+
+    def test_xcms_experiment_summary(self):
+        data = XCMSExperimentDirFmt(self.get_data_path("XCMSExperiment"), mode="r")
+        summary = data.summary()
+        self.assertEqual(summary["ms_levels"], [1])
+        self.assertEqual(list(summary["spectra_per_sample"].values()), [2])
+
     def test_validate_xcms_experiment_peaks_error(self):
         data = XCMSExperimentDirFmt(self.temp_dir.name, mode="r")
         with self.assertRaisesRegex(ValidationError, "The property 'peaks'"):
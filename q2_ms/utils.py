@@ -5,7 +5,33 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import atexit
+import hmac
+import json
+import os
+import secrets
+import shutil
+import socket
 import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+R_WORKER_ENV = "Q2_MS_R_WORKER"
+# Secret the R worker sends to authenticate its connection
+R_WORKER_TOKEN_ENV = "Q2_MS_R_WORKER_TOKEN"
+RESOURCE_LOG_ENV = "Q2_MS_RESOURCE_LOG"
+STORE_RESOURCE_USAGE_ENV = "Q2_MS_STORE_RESOURCE_USAGE"
+# File the R scripts write their package load time and versions to
+TIMING_FILE_ENV = "Q2_MS_TIMING_FILE"
+
+RESOURCE_USAGE_FILENAME = "resource_usage.json"
+
+# Seconds to wait for the R worker to load its packages and for health checks
+R_WORKER_STARTUP_TIMEOUT = 600
+R_WORKER_PING_TIMEOUT = 10
+R_WORKER_USAGE_FIELDS = ("user_time", "system_time", "r_heap_max_mb")
 
 EXTERNAL_CMD_WARNING = (
     "Running external command line application(s). "
@@ -17,17 +43,116 @@ EXTERNAL_CMD_WARNING = (
 
 
 def run_command(cmd, cwd, verbose=True, env=None):
+    """
+    Runs an external command and returns its resource usage: wall time, user and
+    system CPU time and peak resident set size of the process and its children,
+    taken from os.wait4. R scripts that write their package load time to the file
+    in Q2_MS_TIMING_FILE also get the time split into load and compute time. The
+    usage is reported with report_resource_usage.
+
+    Raises:
+        subprocess.CalledProcessError: If the command returns a non-zero exit
+            status.
+    """
     if verbose:
         print(EXTERNAL_CMD_WARNING)
         print("\nCommand:", end=" ")
         print(" ".join(cmd), end="\n\n")
-    subprocess.run(cmd, check=True, cwd=cwd, env=env)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        timing_path = os.path.join(tmp_dir, "timing.tsv")
+        env = dict(os.environ if env is None else env)
+        env[TIMING_FILE_ENV] = timing_path
+
+        started = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, cwd=cwd, env=env)
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        wall_time = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        rss_unit = 1024**2 if sys.platform == "darwin" else 1024
+        usage = {
+            "command": cmd,
+            "start": started.isoformat(),
+            "returncode": process.returncode,
+            "wall_time": wall_time,
+            "user_time": rusage.ru_utime,
+            "system_time": rusage.ru_stime,
+            "max_rss_mb": rusage.ru_maxrss / rss_unit,
+        }
+        usage.update(_read_timing_file(timing_path))
+        if "load_time" in usage:
+            usage["compute_time"] = max(wall_time - usage["load_time"], 0)
+
+    report_resource_usage(usage, verbose)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return usage
+
+
+def _read_timing_file(path):
+    """
+    Returns the tab-separated key-value pairs of a timing file. Numeric values are
+    converted to floats.
+    """
+    if not os.path.exists(path):
+        return {}
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.rstrip("\n").partition("\t")
+            try:
+                values[key] = float(value)
+            except ValueError:
+                values[key] = value
+    return values
+
+
+def report_resource_usage(usage, verbose=True):
+    """
+    Prints the resource usage of an external command as a JSON line and appends it
+    to the JSON lines file set with the environment variable Q2_MS_RESOURCE_LOG.
+    """
+    line = json.dumps(usage)
+    if verbose:
+        print(f"Resource usage: {line}", file=sys.stderr)
+    log_path = os.environ.get(RESOURCE_LOG_ENV)
+    if log_path:
+        with open(log_path, "a") as f:
+            f.write(line + "\n")
+
+
+def store_resource_usage(output_dir, usage):
+    """
+    Appends the resource usage of an external command to resource_usage.json in
+    an output directory if the environment variable Q2_MS_STORE_RESOURCE_USAGE is
+    set.
+    """
+    if os.environ.get(STORE_RESOURCE_USAGE_ENV, "").lower() not in ("1", "true", "yes"):
+        return
+    path = os.path.join(output_dir, RESOURCE_USAGE_FILENAME)
+    records = []
+    if os.path.exists(path):
+        with open(path) as f:
+            records = json.load(f)
+    records.append(usage)
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
 
 
 def run_r_script(script_name, params, package_name):
     """
     Constructs a command-line call to an R script with parameters passed as
-    command-line flags and executes it.
+    command-line flags and executes it. If the environment variable Q2_MS_R_WORKER
+    is set, the script is run by the persistent R worker of the session instead,
+    see RWorker. Returns the resource usage of the script, see run_command.
 
     Parameters:
         params (dict):
@@ -44,17 +169,278 @@ def run_r_script(script_name, params, package_name):
             If the R script returns a non-zero exit status, an Exception is raised
             with the relevant package name and return code.
     """
-    cmd = [f"{script_name}.R"]
+    if use_r_worker():
+        return _run_r_script_in_worker(script_name, params, package_name)
 
-    for key, value in params.items():
-        if value is not None:
-            cmd.extend([f"--{key}", str(value)])
+    cmd = [f"{script_name}.R"]
+    cmd.extend(_r_script_args(params))
 
     try:
-        run_command(cmd, verbose=True, cwd=None)
+        return run_command(cmd, verbose=True, cwd=None)
     except subprocess.CalledProcessError as e:
         raise Exception(
             f"An error was encountered while running {package_name}, "
             f"(return code {e.returncode}), please inspect "
             "stdout and stderr to learn more."
         )
+
+
+def _r_script_args(params):
+    args = []
+    for key, value in params.items():
+        if value is not None:
+            args.extend([f"--{key}", str(value)])
+    return args
+
+
+def use_r_worker():
+    """
+    Returns True if the R scripts should be run by the persistent R worker, which
+    is enabled with the environment variable Q2_MS_R_WORKER.
+    """
+    return os.environ.get(R_WORKER_ENV, "").lower() in ("1", "true", "yes")
+
+
+class RWorker:
+    """
+    Long-lived R process that runs the R scripts of q2-ms, so that xcms,
+    MsExperiment and MsIO are only loaded once per session. The worker connects to
+    a local TCP socket opened by this class. As any local process can connect to
+    it, the worker first sends "HELLO <token>" with the random token passed in the
+    environment variable Q2_MS_R_WORKER_TOKEN and other connections are closed.
+    The worker then answers requests of one line with tab-separated fields:
+
+        PING                         -> OK
+        RUN <script path> <args...>  -> OK <usage...> or ERROR <message>
+        QUIT                         -> OK
+
+    The usage fields of RUN are the user and system CPU time and the peak R heap
+    size in MB of the script. The output of the scripts goes to the stdout and
+    stderr of the worker.
+
+    Parameters:
+        command (list):
+            Command that starts the worker. It is called with --port <port>.
+    """
+
+    def __init__(self, command=None):
+        self.command = command or ["r_worker.R"]
+        self.process = None
+        self._connection = None
+        self._file = None
+
+    def start(self):
+        # The token is passed in the environment as the command line of a process
+        # is visible to other users
+        token = secrets.token_hex(32)
+        env = {**os.environ, R_WORKER_TOKEN_ENV: token}
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+            server.settimeout(1)
+            port = server.getsockname()[1]
+            self.process = subprocess.Popen(
+                self.command + ["--port", str(port)], env=env
+            )
+
+            for _ in range(R_WORKER_STARTUP_TIMEOUT):
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    if self.process.poll() is not None:
+                        raise RuntimeError(
+                            "The R worker exited with return code "
+                            f"{self.process.returncode} before it was ready."
+                        )
+                    continue
+                if self._authenticate(connection, token):
+                    break
+            else:
+                self.close()
+                raise RuntimeError("The R worker did not start in time.")
+
+    def _authenticate(self, connection, token):
+        """
+        Keeps the connection if its first line holds the token and closes it
+        otherwise.
+        """
+        connection.settimeout(R_WORKER_PING_TIMEOUT)
+        file = connection.makefile("rw", encoding="utf-8", newline="\n")
+        try:
+            line = file.readline()
+        except (OSError, UnicodeDecodeError):
+            line = ""
+        if hmac.compare_digest(line.encode(), f"HELLO\t{token}\n".encode()):
+            self._connection, self._file = connection, file
+            return True
+        file.close()
+        connection.close()
+        return False
+
+    def is_alive(self):
+        """
+        Health check: returns True if the worker process is running and answers a
+        PING request.
+        """
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            return self.request(["PING"], timeout=R_WORKER_PING_TIMEOUT) == ["OK"]
+        except (OSError, ConnectionError):
+            return False
+
+    def run_script(self, script_path, args):
+        """
+        Runs an R script with command-line arguments in the worker. Returns the
+        CPU times and the peak R heap size of the script reported by the worker.
+
+        Raises:
+            RuntimeError: If the script raised an error.
+        """
+        response = self.request(["RUN", script_path] + args)
+        if response[0] != "OK":
+            raise RuntimeError(" ".join(response[1:]))
+        return {
+            key: float(value) for key, value in zip(R_WORKER_USAGE_FIELDS, response[1:])
+        }
+
+    def request(self, fields, timeout=None):
+        """
+        Sends a request and returns the fields of the response.
+
+        Raises:
+            ConnectionError: If the worker closed the connection.
+        """
+        for field in fields:
+            if "\t" in field or "\n" in field:
+                raise ValueError(
+                    f"Arguments of the R worker must not contain tabs or newlines: "
+                    f"{field!r}"
+                )
+
+        self._connection.settimeout(timeout)
+        self._file.write("\t".join(fields) + "\n")
+        self._file.flush()
+        response = self._file.readline()
+        if not response:
+            raise ConnectionError("The R worker closed the connection.")
+        return response.rstrip("\n").split("\t")
+
+    def close(self):
+        if self.process is None:
+            return
+        if self._file is not None:
+            try:
+                self.request(["QUIT"], timeout=R_WORKER_PING_TIMEOUT)
+            except (OSError, ConnectionError):
+                pass
+            self._file.close()
+            self._connection.close()
+        try:
+            self.process.wait(timeout=R_WORKER_PING_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+        self._connection = None
+        self._file = None
+
+
+_r_worker = None
+
+
+def get_r_worker():
+    """
+    Returns the R worker of this session. A new worker is started if there is none
+    or if the current one fails its health check.
+    """
+    global _r_worker
+    if _r_worker is not None and not _r_worker.is_alive():
+        _r_worker.close()
+        _r_worker = None
+    if _r_worker is None:
+        worker = RWorker()
+        worker.start()
+        atexit.register(worker.close)
+        _r_worker = worker
+    return _r_worker
+
+
+def _run_r_script_in_worker(script_name, params, package_name):
+    script_path = shutil.which(f"{script_name}.R") or f"{script_name}.R"
+    args = _r_script_args(params)
+    print(EXTERNAL_CMD_WARNING)
+    print("\nCommand (R worker):", end=" ")
+    print(" ".join([script_path] + args), end="\n\n")
+
+    started = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    try:
+        worker_usage = get_r_worker().run_script(script_path, args)
+    except RuntimeError as e:
+        raise Exception(
+            f"An error was encountered while running {package_name} "
+            f"({e}), please inspect stdout and stderr to learn more."
+        )
+    except (OSError, ConnectionError) as e:
+        # get_r_worker replaces workers that fail their health check, so the
+        # worker was most likely killed by the script, e.g. when it ran out of
+        # memory. The script is not run again.
+        raise Exception(
+            f"The R worker stopped while running {package_name} ({e}), please "
+            "inspect stdout and stderr to learn more."
+        )
+
+    # The packages are already loaded, so all time is compute time
+    wall_time = time.perf_counter() - start
+    usage = {
+        "command": [script_path] + args,
+        "start": started.isoformat(),
+        "returncode": 0,
+        "wall_time": wall_time,
+        "r_worker": True,
+        "load_time": 0.0,
+        "compute_time": wall_time,
+    }
+    usage.update(worker_usage)
+    report_resource_usage(usage)
+    return usage
+
+
+# ioctl request that clones the extents of a file on Linux (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+def link_file(src, dst):
+    """
+    Creates `dst` as a hardlink of `src` or, if hardlinks are not possible, as a
+    reflink (copy-on-write clone) of it. The data of the file is never copied.
+
+    Raises:
+        OSError: If the file can neither be hardlinked nor reflinked.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError as e:
+        error = e
+
+    try:
+        import fcntl
+
+        with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+            fcntl.ioctl(f_dst.fileno(), _FICLONE, f_src.fileno())
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise OSError(
+            f"{src} can neither be hardlinked nor reflinked to {dst}: {error}"
+        )
+
+
+def link_tree(src, dst):
+    """
+    Recreates the directory `src` at `dst` with all files linked, see link_file.
+    """
+    shutil.copytree(src, dst, copy_function=link_file)
@@ -0,0 +1,208 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+
+from qiime2 import Metadata
+
+from q2_ms.types import XCMSExperimentDirFmt, mzMLDirFmt
+from q2_ms.types._compression import strip_compression_suffix
+from q2_ms.types._xcms_experiment import SPECTRA_DIRNAME
+from q2_ms.utils import RESOURCE_USAGE_FILENAME, store_resource_usage
+from q2_ms.xcms.read_ms_experiment import (
+    _prepare_spectra,
+    _read_spectra,
+    _replace_paths,
+    _validate_metadata,
+)
+from q2_ms.xcms.utils import (
+    BACKEND_DATA_FILENAME,
+    LINKS_FILENAME,
+    SAMPLE_DATA_FILENAME,
+    concat_links,
+    concat_tables,
+    link_spectra_file,
+)
+
+# Results of XCMS processing steps that refer to the samples of the experiment
+_PROCESSING_FILENAMES = [
+    "xcms_experiment_chrom_peaks.txt",
+    "xcms_experiment_chrom_peak_data.txt",
+    "xcms_experiment_feature_definitions.txt",
+    "xcms_experiment_feature_peak_index.txt",
+]
+
+
+def append_ms_experiment(
+    xcms_experiment: XCMSExperimentDirFmt,
+    spectra: mzMLDirFmt,
+    sample_metadata: Metadata = None,
+    n_jobs: int = 1,
+    engine: str = "r",
+) -> XCMSExperimentDirFmt:
+    """
+    Appends new samples to an XCMSExperiment created with read_ms_experiment.
+    Only the new spectra files are read. The spectra, the sample data and the
+    links between them are appended to the tables of the experiment with their row
+    numbers shifted behind the existing rows. The existing tables are streamed
+    line by line and the stored spectra files are linked, see link_file, so no
+    existing spectra file is read again.
+
+    Parameters:
+        xcms_experiment (XCMSExperimentDirFmt):
+            Experiment with its spectra files, see _store_spectra.
+        spectra (mzMLDirFmt):
+            Spectra files of the new samples.
+        sample_metadata (Metadata):
+            Metadata of the new samples with the same columns as the sample
+            metadata of the experiment.
+        n_jobs (int):
+            Number of parallel workers used to read the spectra files.
+        engine (str):
+            Engine that reads the spectra files, see _read_spectra.
+
+    Returns:
+        XCMSExperimentDirFmt: Experiment with the existing and the new samples.
+    """
+    experiment_path = str(xcms_experiment)
+    _validate_experiment(experiment_path, str(spectra))
+
+    output = XCMSExperimentDirFmt()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sample_metadata_table = None
+        if sample_metadata is not None:
+            sample_metadata_table = sample_metadata.to_dataframe()
+            _validate_metadata(sample_metadata_table, str(spectra))
+
+        # Read the new spectra files only
+        new_experiment_path = os.path.join(tmp_dir, "xcms_experiment")
+        os.mkdir(new_experiment_path)
+        spectra_path = _prepare_spectra(str(spectra), tmp_dir)
+        usage = _read_spectra(
+            spectra_path,
+            new_experiment_path,
+            sample_metadata_table,
+            tmp_dir,
+            n_jobs,
+            None,
+            engine,
+        )
+
+        _append_experiment(
+            experiment_path, new_experiment_path, spectra_path, str(output)
+        )
+
+    if usage is not None:
+        store_resource_usage(str(output), usage)
+
+    return output
+
+
+def _validate_experiment(experiment_path, spectra_path):
+    """
+    Validates that new samples can be appended to an experiment. The experiment
+    has to store its spectra files, must not contain results of processing steps
+    and must not contain any of the new samples.
+
+    Raises:
+        ValueError: If the samples can't be appended to the experiment.
+    """
+    stored_spectra_path = os.path.join(experiment_path, SPECTRA_DIRNAME)
+    if not os.path.isdir(stored_spectra_path):
+        raise ValueError(
+            "The XCMSExperiment does not contain its spectra files. Samples can "
+            "only be appended to experiments created with read-ms-experiment."
+        )
+
+    processed = [
+        filename
+        for filename in _PROCESSING_FILENAMES
+        if os.path.exists(os.path.join(experiment_path, filename))
+    ]
+    if processed:
+        raise ValueError(
+            "Samples can only be appended to an XCMSExperiment before peak "
+            f"detection. The experiment contains: {', '.join(processed)}"
+        )
+
+    def sample_ids(path):
+        return {
+            os.path.splitext(strip_compression_suffix(filename))[0]
+            for filename in os.listdir(path)
+        }
+
+    duplicates = sample_ids(stored_spectra_path) & sample_ids(spectra_path)
+    if duplicates:
+        raise ValueError(
+            "The XCMSExperiment already contains the following samples: "
+            f"{sorted(duplicates)}"
+        )
+
+
+def _append_experiment(experiment_path, new_experiment_path, spectra_path, output_path):
+    """
+    Writes the experiment at `experiment_path` extended by the experiment at
+    `new_experiment_path` to `output_path`. The spectra files read by R from
+    `spectra_path` are stored next to the existing ones.
+    """
+    # Store all spectra files and refer to the new ones relative to the experiment
+    output_spectra_path = os.path.join(output_path, SPECTRA_DIRNAME)
+    os.mkdir(output_spectra_path)
+    for filename in sorted(os.listdir(os.path.join(experiment_path, SPECTRA_DIRNAME))):
+        link_spectra_file(
+            os.path.join(experiment_path, SPECTRA_DIRNAME, filename),
+            os.path.join(output_spectra_path, filename),
+        )
+    filenames = sorted(os.listdir(spectra_path))
+    for filename in filenames:
+        link_spectra_file(
+            os.path.realpath(os.path.join(spectra_path, filename)),
+            os.path.join(output_spectra_path, filename),
+        )
+    relative_paths = {
+        filename: f"{SPECTRA_DIRNAME}/{filename}" for filename in filenames
+    }
+    for filename, columns in (
+        (BACKEND_DATA_FILENAME, ["dataStorage", "dataOrigin"]),
+        (SAMPLE_DATA_FILENAME, ["spectraOrigin"]),
+    ):
+        _replace_paths(
+            os.path.join(new_experiment_path, filename), columns, relative_paths
+        )
+
+    paths = [experiment_path, new_experiment_path]
+    n_spectra = concat_tables(
+        [os.path.join(path, BACKEND_DATA_FILENAME) for path in paths],
+        os.path.join(output_path, BACKEND_DATA_FILENAME),
+    )
+    n_samples = concat_tables(
+        [os.path.join(path, SAMPLE_DATA_FILENAME) for path in paths],
+        os.path.join(output_path, SAMPLE_DATA_FILENAME),
+    )
+    concat_links(
+        [os.path.join(path, LINKS_FILENAME) for path in paths],
+        os.path.join(output_path, LINKS_FILENAME),
+        n_samples,
+        n_spectra,
+    )
+
+    # The slots, e.g. the processing chunk size, are kept from the experiment
+    for filename in os.listdir(experiment_path):
+        if filename not in (
+            BACKEND_DATA_FILENAME,
+            SAMPLE_DATA_FILENAME,
+            LINKS_FILENAME,
+            RESOURCE_USAGE_FILENAME,
+            SPECTRA_DIRNAME,
+        ):
+            shutil.copyfile(
+                os.path.join(experiment_path, filename),
+                os.path.join(output_path, filename),
+            )
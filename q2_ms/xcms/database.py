@@ -7,27 +7,38 @@
 # ----------------------------------------------------------------------------
 import os
 
-import requests
+from q2_ms.types import CompiledMSPDirFmt, MSPDirFmt
+from q2_ms.xcms.download import download
 
-from q2_ms.types import MSPDirFmt
+MASSBANK_URL = (
+    "https://github.com/MassBank/MassBank-data/releases/latest/download"
+    "/MassBank_NIST.msp"
+)
 
 
-def fetch_massbank() -> MSPDirFmt:
+def fetch_massbank(url: str = MASSBANK_URL, sha256: str = None) -> MSPDirFmt:
     """
     Downloads the MassBank_NIST.msp file from the latest release of the MassBank-data
-    GitHub repository.
+    GitHub repository, or from `url`, and builds its record index. The file is
+    streamed to the download cache and is only downloaded again if the release
+    has changed, see q2_ms.xcms.download.
     """
     massbank = MSPDirFmt()
+    download(url, os.path.join(str(massbank), "MassBank_NIST.msp"), sha256)
+    massbank.build_index()
 
-    response = requests.get(
-        "https://github.com/MassBank/MassBank-data/releases/latest/download"
-        "/MassBank_NIST.msp"
-    )
+    return massbank
 
-    if response.status_code == 200:
-        with open(os.path.join(str(massbank), "MassBank_NIST.msp"), "wb") as file:
-            file.write(response.content)
-    else:
-        raise ValueError(f"Failed to download file. Code: {response.status_code}")
 
-    return massbank
+def compile_msp(
+    library: CompiledMSPDirFmt, fragment_bin_width: float = None
+) -> CompiledMSPDirFmt:
+    """
+    Converts an MSP spectral library into a columnar library with memory-mappable
+    peak arrays. The conversion is done by the MSPDirFmt -> CompiledMSPDirFmt
+    transformer. If `fragment_bin_width` is set, a fragment-ion inverted index with
+    m/z bins of this width is added for open searches with match-spectra.
+    """
+    if fragment_bin_width is not None:
+        library.build_fragment_index(fragment_bin_width)
+    return library
@@ -0,0 +1,270 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import unquote, urlparse
+
+import requests
+
+DOWNLOAD_CACHE_ENV = "Q2_MS_DOWNLOAD_CACHE"
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+RETRIES = 5
+RETRY_DELAY = 1
+
+
+def get_download_cache_dir():
+    """
+    Returns the download cache directory set with the environment variable
+    Q2_MS_DOWNLOAD_CACHE. Defaults to q2-ms/downloads in the user cache directory.
+    """
+    directory = os.environ.get(DOWNLOAD_CACHE_ENV)
+    if directory:
+        return directory
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "q2-ms", "downloads")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    Content-addressed cache of downloaded files. The files are stored as
+    objects/<sha256> and every URL has a reference in refs/ with the checksum, the
+    ETag, the Last-Modified date and the release URL of the last download. The
+    reference is used for conditional requests, so unchanged files are not
+    downloaded again. Interrupted downloads are kept in partial/ and resumed with
+    HTTP range requests.
+
+    Parameters:
+        directory (str):
+            Path to the cache directory. It is created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        for subdirectory in ("objects", "refs", "partial"):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    def object_path(self, sha256):
+        return os.path.join(self.directory, "objects", sha256)
+
+    def _ref_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, "refs", f"{key}.json")
+
+    def partial_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, "partial", key)
+
+    def load_ref(self, url):
+        """
+        Returns the reference of `url` or None if there is no cached file for it.
+        """
+        try:
+            with open(self._ref_path(url), "r") as f:
+                ref = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.object_path(ref["sha256"])):
+            return None
+        return ref
+
+    def store(self, url, path, ref):
+        """
+        Moves the downloaded file at `path` into the cache and stores the reference
+        of `url`. Returns the path of the cached object.
+        """
+        object_path = self.object_path(ref["sha256"])
+        os.replace(path, object_path)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.directory, "refs"), suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(ref, f)
+        # Replace atomically so that concurrent readers never see partial entries
+        os.replace(tmp_path, self._ref_path(url))
+        return object_path
+
+
+def download(url, output_path, sha256=None, cache_dir=None):
+    """
+    Downloads `url` to `output_path` through the download cache. The response is
+    streamed to disk in chunks. Interrupted transfers are retried and resumed with
+    HTTP range requests. Local paths and file:// URLs are copied, so a local mirror
+    can be used without a web server.
+
+    Parameters:
+        url (str):
+            URL or local path of the file.
+        output_path (str):
+            Path the file is written to.
+        sha256 (str):
+            Expected SHA-256 checksum of the file.
+        cache_dir (str):
+            Path to the cache directory, see get_download_cache_dir.
+
+    Raises:
+        ValueError:
+            If the download fails or the checksum does not match.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "file"):
+        path = unquote(parsed.path) if parsed.scheme else url
+        shutil.copyfile(path, output_path)
+        _verify_checksum(output_path, file_sha256(output_path), sha256)
+        return
+
+    cache = DownloadCache(cache_dir or get_download_cache_dir())
+    object_path = _fetch(cache, url, sha256)
+    try:
+        # Cached objects are never modified, so they can be shared
+        os.link(object_path, output_path)
+    except OSError:
+        shutil.copyfile(object_path, output_path)
+
+
+def _fetch(cache, url, sha256):
+    ref = cache.load_ref(url)
+    if ref is not None and sha256 is not None:
+        if ref["sha256"] == sha256.lower():
+            return cache.object_path(ref["sha256"])
+        # Download the file again instead of revalidating the wrong file
+        ref = None
+
+    partial_path = cache.partial_path(url)
+    for attempt in range(RETRIES):
+        try:
+            return _fetch_once(cache, url, ref, partial_path, sha256)
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            error = e
+        except requests.HTTPError as e:
+            if e.response.status_code < 500:
+                raise ValueError(
+                    f"Failed to download file. Code: {e.response.status_code}"
+                )
+            error = e
+        if attempt < RETRIES - 1:
+            time.sleep(RETRY_DELAY * 2**attempt)
+
+    if isinstance(error, requests.HTTPError):
+        raise ValueError(f"Failed to download file. Code: {error.response.status_code}")
+    raise ValueError(f"Failed to download file after {RETRIES} attempts: {error}")
+
+
+def _fetch_once(cache, url, ref, partial_path, sha256):
+    headers = {}
+    if ref is not None:
+        if ref.get("etag"):
+            headers["If-None-Match"] = ref["etag"]
+        if ref.get("last_modified"):
+            headers["If-Modified-Since"] = ref["last_modified"]
+
+    partial_meta = _load_partial_meta(partial_path)
+    offset = os.path.getsize(partial_path) if partial_meta is not None else 0
+    if offset and partial_meta.get("etag"):
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = partial_meta["etag"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return cache.object_path(ref["sha256"])
+        if response.status_code == 416:
+            # The partial file does not match the remote file anymore
+            _remove_partial(partial_path)
+            raise requests.ConnectionError("The download cannot be resumed.")
+        if response.status_code not in (200, 206):
+            raise requests.HTTPError(response=response)
+
+        release_url = _release_url(response)
+        if (
+            ref is not None
+            and release_url != url
+            and release_url == ref.get("release_url")
+        ):
+            # The latest release has not changed since the last download
+            return cache.object_path(ref["sha256"])
+
+        etag = response.headers.get("ETag")
+        mode = "ab" if response.status_code == 206 else "wb"
+        if mode == "wb" or partial_meta is None:
+            _store_partial_meta(partial_path, {"etag": etag})
+        with open(partial_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+
+        new_ref = {
+            "url": url,
+            "release_url": release_url,
+            "etag": etag,
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": file_sha256(partial_path),
+        }
+
+    try:
+        _verify_checksum(partial_path, new_ref["sha256"], sha256)
+    finally:
+        os.remove(partial_path + ".json")
+    return cache.store(url, partial_path, new_ref)
+
+
+def _release_url(response):
+    """
+    Returns the target of the first redirect, which names the release for URLs
+    like .../releases/latest/download/<file>, or the URL of the response.
+    """
+    if response.history:
+        return response.history[0].headers.get("Location", response.url)
+    return response.url
+
+
+def _load_partial_meta(partial_path):
+    if not os.path.exists(partial_path):
+        return None
+    try:
+        with open(partial_path + ".json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_partial_meta(partial_path, meta):
+    with open(partial_path + ".json", "w") as f:
+        json.dump(meta, f)
+
+
+def _remove_partial(partial_path):
+    for path in (partial_path, partial_path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _verify_checksum(path, observed, expected):
+    if expected is not None and observed != expected.lower():
+        os.remove(path)
+        raise ValueError(
+            f"The checksum of the downloaded file ({observed}) does not match the "
+            f"expected checksum ({expected})."
+        )
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import biom
+import numpy as np
+from scipy.sparse import coo_matrix
+
+from q2_ms.types import XCMSExperimentReader
+
+
+def extract_feature_table(
+    xcms_experiment: XCMSExperimentReader,
+    value: str = "into",
+    method: str = "medret",
+) -> biom.Table:
+    """
+    Builds a feature table with the abundances of the XCMS features in every
+    sample from the feature-peak index and the chromatographic peaks. The table is
+    assembled as a sparse matrix without a dense intermediate. Features without a
+    peak in a sample have an abundance of 0.
+
+    Parameters:
+        xcms_experiment (XCMSExperimentReader):
+            XCMSExperiment with grouped features.
+        value (str):
+            Column of the chromatographic peaks that is used as abundance.
+        method (str):
+            How to handle features with several peaks in the same sample, as in
+            xcms::featureValues. "medret" uses the peak closest to the median
+            retention time of the feature, "maxint" the peak with the highest
+            `value` and "sum" the sum of the `value` of all peaks.
+
+    Returns:
+        biom.Table: Table with features as observations and samples as columns.
+    """
+    features = xcms_experiment.feature_definitions
+    if features is None:
+        raise ValueError(
+            "The XCMSExperiment does not contain features. Features are created "
+            "by the correspondence analysis."
+        )
+    peaks = xcms_experiment.chrom_peaks
+    sample_ids = xcms_experiment.sample_ids
+
+    index = xcms_experiment.feature_peak_index
+    feature = index["feature_index"].to_numpy()
+    peak = index["peak_index"].to_numpy()
+    sample = peaks["sample"].to_numpy()[peak] - 1
+    values = peaks[value].to_numpy()[peak]
+
+    if method != "sum":
+        if method == "medret":
+            rank = np.abs(
+                peaks["rt"].to_numpy()[peak] - features["rtmed"].to_numpy()[feature]
+            )
+        else:
+            rank = -values
+
+        # Keep the best ranked peak of every feature in every sample
+        order = np.lexsort((rank, sample, feature))
+        feature, sample, values = feature[order], sample[order], values[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (feature[1:] != feature[:-1]) | (sample[1:] != sample[:-1])
+        feature, sample, values = feature[first], sample[first], values[first]
+
+    # Values of the same feature and sample are summed by the conversion to CSR
+    matrix = coo_matrix(
+        (values, (feature, sample)), shape=(len(features), len(sample_ids))
+    ).tocsr()
+
+    return biom.Table(
+        matrix,
+        observation_ids=features["feature_id"].tolist(),
+        sample_ids=[str(sample_id) for sample_id in sample_ids],
+    )
@@ -0,0 +1,513 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from q2_ms.types import (
+    CompiledMSPDirFmt,
+    MatchedSpectraDirFmt,
+    XCMSExperimentReader,
+    mzMLDirFmt,
+)
+from q2_ms.types._compression import strip_compression_suffix
+from q2_ms.types._fragment_index import (
+    DEFAULT_BIN_WIDTH,
+    build_fragment_index,
+    read_fragment_index,
+)
+from q2_ms.types._matched_spectra import MATCHED_SPECTRA_COLUMNS
+from q2_ms.types._mzml import iter_mzml_spectra
+
+# Number of query spectra that are scored at once
+BATCH_SIZE = 1024
+OPEN_SEARCH_BATCH_SIZE = 128
+
+# Tolerance of the comparison of the float32 score bounds of open searches with
+# the minimum score
+SCORE_BOUND_EPSILON = 1e-5
+
+# Metadata keys of the library (lower case without "_" and spaces)
+_PRECURSOR_MZ_KEY = "precursormz"
+_ID_KEY = "db#"
+
+
+def match_spectra(
+    xcms_experiment: XCMSExperimentReader,
+    library: CompiledMSPDirFmt,
+    spectra: mzMLDirFmt = None,
+    ppm: float = 5.0,
+    tolerance: float = 0.0,
+    method: str = "cosine",
+    min_score: float = 0.7,
+    precursor_tolerance: float = None,
+    open_search: bool = False,
+    n_jobs: int = 1,
+) -> MatchedSpectraDirFmt:
+    """
+    Matches the MS2 spectra of an XCMSExperiment against a spectral library. The
+    library spectra with a precursor m/z within `precursor_tolerance` of a query,
+    or within `ppm` and `tolerance` if it is not set, are looked up in the sorted
+    precursor m/z array of the library and all candidates of a batch of queries
+    are scored with array operations.
+
+    The score is the cosine similarity of the square root scaled intensities of
+    the peaks that match within `ppm` and `tolerance`. With the "modified_cosine"
+    method peaks also match if they are shifted by the difference between the
+    precursor m/z values. Every peak is matched at most once and conflicting
+    matches are resolved in favour of the higher intensity product. For analog
+    searches `precursor_tolerance` is the mass window of the analogs, e.g. 100 to
+    score library spectra whose precursor m/z differs by up to 100.
+
+    With `open_search` the precursor m/z is ignored and the candidates are the
+    library spectra that share fragments with a query. They are retrieved from the
+    fragment index of the library, which is built on the fly if the library was
+    compiled without it. Only pairs that share unshifted fragments are scored.
+    With the "cosine" method, pairs whose shared fragments cannot reach
+    `min_score` are dropped before scoring.
+
+    The MS2 spectra are read from `spectra` or, if it is not given, from the
+    spectra files stored in a self-contained XCMSExperiment.
+
+    The batches of queries are matched by `n_jobs` worker processes. The spectra
+    are written to .npy files once and memory-mapped by the workers, and the
+    matches are written in the order of the batches, so the output does not depend
+    on the number of workers.
+    """
+    if spectra is not None:
+        spectra_path = str(spectra)
+    elif xcms_experiment.spectra_path is not None:
+        spectra_path = xcms_experiment.spectra_path
+    else:
+        raise ValueError(
+            "The XCMSExperiment does not contain its spectra files. Please provide "
+            "the mzML files it was read from."
+        )
+    queries = _read_queries(xcms_experiment.backend_data, spectra_path)
+    targets = _read_library(library)
+    n_queries = len(queries.ids)
+    batch_size = OPEN_SEARCH_BATCH_SIZE if open_search else BATCH_SIZE
+    batches = [
+        (start, min(start + batch_size, n_queries))
+        for start in range(0, n_queries, batch_size)
+    ]
+    params = {
+        "ppm": ppm,
+        "tolerance": tolerance,
+        "modified": method == "modified_cosine",
+        "min_score": min_score,
+        "precursor_tolerance": precursor_tolerance,
+    }
+
+    result = MatchedSpectraDirFmt()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_dir = None
+        if open_search:
+            index_dir = str(library)
+            if not library.has_fragment_index:
+                index_dir = tmp_dir
+                build_fragment_index(*library.read_peaks(), tmp_dir, DEFAULT_BIN_WIDTH)
+
+        if n_jobs > 1 and len(batches) > 1:
+            # The workers memory-map the spectra instead of receiving copies
+            queries.save(tmp_dir, "queries")
+            targets.save(tmp_dir, "targets")
+            executor = ProcessPoolExecutor(
+                max_workers=min(n_jobs, len(batches)),
+                initializer=_init_worker,
+                initargs=(tmp_dir, index_dir),
+            )
+            matches = executor.map(_match_worker_batch, batches, repeat(params))
+        else:
+            executor = None
+            fragment_index = read_fragment_index(index_dir) if index_dir else None
+            matches = (
+                _match_batch(queries, targets, fragment_index, batch, **params)
+                for batch in batches
+            )
+
+        try:
+            _write_matches(result, queries, targets, matches)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    return result
+
+
+def _write_matches(result, queries, targets, matches):
+    """
+    Writes the matches of all batches to the matched spectra table in the order of
+    the batches.
+    """
+    with open(os.path.join(str(result), "matched_spectra.txt"), "w") as f:
+        f.write("\t".join(MATCHED_SPECTRA_COLUMNS) + "\n")
+        for query_index, target_index, scores in matches:
+            pd.DataFrame(
+                {
+                    ".original_query_index": queries.ids[query_index],
+                    "target_spectrum_id": targets.ids[target_index],
+                    "score": scores,
+                }
+            ).to_csv(f, sep="\t", index=False, header=False)
+
+
+def _match_batch(
+    queries,
+    targets,
+    fragment_index,
+    batch,
+    ppm,
+    tolerance,
+    modified,
+    min_score,
+    precursor_tolerance,
+):
+    """
+    Matches the queries at the positions batch[0]:batch[1] against the targets.
+    Returns the query positions, target positions and scores of all matches with
+    a score of at least `min_score`.
+    """
+    batch = np.arange(*batch)
+    if fragment_index is not None:
+        # The bound of the unshifted fragments does not hold for modified cosine
+        pair_query, pair_target = _open_search_candidates(
+            queries,
+            batch,
+            fragment_index,
+            len(targets.ids),
+            ppm,
+            tolerance,
+            0 if modified else min_score,
+        )
+    else:
+        pair_query, pair_target = _precursor_candidates(
+            queries, targets, batch, ppm, tolerance, precursor_tolerance
+        )
+    query_index, target_index, scores = _score_pairs(
+        queries, targets, pair_query, pair_target, ppm, tolerance, modified
+    )
+    keep = scores >= min_score
+    return query_index[keep], target_index[keep], scores[keep]
+
+
+# Spectra and fragment index of a worker process, set by _init_worker
+_worker_data = {}
+
+
+def _init_worker(directory, index_dir):
+    _worker_data["queries"] = _Spectra.load(directory, "queries")
+    _worker_data["targets"] = _Spectra.load(directory, "targets")
+    _worker_data["fragment_index"] = (
+        read_fragment_index(index_dir) if index_dir else None
+    )
+
+
+def _match_worker_batch(batch, params):
+    return _match_batch(
+        _worker_data["queries"],
+        _worker_data["targets"],
+        _worker_data["fragment_index"],
+        batch,
+        **params,
+    )
+
+
+class _Spectra:
+    """
+    Peaks of several spectra in contiguous arrays. The peaks of spectrum i are at
+    offsets[i]:offsets[i + 1] and are sorted by m/z. The intensities are square
+    root scaled and `norms` holds the norm of the intensities of every spectrum.
+    """
+
+    def __init__(self, ids, precursor_mz, offsets, mz, intensity):
+        counts = np.diff(offsets)
+        spectrum = np.repeat(np.arange(len(counts)), counts)
+        order = np.lexsort((mz, spectrum))
+
+        self.ids = np.asarray(ids)
+        self.precursor_mz = np.asarray(precursor_mz, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.mz = np.asarray(mz, dtype=np.float64)[order]
+        self.intensity = np.sqrt(np.asarray(intensity, dtype=np.float64)[order])
+        self.norms = np.sqrt(
+            np.bincount(spectrum, self.intensity**2, minlength=len(counts))
+        )
+
+    def save(self, directory, prefix):
+        """
+        Writes all arrays to .npy files so that other processes can memory-map them.
+        """
+        for name, values in vars(self).items():
+            np.save(os.path.join(directory, f"{prefix}_{name}.npy"), values)
+
+    @classmethod
+    def load(cls, directory, prefix):
+        """
+        Memory-maps the arrays written by save.
+        """
+        spectra = cls.__new__(cls)
+        for filename in os.listdir(directory):
+            if filename.startswith(f"{prefix}_") and filename.endswith(".npy"):
+                setattr(
+                    spectra,
+                    filename[len(prefix) + 1 : -len(".npy")],
+                    np.load(os.path.join(directory, filename), mmap_mode="r"),
+                )
+        return spectra
+
+
+def _read_queries(backend_data, spectra_path):
+    """
+    Reads the MS2 spectra of the experiment from the mzML files. The spectra of
+    the backend data are found in the mzML files by file name and scan index. The
+    IDs of the queries are their 1-based positions in the backend data.
+    """
+    ms2 = backend_data[backend_data["msLevel"] == 2]
+    files = [
+        strip_compression_suffix(os.path.basename(path)) for path in ms2["dataStorage"]
+    ]
+    rows = dict(zip(zip(files, ms2["scanIndex"].astype(int)), ms2.index + 1))
+    names = set(files)
+
+    queries = []
+    for filename in sorted(os.listdir(spectra_path)):
+        name = strip_compression_suffix(filename)
+        if name not in names:
+            continue
+        for index, _, _, precursor_mz, mz, intensity in iter_mzml_spectra(
+            os.path.join(spectra_path, filename), {2}
+        ):
+            # The scan index is the 1-based position of a spectrum in its file
+            query_id = rows.get((name, index + 1))
+            if query_id is not None:
+                queries.append((query_id, precursor_mz, mz, intensity))
+
+    queries.sort(key=lambda query: query[0])
+    return _Spectra(
+        [query[0] for query in queries],
+        [query[1] for query in queries],
+        np.cumsum([0] + [len(query[2]) for query in queries]),
+        np.concatenate([query[2] for query in queries] or [np.empty(0)]),
+        np.concatenate([query[3] for query in queries] or [np.empty(0)]),
+    )
+
+
+def _read_library(library):
+    """
+    Reads the library spectra. Their IDs are the DB# values of the library or
+    their 1-based positions if the DB# is missing.
+    """
+    metadata = library.read_metadata()
+    columns = {
+        column.lower().replace("_", "").replace(" ", ""): column
+        for column in metadata.columns
+    }
+    positions = np.arange(1, len(metadata) + 1).astype(str)
+
+    precursor_mz = np.full(len(metadata), np.nan)
+    if _PRECURSOR_MZ_KEY in columns:
+        precursor_mz = pd.to_numeric(
+            metadata[columns[_PRECURSOR_MZ_KEY]], errors="coerce"
+        ).to_numpy(dtype=np.float64)
+    ids = positions
+    if _ID_KEY in columns:
+        ids = metadata[columns[_ID_KEY]].to_numpy(dtype=str)
+        ids = np.where(ids == "", positions, ids)
+
+    offsets, mz, intensity = library.read_peaks()
+    targets = _Spectra(ids, precursor_mz, offsets, mz, intensity)
+    # Spectra without precursor m/z are sorted to the end and left out of the
+    # sorted precursor m/z values, so they are never matched
+    targets.precursor_order = np.argsort(precursor_mz, kind="stable")
+    sorted_precursor_mz = precursor_mz[targets.precursor_order]
+    targets.sorted_precursor_mz = sorted_precursor_mz[~np.isnan(sorted_precursor_mz)]
+    return targets
+
+
+def _precursor_candidates(queries, targets, batch, ppm, tolerance, precursor_tolerance):
+    """
+    Returns the query and target positions of all pairs of the queries at the
+    positions `batch` and the targets with a precursor m/z within
+    `precursor_tolerance`, or within `ppm` and `tolerance` if it is None.
+    """
+    precursor_mz = queries.precursor_mz[batch]
+    if precursor_tolerance is None:
+        window = tolerance + precursor_mz * ppm * 1e-6
+    else:
+        window = np.full(len(batch), float(precursor_tolerance))
+    start = np.searchsorted(targets.sorted_precursor_mz, precursor_mz - window, "left")
+    end = np.searchsorted(targets.sorted_precursor_mz, precursor_mz + window, "right")
+    # Queries without precursor m/z are not matched
+    counts = np.where(np.isfinite(precursor_mz), np.maximum(end - start, 0), 0)
+
+    return np.repeat(batch, counts), targets.precursor_order[_ranges(start, counts)]
+
+
+def _open_search_candidates(
+    queries, batch, fragment_index, n_targets, ppm, tolerance, min_score
+):
+    """
+    Returns the query and target positions of the pairs of the queries at the
+    positions `batch` and all targets that share fragments with them. The
+    fragments of the queries are looked up in the fragment index of the library
+    and the weights of the shared fragments are accumulated per pair. As every
+    fragment is looked up in all bins within `ppm` and `tolerance`, the
+    accumulated weight is an upper bound of the cosine score and pairs below
+    `min_score` are dropped without scoring them. The weights are float32, so the
+    bound is compared with a tolerance of SCORE_BOUND_EPSILON.
+    """
+    bin_width, bin_offsets, spectra, weights = fragment_index
+    counts = queries.offsets[batch + 1] - queries.offsets[batch]
+    peaks = _ranges(queries.offsets[batch], counts)
+    peak_query = np.repeat(batch, counts)
+    if not len(peaks):
+        return peak_query, peak_query
+    peak_weights = queries.intensity[peaks] / queries.norms[peak_query]
+
+    # Number of neighbouring bins that can hold matching fragments
+    max_distance = tolerance + 2 * queries.mz[peaks].max() * ppm * 1e-6
+    reach = int(np.ceil(max_distance / bin_width))
+    bins = np.floor(queries.mz[peaks] / bin_width).astype(np.int64)
+    bins = (bins[:, None] + np.arange(-reach, reach + 1)).ravel()
+    peak_query = np.repeat(peak_query, 2 * reach + 1)
+    peak_weights = np.repeat(peak_weights, 2 * reach + 1)
+    valid = (bins >= 0) & (bins < len(bin_offsets) - 1)
+    bins, peak_query, peak_weights = bins[valid], peak_query[valid], peak_weights[valid]
+
+    starts = bin_offsets[bins]
+    counts = bin_offsets[bins + 1] - starts
+    postings = _ranges(starts, counts)
+    keys = np.repeat(peak_query, counts) * n_targets + spectra[postings]
+    pairs, inverse = np.unique(keys, return_inverse=True)
+    bounds = np.bincount(inverse, np.repeat(peak_weights, counts) * weights[postings])
+
+    pairs = pairs[bounds >= min_score - SCORE_BOUND_EPSILON]
+    return pairs // n_targets, pairs % n_targets
+
+
+def _score_pairs(queries, targets, pair_query, pair_target, ppm, tolerance, modified):
+    """
+    Scores pairs of queries and targets. Returns the query positions, target
+    positions and scores of all pairs sorted by query and decreasing score.
+    """
+    if not len(pair_query):
+        return pair_query, pair_target, np.empty(0)
+
+    # Peaks of the query and the target of every pair
+    query_pair, query_peak = _expand(queries.offsets, pair_query)
+    target_pair, target_peak = _expand(targets.offsets, pair_target)
+    query_mz = queries.mz[query_peak]
+    target_mz = targets.mz[target_peak]
+
+    shifts = [np.zeros(len(pair_query))]
+    if modified:
+        shift = queries.precursor_mz[pair_query] - targets.precursor_mz[pair_target]
+        # Pairs of open searches can lack a precursor m/z and are not shifted
+        shifts.append(np.where(np.isfinite(shift), shift, 0.0))
+
+    matches = [
+        _match_peaks(
+            query_pair,
+            query_mz - shift[query_pair],
+            target_pair,
+            target_mz,
+            ppm,
+            tolerance,
+        )
+        for shift in shifts
+    ]
+    query_match = np.concatenate([match[0] for match in matches])
+    target_match = np.concatenate([match[1] for match in matches])
+
+    # Match every peak only once, starting with the highest intensity products
+    products = (
+        queries.intensity[query_peak[query_match]]
+        * targets.intensity[target_peak[target_match]]
+    )
+    order = np.argsort(-products, kind="stable")
+    query_match, target_match, products = (
+        query_match[order],
+        target_match[order],
+        products[order],
+    )
+    keep = _first_occurrences(query_match)
+    query_match, target_match, products = (
+        query_match[keep],
+        target_match[keep],
+        products[keep],
+    )
+    keep = _first_occurrences(target_match)
+
+    dot = np.bincount(
+        query_pair[query_match[keep]], products[keep], minlength=len(pair_query)
+    )
+    norms = queries.norms[pair_query] * targets.norms[pair_target]
+    scores = np.divide(dot, norms, out=np.zeros(len(dot)), where=norms > 0)
+
+    order = np.lexsort((-scores, pair_query))
+    return pair_query[order], pair_target[order], scores[order]
+
+
+def _match_peaks(query_pair, query_mz, target_pair, target_mz, ppm, tolerance):
+    """
+    Matches every query peak to the closest target peak of the same pair. The
+    target peaks must be sorted by pair and m/z. Returns the positions of the
+    query and target peaks of all matches within `ppm` and `tolerance`.
+    """
+    # Place the peaks of every pair in a separate m/z band to search all pairs
+    # at once
+    band = 2 * (max(query_mz.max(initial=0), target_mz.max(initial=0)) + 1)
+    position = np.searchsorted(
+        target_pair * band + target_mz,
+        query_pair * band + np.clip(query_mz, 0, band / 2),
+    )
+    left = np.clip(position - 1, 0, len(target_mz) - 1)
+    right = np.clip(position, 0, len(target_mz) - 1)
+
+    left_diff = np.where(
+        target_pair[left] == query_pair, np.abs(target_mz[left] - query_mz), np.inf
+    )
+    right_diff = np.where(
+        target_pair[right] == query_pair, np.abs(target_mz[right] - query_mz), np.inf
+    )
+    closest = np.where(left_diff <= right_diff, left, right)
+    diff = np.minimum(left_diff, right_diff)
+
+    matched = diff <= tolerance + target_mz[closest] * ppm * 1e-6
+    return np.flatnonzero(matched), closest[matched]
+
+
+def _expand(offsets, spectra):
+    """
+    Returns the pair and the peak position of all peaks of `spectra`.
+    """
+    counts = offsets[spectra + 1] - offsets[spectra]
+    return np.repeat(np.arange(len(spectra)), counts), _ranges(offsets[spectra], counts)
+
+
+def _ranges(starts, counts):
+    """
+    Concatenates the ranges starts[i]:starts[i] + counts[i].
+    """
+    ends = np.cumsum(counts)
+    total = ends[-1] if len(ends) else 0
+    return np.repeat(starts - ends + counts, counts) + np.arange(total)
+
+
+def _first_occurrences(values):
+    """
+    Returns a mask of the first occurrence of every value.
+    """
+    keep = np.zeros(len(values), dtype=bool)
+    keep[np.unique(values, return_index=True)[1]] = True
+    return keep
@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+
+import pandas as pd
+
+from q2_ms.types import MatchedSpectraDirFmt
+from q2_ms.types._matched_spectra import MATCHED_SPECTRA_COLUMNS
+
+CHUNK_SIZE = 1_000_000
+
+
+def filter_matched_spectra(
+    matched_spectra: MatchedSpectraDirFmt,
+    top_k: int = None,
+    min_score: float = None,
+) -> MatchedSpectraDirFmt:
+    """
+    Filters matched spectra by score. The table is read in chunks of CHUNK_SIZE
+    rows and only the best `top_k` matches per query that reach `min_score` are
+    kept between chunks, so memory usage does not depend on the size of the
+    table.
+    """
+    if top_k is None and min_score is None:
+        raise ValueError("At least one of 'top_k' and 'min_score' must be set.")
+
+    result = MatchedSpectraDirFmt()
+    output_path = os.path.join(str(result), "matched_spectra.txt")
+
+    reader = pd.read_csv(
+        os.path.join(str(matched_spectra), "matched_spectra.txt"),
+        sep="\t",
+        dtype={
+            ".original_query_index": "int64",
+            "target_spectrum_id": str,
+            "score": "float64",
+        },
+        chunksize=CHUNK_SIZE,
+    )
+    kept = None
+    with reader, open(output_path, "w") as f:
+        f.write("\t".join(MATCHED_SPECTRA_COLUMNS) + "\n")
+        for chunk in reader:
+            if min_score is not None:
+                chunk = chunk[chunk["score"] >= min_score]
+
+            if top_k is None:
+                # Without top_k the rows can be written right away
+                chunk.to_csv(f, sep="\t", index=False, header=False)
+            else:
+                kept = chunk if kept is None else pd.concat([kept, chunk])
+                kept = _top_k(kept, top_k)
+
+        if kept is not None:
+            kept.sort_values(
+                [".original_query_index", "score"],
+                ascending=[True, False],
+                kind="stable",
+            ).to_csv(f, sep="\t", index=False, header=False)
+
+    return result
+
+
+def _top_k(df, k):
+    """
+    Keeps the `k` rows with the highest scores per query. Ties are resolved in
+    favour of earlier rows.
+    """
+    return (
+        df.sort_values("score", ascending=False, kind="stable")
+        .groupby(".original_query_index", sort=False)
+        .head(k)
+    )
@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import math
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from q2_ms.types._compression import strip_compression_suffix
+from q2_ms.types._ms_backend import MS_BACKEND_HEADER
+from q2_ms.types._mzml import iter_mzml_headers, scan_number
+from q2_ms.xcms.utils import BACKEND_DATA_FILENAME, LINKS_FILENAME, SAMPLE_DATA_FILENAME
+
+# Columns of ms_backend_data.txt as exported by MsIO for an MsBackendMzR
+MS_BACKEND_MZR_COLUMNS = [
+    "msLevel",
+    "rtime",
+    "acquisitionNum",
+    "dataOrigin",
+    "polarity",
+    "precScanNum",
+    "precursorMz",
+    "precursorIntensity",
+    "precursorCharge",
+    "collisionEnergy",
+    "peaksCount",
+    "totIonCurrent",
+    "basePeakMZ",
+    "basePeakIntensity",
+    "ionisationEnergy",
+    "lowMZ",
+    "highMZ",
+    "mergedScan",
+    "mergedResultScanNum",
+    "mergedResultStartScanNum",
+    "mergedResultEndScanNum",
+    "injectionTime",
+    "spectrumId",
+    "ionMobilityDriftTime",
+    "dataStorage",
+    "scanIndex",
+]
+
+# Slots of a Spectra object that was just created by readMsExperiment
+_EMPTY_PROCESSING_QUEUE = json.dumps(
+    {"type": "list", "attributes": {}, "value": []}, separators=(",", ":")
+)
+
+
+def write_ms_experiment(
+    spectra_path, output_path, sample_metadata=None, n_jobs=1, chunk_size=None
+):
+    """
+    Writes the plain text files of an MsExperiment with an MsBackendMzR as
+    MsIO::saveMsObject does for MsExperiment::readMsExperiment, without R. Only
+    the spectrum headers are read, see iter_mzml_headers, and the peak arrays are
+    not decoded. The files are parsed in parallel by `n_jobs` processes and their
+    rows are concatenated in the order of the files, so the output does not
+    depend on the number of processes.
+
+    Parameters:
+        spectra_path (str):
+            Directory with the mzML files. The files are read in sorted order.
+        output_path (str):
+            Directory the files are written to.
+        sample_metadata (pd.DataFrame):
+            Sample metadata indexed by the file names without extensions.
+        n_jobs (int):
+            Number of processes that parse the mzML files.
+        chunk_size (int):
+            Processing chunk size stored in spectra_slots.txt.
+    """
+    paths = [
+        os.path.realpath(os.path.join(spectra_path, filename))
+        for filename in sorted(os.listdir(spectra_path))
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        part_paths = [os.path.join(tmp_dir, f"{i}.txt") for i in range(len(paths))]
+        if n_jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                n_spectra = list(executor.map(_write_backend_rows, paths, part_paths))
+        else:
+            n_spectra = list(map(_write_backend_rows, paths, part_paths))
+
+        with open(os.path.join(output_path, BACKEND_DATA_FILENAME), "w") as dst:
+            dst.write(f"{MS_BACKEND_HEADER}\n")
+            dst.write(_format_row(MS_BACKEND_MZR_COLUMNS) + "\n")
+            row_number = 0
+            for part_path in part_paths:
+                with open(part_path) as src:
+                    for line in src:
+                        row_number += 1
+                        dst.write(f'"{row_number}"\t{line}')
+
+    with open(os.path.join(output_path, LINKS_FILENAME), "w") as f:
+        spectrum = 0
+        for sample, count in enumerate(n_spectra, 1):
+            for _ in range(count):
+                spectrum += 1
+                f.write(f"{sample}\t{spectrum}\n")
+
+    _write_sample_data(
+        os.path.join(output_path, SAMPLE_DATA_FILENAME), paths, sample_metadata
+    )
+
+    with open(os.path.join(output_path, "ms_experiment_link_mcols.txt"), "w") as f:
+        f.write('"subsetBy"\n"1"\t1\n')
+    with open(os.path.join(output_path, "spectra_processing_queue.json"), "w") as f:
+        json.dump([_EMPTY_PROCESSING_QUEUE], f)
+    with open(os.path.join(output_path, "spectra_slots.txt"), "w") as f:
+        f.write(
+            "processingQueueVariables = \n"
+            "processing = \n"
+            f"processingChunkSize = {chunk_size or 'Inf'}\n"
+            "backend = MsBackendMzR\n"
+        )
+
+
+def _write_backend_rows(path, output_path):
+    """
+    Writes the rows of ms_backend_data.txt for the spectra of an mzML file without
+    row names and returns the number of spectra.
+    """
+    n_spectra = 0
+    with open(output_path, "w") as f:
+        for header in iter_mzml_headers(path):
+            f.write(_format_row(_backend_row(header, path)) + "\n")
+            n_spectra += 1
+    return n_spectra
+
+
+def _backend_row(header, path):
+    """
+    Returns the values of the MsBackendMzR columns of a spectrum header, see
+    iter_mzml_headers. Missing values are -1 as reported by mzR, e.g. the
+    precursor values of MS1 spectra, the precursor scan of precursors without
+    scan number and the ionisation energy, which mzML files do not contain.
+    """
+    ms1 = header["ms_level"] == 1
+
+    def precursor(value):
+        return -1 if ms1 or value is None else value
+
+    def value(key):
+        return -1 if header[key] is None else header[key]
+
+    # mzML files have no merged scans, which mzR reports as -1
+    return [
+        header["ms_level"],
+        header["rtime"],
+        scan_number(header["id"], header["index"]),
+        path,
+        value("polarity"),
+        precursor(scan_number(header["precursor_id"], None)),
+        precursor(header["precursor_mz"]),
+        precursor(header["precursor_intensity"]),
+        precursor(header["precursor_charge"]),
+        precursor(header["collision_energy"]),
+        header["peaks_count"],
+        value("total_ion_current"),
+        value("base_peak_mz"),
+        value("base_peak_intensity"),
+        -1,
+        value("lowest_mz"),
+        value("highest_mz"),
+        -1,
+        -1,
+        -1,
+        -1,
+        value("injection_time"),
+        header["id"],
+        value("ion_mobility_drift_time"),
+        path,
+        header["index"] + 1,
+    ]
+
+
+def _write_sample_data(path, spectra_paths, sample_metadata):
+    """
+    Writes the sample data with one row per spectra file. Without sample metadata
+    the samples are numbered in the column "sample_index", otherwise the metadata
+    of the samples is used. The path of the file is added as "spectraOrigin".
+    """
+    if sample_metadata is None:
+        columns = ["sample_index"]
+        rows = [[i] for i in range(1, len(spectra_paths) + 1)]
+    else:
+        ids = [
+            os.path.splitext(strip_compression_suffix(os.path.basename(p)))[0]
+            for p in spectra_paths
+        ]
+        metadata = sample_metadata.loc[ids]
+        # read.table turns the column names into syntactically valid R names
+        columns = [
+            _make_name(name) for name in [metadata.index.name, *metadata.columns]
+        ]
+        rows = [[sample_id, *values] for sample_id, values in zip(ids, metadata.values)]
+
+    with open(path, "w") as f:
+        f.write(_format_row([*columns, "spectraOrigin"]) + "\n")
+        for i, (row, spectra_path) in enumerate(zip(rows, spectra_paths), 1):
+            f.write(_format_row([str(i), *row, spectra_path]) + "\n")
+
+
+def _make_name(name):
+    """
+    Returns a syntactically valid R name like make.names, e.g. "sample.id" for
+    "sample-id" and "X1" for "1".
+    """
+    name = re.sub(r"[^0-9A-Za-z._]", ".", str(name))
+    if not re.match(r"[A-Za-z]|\.(?![0-9])", name):
+        name = "X" + name
+    return name
+
+
+def _format_row(values):
+    return "\t".join(_format_value(value) for value in values)
+
+
+def _format_value(value):
+    """
+    Formats a value as written by R's write.table: strings are quoted, numbers
+    have up to 15 significant digits and missing values are NA.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NA"
+    if isinstance(value, str):
+        return '"' + value.replace('"', '\\"') + '"'
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "Inf" if value > 0 else "-Inf"
+        return f"{value:.15g}"
+    return str(value)
@@ -0,0 +1,44 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from q2_ms.types import XCMSExperimentDirFmt, XCMSExperimentParquetDirFmt
+
+
+def convert_ms_experiment_to_parquet(
+    xcms_experiment: XCMSExperimentParquetDirFmt,
+) -> XCMSExperimentParquetDirFmt:
+    """
+    Stores an XCMSExperiment with its spectra and chromatographic peaks as
+    Parquet tables. The conversion is done by the transformer from
+    XCMSExperimentDirFmt to XCMSExperimentParquetDirFmt.
+
+    Parameters:
+        xcms_experiment (XCMSExperimentParquetDirFmt):
+            XCMSExperiment in the Parquet layout.
+
+    Returns:
+        XCMSExperimentParquetDirFmt: The same experiment.
+    """
+    return xcms_experiment
+
+
+def convert_ms_experiment_to_text(
+    xcms_experiment: XCMSExperimentDirFmt,
+) -> XCMSExperimentDirFmt:
+    """
+    Stores an XCMSExperiment in the Parquet layout as the plain text files read
+    by R. The conversion is done by the transformer from
+    XCMSExperimentParquetDirFmt to XCMSExperimentDirFmt.
+
+    Parameters:
+        xcms_experiment (XCMSExperimentDirFmt):
+            XCMSExperiment in the plain text layout.
+
+    Returns:
+        XCMSExperimentDirFmt: The same experiment.
+    """
+    return xcms_experiment
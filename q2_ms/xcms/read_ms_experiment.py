@@ -5,46 +5,200 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
-import copy
 import os
+import shutil
 import tempfile
+import warnings
 
 from qiime2 import Metadata
 
 from q2_ms.types import XCMSExperimentDirFmt, mzMLDirFmt
-from q2_ms.utils import run_r_script
+from q2_ms.types._compression import (
+    decompress,
+    get_compression,
+    strip_compression_suffix,
+)
+from q2_ms.types._xcms_experiment import SPECTRA_DIRNAME
+from q2_ms.utils import link_file, run_r_script, store_resource_usage
+from q2_ms.xcms.ms_backend import write_ms_experiment
 
 
 def read_ms_experiment(
     spectra: mzMLDirFmt,
     sample_metadata: Metadata = None,
+    n_jobs: int = 1,
+    chunk_size: int = None,
+    engine: str = "r",
 ) -> XCMSExperimentDirFmt:
-    # Create parameters dict
-    params = copy.copy(locals())
-
     # Init XCMSExperimentDirFmt
     xcms_experiment = XCMSExperimentDirFmt()
 
-    # Add output path to params
-    params["output_path"] = str(xcms_experiment)
-
     with tempfile.TemporaryDirectory() as tmp_dir:
+        sample_metadata_table = None
         if sample_metadata is not None:
             # Validate sample metadata IDs
             sample_metadata_table = sample_metadata.to_dataframe()
             _validate_metadata(sample_metadata_table, str(spectra))
 
-            # Save sample metadata to tsv and add to params
-            tsv_path = os.path.join(tmp_dir, "sample_metadata.tsv")
-            sample_metadata_table.to_csv(tsv_path, sep="\t")
-            params["sample_metadata"] = tsv_path
+        spectra_path = _prepare_spectra(str(spectra), tmp_dir)
+        usage = _read_spectra(
+            spectra_path,
+            str(xcms_experiment),
+            sample_metadata_table,
+            tmp_dir,
+            n_jobs,
+            chunk_size,
+            engine,
+        )
 
-        # Run R script
-        run_r_script("read_ms_experiment", params, "XCMS")
+        _store_spectra(str(xcms_experiment), spectra_path)
+
+    if usage is not None:
+        store_resource_usage(str(xcms_experiment), usage)
 
     return xcms_experiment
 
 
+def _read_spectra(
+    spectra_path, output_path, sample_metadata, tmp_dir, n_jobs, chunk_size, engine
+):
+    """
+    Reads the spectra files into an MsExperiment and exports it to `output_path`.
+    The "r" engine runs MsExperiment::readMsExperiment and MsIO::saveMsObject. The
+    "python" engine writes the same files without R, see write_ms_experiment.
+
+    Returns:
+        dict: Resource usage of the R script or None for the "python" engine.
+    """
+    if engine == "python":
+        write_ms_experiment(
+            spectra_path, output_path, sample_metadata, n_jobs, chunk_size
+        )
+        return None
+
+    params = {
+        "spectra": spectra_path,
+        "sample_metadata": None,
+        "output_path": output_path,
+        "n_jobs": n_jobs,
+        "chunk_size": chunk_size,
+    }
+    if sample_metadata is not None:
+        # Save sample metadata to tsv and add to params
+        tsv_path = os.path.join(tmp_dir, "sample_metadata.tsv")
+        sample_metadata.to_csv(tsv_path, sep="\t")
+        params["sample_metadata"] = tsv_path
+
+    # Run R script
+    return run_r_script("read_ms_experiment", params, "XCMS")
+
+
+def _store_spectra(xcms_experiment_path, spectra_path):
+    """
+    Makes an XCMSExperiment self-contained. The spectra files read by R are
+    linked into its spectra directory, see link_file, and the spectra paths in
+    the backend and sample data are replaced by paths relative to the experiment.
+    The experiment keeps the original paths if the files can't be linked without
+    copying them, e.g. because they are on another file system.
+
+    Parameters:
+        xcms_experiment_path (str):
+            Path to the XCMSExperimentDirFmt.
+        spectra_path (str):
+            Path to the directory with the spectra files read by R.
+    """
+    output_dir = os.path.join(xcms_experiment_path, SPECTRA_DIRNAME)
+    os.mkdir(output_dir)
+    filenames = sorted(os.listdir(spectra_path))
+    try:
+        for filename in filenames:
+            link_file(
+                os.path.realpath(os.path.join(spectra_path, filename)),
+                os.path.join(output_dir, filename),
+            )
+    except OSError as e:
+        warnings.warn(
+            f"The spectra files are not stored in the XCMSExperiment: {e}",
+            UserWarning,
+        )
+        shutil.rmtree(output_dir)
+        return
+
+    # R records the resolved paths of the files, so they are matched by name
+    relative_paths = {
+        filename: f"{SPECTRA_DIRNAME}/{filename}" for filename in filenames
+    }
+    for filename, columns in (
+        ("ms_backend_data.txt", ["dataStorage", "dataOrigin"]),
+        ("ms_experiment_sample_data.txt", ["spectraOrigin"]),
+    ):
+        _replace_paths(
+            os.path.join(xcms_experiment_path, filename), columns, relative_paths
+        )
+
+
+def _replace_paths(path, columns, relative_paths):
+    """
+    Replaces the paths in `columns` of a table exported by MsIO with the relative
+    paths of their file names. The table is rewritten line by line to keep the
+    quoting of R.
+    """
+    tmp_path = path + ".tmp"
+    with open(path) as src, open(tmp_path, "w") as dst:
+        line = src.readline()
+        # Comment lines like "# MsBackendMzR" precede the header
+        while line.startswith("#"):
+            dst.write(line)
+            line = src.readline()
+        dst.write(line)
+
+        # The rows start with the row name, which has no header
+        header = [name.strip('"') for name in line.rstrip("\n").split("\t")]
+        positions = [header.index(column) + 1 for column in columns if column in header]
+
+        for line in src:
+            fields = line.rstrip("\n").split("\t")
+            for i in positions:
+                filename = os.path.basename(fields[i].strip('"'))
+                if filename in relative_paths:
+                    fields[i] = f'"{relative_paths[filename]}"'
+            dst.write("\t".join(fields) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _prepare_spectra(spectra_path, tmp_dir):
+    """
+    Returns a directory with the spectra files that can be read by R. mzR reads
+    plain and gzip-compressed mzML files directly but not zstd-compressed ones.
+    If there are zstd-compressed files, they are decompressed into `tmp_dir`
+    and all other files are linked next to them.
+
+    Parameters:
+        spectra_path (str):
+            Path to the directory containing spectra files.
+        tmp_dir (str):
+            Temporary directory that exists while R is running.
+
+    Returns:
+        str: Path to the directory with the spectra files.
+    """
+    filenames = sorted(os.listdir(spectra_path))
+    paths = [os.path.join(spectra_path, f) for f in filenames]
+    if not any(get_compression(path) == "zstd" for path in paths):
+        return spectra_path
+
+    output_dir = os.path.join(tmp_dir, "spectra")
+    os.mkdir(output_dir)
+    for filename, path in zip(filenames, paths):
+        if get_compression(path) == "zstd":
+            decompress(
+                path, os.path.join(output_dir, strip_compression_suffix(filename))
+            )
+        else:
+            os.symlink(os.path.abspath(path), os.path.join(output_dir, filename))
+    return output_dir
+
+
 def _validate_metadata(metadata, spectra_path):
     """
     Validates that sample IDs in the metadata match the filenames in the spectra
@@ -68,7 +222,7 @@ def _validate_metadata(metadata, spectra_path):
     metadata_set = set(metadata.index.astype(str))
 
     spectra_set = {
-        os.path.splitext(f)[0]
+        os.path.splitext(strip_compression_suffix(f))[0]
         for f in os.listdir(spectra_path)
         if os.path.isfile(os.path.join(spectra_path, f))
     }
@@ -0,0 +1,504 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import shutil
+from collections import Counter
+from contextlib import ExitStack
+
+import numpy as np
+
+from q2_ms.types import XCMSExperimentDirFmt, XCMSExperimentReader, mzMLDirFmt
+from q2_ms.types._compression import strip_compression_suffix
+from q2_ms.types._xcms_experiment import SPECTRA_DIRNAME
+from q2_ms.utils import RESOURCE_USAGE_FILENAME
+from q2_ms.xcms.utils import (
+    BACKEND_DATA_FILENAME,
+    LINKS_FILENAME,
+    SAMPLE_DATA_FILENAME,
+    concat_links,
+    concat_tables,
+    link_spectra_file,
+    read_table_header,
+)
+
+CHROM_PEAKS_FILENAME = "xcms_experiment_chrom_peaks.txt"
+CHROM_PEAK_DATA_FILENAME = "xcms_experiment_chrom_peak_data.txt"
+PROCESS_HISTORY_FILENAME = "xcms_experiment_process_history.json"
+FEATURE_FILENAMES = [
+    "xcms_experiment_feature_definitions.txt",
+    "xcms_experiment_feature_peak_index.txt",
+]
+
+# Process history type of the correspondence analysis, which relates samples
+_PEAK_GROUPING = "Peak grouping"
+
+# Files that are rewritten or dropped when an experiment is split or merged. All
+# other files, e.g. the slots, are the same for all shards.
+_SHARDED_FILENAMES = [
+    BACKEND_DATA_FILENAME,
+    SAMPLE_DATA_FILENAME,
+    LINKS_FILENAME,
+    CHROM_PEAKS_FILENAME,
+    CHROM_PEAK_DATA_FILENAME,
+    PROCESS_HISTORY_FILENAME,
+    RESOURCE_USAGE_FILENAME,
+    SPECTRA_DIRNAME,
+    *FEATURE_FILENAMES,
+]
+
+
+def split_ms_experiment(
+    xcms_experiment: XCMSExperimentDirFmt, samples_per_shard: int = 1
+) -> XCMSExperimentDirFmt:
+    """
+    Splits an XCMSExperiment into shards of `samples_per_shard` consecutive
+    samples. The plain text tables are split line by line. Spectra, samples and
+    chromatographic peaks are numbered from 1 within every shard, the links
+    between samples and spectra and the sample indices of the peaks are
+    re-indexed accordingly. Features are dropped, as done by XCMS when samples are
+    subset, because they relate the peaks of different samples.
+
+    Parameters:
+        xcms_experiment (XCMSExperimentDirFmt):
+            Experiment to split.
+        samples_per_shard (int):
+            Number of samples per shard. The last shard can have fewer samples.
+
+    Returns:
+        dict: Shards named "shard_1", "shard_2", ... in the order of the samples.
+    """
+    path = str(xcms_experiment)
+    n_samples = _count_rows(os.path.join(path, SAMPLE_DATA_FILENAME))
+    sample_shards = np.arange(n_samples) // samples_per_shard
+    local_samples = np.arange(n_samples) % samples_per_shard + 1
+    n_shards = int(sample_shards[-1]) + 1 if n_samples else 0
+
+    width = len(str(n_shards))
+    shards = {
+        f"shard_{i + 1:0{width}d}": XCMSExperimentDirFmt() for i in range(n_shards)
+    }
+    shard_paths = [str(shard) for shard in shards.values()]
+
+    def output_paths(filename):
+        return [os.path.join(shard_path, filename) for shard_path in shard_paths]
+
+    _split_table(
+        os.path.join(path, SAMPLE_DATA_FILENAME),
+        output_paths(SAMPLE_DATA_FILENAME),
+        sample_shards,
+        local_samples,
+    )
+
+    # Spectra follow the shard of the sample they are linked to
+    links = np.loadtxt(
+        os.path.join(path, LINKS_FILENAME), dtype=np.int64, ndmin=2
+    ).reshape(-1, 2)
+    n_spectra = _count_rows(os.path.join(path, BACKEND_DATA_FILENAME))
+    spectrum_shards = np.full(n_spectra, -1, dtype=np.int64)
+    spectrum_shards[links[:, 1] - 1] = sample_shards[links[:, 0] - 1]
+    local_spectra = _local_numbers(spectrum_shards, n_shards)
+    _split_table(
+        os.path.join(path, BACKEND_DATA_FILENAME),
+        output_paths(BACKEND_DATA_FILENAME),
+        spectrum_shards,
+        local_spectra,
+    )
+
+    link_shards = sample_shards[links[:, 0] - 1]
+    with ExitStack() as stack:
+        dsts = [stack.enter_context(open(p, "w")) for p in output_paths(LINKS_FILENAME)]
+        for shard, sample, spectrum in zip(
+            link_shards,
+            local_samples[links[:, 0] - 1],
+            local_spectra[links[:, 1] - 1],
+        ):
+            dsts[shard].write(f"{sample}\t{spectrum}\n")
+
+    if os.path.exists(os.path.join(path, CHROM_PEAKS_FILENAME)):
+        _split_chrom_peaks(path, shard_paths, sample_shards, local_samples)
+
+    history = _read_process_history(path)
+    if history is not None:
+        for i, shard_path in enumerate(shard_paths):
+            samples = np.flatnonzero(sample_shards == i) + 1
+            entries = []
+            for entry in history:
+                if _history_type(entry) == _PEAK_GROUPING:
+                    continue
+                file_index = [
+                    int(local_samples[j - 1])
+                    for j in entry["attributes"]["fileIndex"]["value"]
+                    if j in samples
+                ]
+                if file_index:
+                    entry = json.loads(json.dumps(entry))
+                    entry["attributes"]["fileIndex"]["value"] = file_index
+                    entries.append(entry)
+            _write_process_history(shard_path, entries)
+
+    spectra_path = os.path.join(path, SPECTRA_DIRNAME)
+    if os.path.isdir(spectra_path):
+        origins = XCMSExperimentReader(path).sample_data["spectraOrigin"]
+        for shard_path in shard_paths:
+            os.mkdir(os.path.join(shard_path, SPECTRA_DIRNAME))
+        for shard, origin in zip(sample_shards, origins):
+            filename = os.path.basename(origin)
+            link_spectra_file(
+                os.path.join(spectra_path, filename),
+                os.path.join(shard_paths[shard], SPECTRA_DIRNAME, filename),
+            )
+
+    _copy_unsharded_files(path, shard_paths)
+
+    return shards
+
+
+def merge_ms_experiments(
+    xcms_experiments: XCMSExperimentDirFmt,
+) -> XCMSExperimentDirFmt:
+    """
+    Merges XCMSExperiments, e.g. the shards created by split_ms_experiment, into
+    one experiment with the samples of all experiments in the given order. The
+    spectra, samples and chromatographic peaks are renumbered and the links
+    between samples and spectra and the sample indices of the peaks are shifted
+    by the number of samples and spectra of the preceding experiments. The
+    experiments must not contain features and must have been processed with the
+    same steps.
+
+    Parameters:
+        xcms_experiments (dict):
+            Collection of the experiments to merge.
+
+    Returns:
+        XCMSExperimentDirFmt: Experiment with the samples of all experiments.
+    """
+    # Collections are passed as a dict of the experiments by name
+    if isinstance(xcms_experiments, dict):
+        xcms_experiments = list(xcms_experiments.values())
+    paths = [str(xcms_experiment) for xcms_experiment in xcms_experiments]
+    _validate_shards(paths)
+
+    merged = XCMSExperimentDirFmt()
+    output_path = str(merged)
+
+    n_spectra = concat_tables(
+        [os.path.join(path, BACKEND_DATA_FILENAME) for path in paths],
+        os.path.join(output_path, BACKEND_DATA_FILENAME),
+    )
+    n_samples = concat_tables(
+        [os.path.join(path, SAMPLE_DATA_FILENAME) for path in paths],
+        os.path.join(output_path, SAMPLE_DATA_FILENAME),
+    )
+    concat_links(
+        [os.path.join(path, LINKS_FILENAME) for path in paths],
+        os.path.join(output_path, LINKS_FILENAME),
+        n_samples,
+        n_spectra,
+    )
+
+    if os.path.exists(os.path.join(paths[0], CHROM_PEAKS_FILENAME)):
+        _merge_chrom_peaks(paths, output_path, n_samples)
+
+    histories = [_read_process_history(path) for path in paths]
+    if any(history is not None for history in histories):
+        _write_process_history(
+            output_path, _merge_process_histories(histories, n_samples)
+        )
+
+    for path in paths:
+        spectra_path = os.path.join(path, SPECTRA_DIRNAME)
+        if os.path.isdir(spectra_path):
+            os.makedirs(os.path.join(output_path, SPECTRA_DIRNAME), exist_ok=True)
+            for filename in os.listdir(spectra_path):
+                link_spectra_file(
+                    os.path.join(spectra_path, filename),
+                    os.path.join(output_path, SPECTRA_DIRNAME, filename),
+                )
+
+    _copy_unsharded_files(paths[0], [output_path])
+
+    return merged
+
+
+def read_ms_experiment_sharded(
+    ctx,
+    spectra,
+    sample_metadata=None,
+    samples_per_shard=1,
+    n_jobs=1,
+    chunk_size=None,
+    engine="r",
+):
+    """
+    Reads the spectra files in shards of `samples_per_shard` files with
+    read_ms_experiment and merges the shards with merge_ms_experiments. The
+    shards are independent actions, so they are read in parallel if the pipeline
+    is run with parallel execution.
+    """
+    read_ms_experiment = ctx.get_action("ms", "read_ms_experiment")
+    merge_ms_experiments = ctx.get_action("ms", "merge_ms_experiments")
+
+    spectra_path = str(spectra.view(mzMLDirFmt))
+    filenames = sorted(os.listdir(spectra_path))
+    n_shards = -(-len(filenames) // samples_per_shard)
+    width = len(str(n_shards))
+
+    xcms_experiments = {}
+    for i in range(n_shards):
+        shard_filenames = filenames[i * samples_per_shard : (i + 1) * samples_per_shard]
+        shard = mzMLDirFmt()
+        for filename in shard_filenames:
+            link_spectra_file(
+                os.path.join(spectra_path, filename),
+                os.path.join(str(shard), filename),
+            )
+
+        shard_metadata = None
+        if sample_metadata is not None:
+            shard_metadata = sample_metadata.filter_ids(
+                os.path.splitext(strip_compression_suffix(filename))[0]
+                for filename in shard_filenames
+            )
+
+        (xcms_experiments[f"shard_{i + 1:0{width}d}"],) = read_ms_experiment(
+            spectra=ctx.make_artifact("SampleData[mzML]", shard),
+            sample_metadata=shard_metadata,
+            n_jobs=n_jobs,
+            chunk_size=chunk_size,
+            engine=engine,
+        )
+
+    (xcms_experiment,) = merge_ms_experiments(xcms_experiments=xcms_experiments)
+
+    return xcms_experiment
+
+
+def _validate_shards(paths):
+    """
+    Validates that XCMSExperiments can be merged.
+
+    Raises:
+        ValueError: If there are no experiments, if an experiment contains
+            features, if only some experiments contain chromatographic peaks or if
+            a sample is contained in several experiments.
+    """
+    if not paths:
+        raise ValueError("At least one XCMSExperiment is needed for merging.")
+
+    for path in paths:
+        if any(os.path.exists(os.path.join(path, f)) for f in FEATURE_FILENAMES):
+            raise ValueError(
+                "XCMSExperiments with features can't be merged because features "
+                "relate the peaks of different samples. Group the peaks after "
+                "merging the experiments."
+            )
+
+    has_peaks = {
+        os.path.exists(os.path.join(path, CHROM_PEAKS_FILENAME)) for path in paths
+    }
+    if len(has_peaks) > 1:
+        raise ValueError(
+            "Only some of the XCMSExperiments contain chromatographic peaks. The "
+            "experiments must be processed with the same steps to be merged."
+        )
+
+    origins = Counter(
+        os.path.basename(origin)
+        for path in paths
+        for origin in XCMSExperimentReader(path).sample_data["spectraOrigin"]
+    )
+    duplicates = {origin for origin, count in origins.items() if count > 1}
+    if duplicates:
+        raise ValueError(
+            "The following samples are contained in several XCMSExperiments: "
+            f"{sorted(duplicates)}"
+        )
+
+
+def _count_rows(path):
+    with open(path) as f:
+        read_table_header(f)
+        return sum(1 for _ in f)
+
+
+def _local_numbers(shards, n_shards):
+    """
+    Returns the 1-based position of every row within its shard. Rows of shard -1
+    are not part of any shard and get 0.
+    """
+    numbers = np.zeros(len(shards), dtype=np.int64)
+    rows = np.flatnonzero(shards >= 0)
+    order = rows[np.argsort(shards[rows], kind="stable")]
+    counts = np.bincount(shards[rows], minlength=n_shards)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    numbers[order] = np.arange(len(order)) - starts[shards[order]] + 1
+    return numbers
+
+
+def _split_table(path, output_paths, shards, row_names, samples=None):
+    """
+    Writes every row of a table exported by MsIO to the table of its shard with
+    the given row name. Rows of shard -1 are dropped. If `samples` is given, it
+    replaces the "sample" column.
+    """
+    with ExitStack() as stack:
+        src = stack.enter_context(open(path))
+        header = read_table_header(src)
+        dsts = [stack.enter_context(open(p, "w")) for p in output_paths]
+        for dst in dsts:
+            dst.writelines(header)
+
+        if samples is not None:
+            position = _sample_position(header)
+
+        for shard, row_name, line in zip(shards, row_names, src):
+            if shard < 0:
+                continue
+            fields = line.rstrip("\n").split("\t")
+            fields[0] = f'"{row_name}"'
+            if samples is not None:
+                fields[position] = str(samples[int(fields[position]) - 1])
+            dsts[shard].write("\t".join(fields) + "\n")
+
+
+def _sample_position(header):
+    """
+    Returns the position of the "sample" column in the rows of a chromatographic
+    peak table. The rows start with the row name, which has no header.
+    """
+    columns = [c.strip('"') for c in header[-1].rstrip("\n").split("\t")]
+    return columns.index("sample") + 1
+
+
+def _chrom_peak_ids(counts):
+    """
+    Returns the IDs of `counts` chromatographic peaks as assigned by XCMS, e.g.
+    "CP001" to "CP100" for 100 peaks.
+    """
+    width = len(str(counts))
+    return [f"CP{i:0{width}d}" for i in range(1, counts + 1)]
+
+
+def _read_peak_samples(path):
+    with open(path) as f:
+        position = _sample_position(read_table_header(f))
+        return np.array(
+            [int(line.rstrip("\n").split("\t")[position]) for line in f],
+            dtype=np.int64,
+        )
+
+
+def _split_chrom_peaks(path, shard_paths, sample_shards, local_samples):
+    peaks_path = os.path.join(path, CHROM_PEAKS_FILENAME)
+    peak_shards = sample_shards[_read_peak_samples(peaks_path) - 1]
+    local_peaks = _local_numbers(peak_shards, len(shard_paths))
+    counts = np.bincount(peak_shards, minlength=len(shard_paths))
+    ids = [_chrom_peak_ids(int(count)) for count in counts]
+    peak_ids = [ids[shard][i - 1] for shard, i in zip(peak_shards, local_peaks)]
+
+    for filename, samples in (
+        (CHROM_PEAKS_FILENAME, local_samples),
+        (CHROM_PEAK_DATA_FILENAME, None),
+    ):
+        if os.path.exists(os.path.join(path, filename)):
+            _split_table(
+                os.path.join(path, filename),
+                [os.path.join(shard_path, filename) for shard_path in shard_paths],
+                peak_shards,
+                peak_ids,
+                samples,
+            )
+
+
+def _merge_chrom_peaks(paths, output_path, n_samples):
+    counts = [_count_rows(os.path.join(path, CHROM_PEAKS_FILENAME)) for path in paths]
+    peak_ids = _chrom_peak_ids(sum(counts))
+    sample_offsets = np.cumsum([0] + n_samples[:-1])
+
+    for filename, offsets in (
+        (CHROM_PEAKS_FILENAME, sample_offsets),
+        (CHROM_PEAK_DATA_FILENAME, None),
+    ):
+        if not os.path.exists(os.path.join(paths[0], filename)):
+            continue
+        ids = iter(peak_ids)
+        with open(os.path.join(output_path, filename), "w") as dst:
+            for i, path in enumerate(paths):
+                with open(os.path.join(path, filename)) as src:
+                    header = read_table_header(src)
+                    if i == 0:
+                        dst.writelines(header)
+                        position = None if offsets is None else _sample_position(header)
+                    for line in src:
+                        fields = line.rstrip("\n").split("\t")
+                        fields[0] = f'"{next(ids)}"'
+                        if position is not None:
+                            fields[position] = str(int(fields[position]) + offsets[i])
+                        dst.write("\t".join(fields) + "\n")
+
+
+def _read_process_history(path):
+    """
+    Returns the entries of the process history of an XCMSExperiment or None if it
+    has none. The history is stored by MsIO as a JSON string serialized by
+    jsonlite with one S4 object per processing step.
+    """
+    history_path = os.path.join(path, PROCESS_HISTORY_FILENAME)
+    if not os.path.exists(history_path):
+        return None
+    with open(history_path) as f:
+        return json.loads(json.load(f)[0])["value"]
+
+
+def _write_process_history(path, entries):
+    history = {"type": "list", "attributes": {}, "value": entries}
+    with open(os.path.join(path, PROCESS_HISTORY_FILENAME), "w") as f:
+        json.dump([json.dumps(history, separators=(",", ":"))], f)
+
+
+def _history_type(entry):
+    return entry["attributes"]["type"]["value"][0]
+
+
+def _merge_process_histories(histories, n_samples):
+    """
+    Merges the process histories of XCMSExperiments that were processed with the
+    same steps. The file indices of every step are shifted by the number of
+    samples of the preceding experiments, `n_samples` holds the number of samples
+    of every experiment.
+
+    Raises:
+        ValueError: If the experiments were processed with different steps.
+    """
+    steps = [[_history_type(entry) for entry in history or []] for history in histories]
+    if any(s != steps[0] for s in steps):
+        raise ValueError(
+            "The XCMSExperiments must be processed with the same steps to be "
+            "merged. Found the following processing steps:\n"
+            + "\n".join(", ".join(s) or "none" for s in steps)
+        )
+
+    merged = json.loads(json.dumps(histories[0]))
+    offsets = np.cumsum([0] + list(n_samples[:-1]))
+    for i, entry in enumerate(merged):
+        file_index = []
+        for history, offset in zip(histories, offsets):
+            values = history[i]["attributes"]["fileIndex"]["value"]
+            file_index.extend(int(value + offset) for value in values)
+        entry["attributes"]["fileIndex"]["value"] = file_index
+    return merged
+
+
+def _copy_unsharded_files(path, output_paths):
+    for filename in os.listdir(path):
+        if filename not in _SHARDED_FILENAMES:
+            for output_path in output_paths:
+                shutil.copyfile(
+                    os.path.join(path, filename), os.path.join(output_path, filename)
+                )
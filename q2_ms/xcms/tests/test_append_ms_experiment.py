@@ -0,0 +1,174 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+
+import pandas as pd
+import qiime2
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.types import mzMLDirFmt
+from q2_ms.xcms.append_ms_experiment import (
+    _append_experiment,
+    _validate_experiment,
+    append_ms_experiment,
+)
+from q2_ms.xcms.read_ms_experiment import read_ms_experiment
+
+
+class TestAppendMsExperiment(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.sample_metadata = pd.read_csv(
+            self.get_data_path("faahKO_sample_data/sample_metadata.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+
+    def _spectra(self, name, samples):
+        spectra_dir = os.path.join(self.temp_dir.name, name)
+        os.mkdir(spectra_dir)
+        for sample in samples:
+            shutil.copy(self.get_data_path(f"faahKO/{sample}.mzML"), spectra_dir)
+        return mzMLDirFmt(spectra_dir, mode="r")
+
+    def _write_experiment(self, path, samples, spectra_dir, start=1):
+        os.makedirs(path)
+        with open(os.path.join(path, "ms_backend_data.txt"), "w") as f:
+            f.write('# MsBackendMzR\n"msLevel"\t"dataStorage"\n')
+            for i, sample in enumerate(samples):
+                file_path = os.path.join(spectra_dir, f"{sample}.mzML")
+                for j in range(2):
+                    f.write(f'"{2 * i + j + 1}"\t1\t"{file_path}"\n')
+        with open(os.path.join(path, "ms_experiment_sample_data.txt"), "w") as f:
+            f.write('"spectraOrigin"\n')
+            for i, sample in enumerate(samples, 1):
+                f.write(f'"{i}"\t"{os.path.join(spectra_dir, sample)}.mzML"\n')
+        with open(
+            os.path.join(path, "ms_experiment_sample_data_links_spectra.txt"), "w"
+        ) as f:
+            for i in range(len(samples)):
+                f.write(f"{i + 1}\t{2 * i + 1}\n{i + 1}\t{2 * i + 2}\n")
+        with open(os.path.join(path, "spectra_slots.txt"), "w") as f:
+            f.write("processingChunkSize = 1000\n")
+
+    def test_append_experiment(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        self._write_experiment(experiment_dir, ["ko15"], "spectra")
+        os.mkdir(os.path.join(experiment_dir, "spectra"))
+        shutil.copy(
+            self.get_data_path("faahKO/ko15.mzML"),
+            os.path.join(experiment_dir, "spectra"),
+        )
+        spectra = self._spectra("new_spectra", ["ko16", "wt21"])
+        new_experiment_dir = os.path.join(self.temp_dir.name, "new")
+        self._write_experiment(
+            new_experiment_dir, ["ko16", "wt21"], os.path.realpath(str(spectra))
+        )
+        output_dir = os.path.join(self.temp_dir.name, "output")
+        os.mkdir(output_dir)
+
+        _append_experiment(experiment_dir, new_experiment_dir, str(spectra), output_dir)
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(output_dir, "spectra"))),
+            ["ko15.mzML", "ko16.mzML", "wt21.mzML"],
+        )
+        with open(os.path.join(output_dir, "ms_backend_data.txt")) as f:
+            self.assertEqual(
+                f.read(),
+                '# MsBackendMzR\n"msLevel"\t"dataStorage"\n'
+                '"1"\t1\t"spectra/ko15.mzML"\n"2"\t1\t"spectra/ko15.mzML"\n'
+                '"3"\t1\t"spectra/ko16.mzML"\n"4"\t1\t"spectra/ko16.mzML"\n'
+                '"5"\t1\t"spectra/wt21.mzML"\n"6"\t1\t"spectra/wt21.mzML"\n',
+            )
+        with open(os.path.join(output_dir, "ms_experiment_sample_data.txt")) as f:
+            self.assertEqual(
+                f.read(),
+                '"spectraOrigin"\n"1"\t"spectra/ko15.mzML"\n'
+                '"2"\t"spectra/ko16.mzML"\n"3"\t"spectra/wt21.mzML"\n',
+            )
+        with open(
+            os.path.join(output_dir, "ms_experiment_sample_data_links_spectra.txt")
+        ) as f:
+            self.assertEqual(f.read(), "1\t1\n1\t2\n2\t3\n2\t4\n3\t5\n3\t6\n")
+        with open(os.path.join(output_dir, "spectra_slots.txt")) as f:
+            self.assertEqual(f.read(), "processingChunkSize = 1000\n")
+
+    def test_append_experiment_columns_mismatch(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        self._write_experiment(experiment_dir, ["ko15"], "spectra")
+        os.mkdir(os.path.join(experiment_dir, "spectra"))
+        spectra = self._spectra("new_spectra", ["ko16"])
+        new_experiment_dir = os.path.join(self.temp_dir.name, "new")
+        self._write_experiment(new_experiment_dir, ["ko16"], str(spectra))
+        with open(
+            os.path.join(new_experiment_dir, "ms_experiment_sample_data.txt"), "w"
+        ) as f:
+            f.write('"sample_group"\t"spectraOrigin"\n"1"\t"KO"\t"ko16.mzML"\n')
+        output_dir = os.path.join(self.temp_dir.name, "output")
+        os.mkdir(output_dir)
+
+        with self.assertRaisesRegex(ValueError, "same columns"):
+            _append_experiment(
+                experiment_dir, new_experiment_dir, str(spectra), output_dir
+            )
+
+    def test_validate_experiment_no_spectra(self):
+        with self.assertRaisesRegex(ValueError, "does not contain its spectra"):
+            _validate_experiment(
+                self.get_data_path("XCMSExperiment_features"), self.temp_dir.name
+            )
+
+    def test_validate_experiment_processed(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        shutil.copytree(self.get_data_path("XCMSExperiment_features"), experiment_dir)
+        os.mkdir(os.path.join(experiment_dir, "spectra"))
+        with self.assertRaisesRegex(ValueError, "before peak detection"):
+            _validate_experiment(experiment_dir, self.temp_dir.name)
+
+    def test_validate_experiment_duplicates(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        os.makedirs(os.path.join(experiment_dir, "spectra"))
+        open(os.path.join(experiment_dir, "spectra", "ko15.mzML"), "w").close()
+        spectra = self._spectra("new_spectra", ["ko15", "ko16"])
+        with self.assertRaisesRegex(ValueError, r"following samples: \['ko15'\]"):
+            _validate_experiment(experiment_dir, str(spectra))
+
+    def test_append_ms_experiment(self):
+        metadata = self.sample_metadata
+        experiment = read_ms_experiment(
+            spectra=self._spectra("spectra_1", ["ko15", "ko16"]),
+            sample_metadata=qiime2.Metadata(metadata.loc[["ko15", "ko16"]]),
+        )
+
+        extended = append_ms_experiment(
+            xcms_experiment=experiment,
+            spectra=self._spectra("spectra_2", ["wt21", "wt22"]),
+            sample_metadata=qiime2.Metadata(metadata.loc[["wt21", "wt22"]]),
+        )
+
+        # Appending gives the same experiment as reading all files at once
+        expected = read_ms_experiment(
+            spectra=mzMLDirFmt(self.get_data_path("faahKO"), mode="r"),
+            sample_metadata=qiime2.Metadata(metadata),
+        )
+        for filename in (
+            "ms_backend_data.txt",
+            "ms_experiment_sample_data.txt",
+            "ms_experiment_sample_data_links_spectra.txt",
+        ):
+            with open(os.path.join(str(extended), filename)) as obs:
+                with open(os.path.join(str(expected), filename)) as exp:
+                    self.assertEqual(obs.read(), exp.read())
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(str(extended), "spectra"))),
+            ["ko15.mzML", "ko16.mzML", "wt21.mzML", "wt22.mzML"],
+        )
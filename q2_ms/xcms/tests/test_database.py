@@ -7,43 +7,83 @@
 # ----------------------------------------------------------------------------
 import os
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import patch
 
+import numpy as np
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_ms.types import MSPDirFmt
-from q2_ms.xcms.database import fetch_massbank
+from q2_ms.types import CompiledMSPDirFmt, MSPDirFmt
+from q2_ms.xcms.database import MASSBANK_URL, compile_msp, fetch_massbank
 
 
 class TestFetchMassbank(TestPluginBase):
     package = "q2_ms.xcms.tests"
 
-    @patch("q2_ms.xcms.database.requests.get")
-    def test_fetch_massbank(self, mock_get):
-        # Mock the response object
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.content = b""
-        mock_get.return_value = mock_response
+    @patch("q2_ms.xcms.database.download")
+    def test_fetch_massbank(self, mock_download):
+        def fake_download(url, output_path, sha256):
+            open(output_path, "w").close()
 
-        # Call the function
+        mock_download.side_effect = fake_download
         result = fetch_massbank()
 
-        # Check if the file exists
+        mock_download.assert_called_once_with(
+            MASSBANK_URL, os.path.join(str(result), "MassBank_NIST.msp"), None
+        )
         file_path = os.path.join(str(result), "MassBank_NIST.msp")
         self.assertTrue(os.path.exists(file_path))
+        self.assertTrue(os.path.exists(os.path.join(str(result), "msp_index.tsv")))
         self.assertIsInstance(result, MSPDirFmt)
 
-    @patch("q2_ms.xcms.database.requests.get")
-    def test_fetch_massbank_error(self, mock_get):
-        # Mock the response object
-        mock_response = Mock()
-        mock_response.status_code = 502
-        mock_response.content = b""
-        mock_get.return_value = mock_response
+    def test_fetch_massbank_local_mirror(self):
+        path = self.get_data_path("match_spectra/library/library.msp")
+        result = fetch_massbank(url=f"file://{path}")
+        with open(os.path.join(str(result), "MassBank_NIST.msp")) as f:
+            with open(path) as exp:
+                self.assertEqual(f.read(), exp.read())
+        result.validate()
 
-        with self.assertRaisesRegex(ValueError, "502"):
-            fetch_massbank()
+    def test_fetch_massbank_checksum(self):
+        path = self.get_data_path("match_spectra/library/library.msp")
+        with self.assertRaisesRegex(ValueError, "checksum"):
+            fetch_massbank(url=path, sha256="0" * 64)
+
+
+class TestCompileMSP(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def test_compile_msp(self):
+        library = CompiledMSPDirFmt(self.temp_dir.name, mode="r")
+        self.assertIs(compile_msp(library), library)
+        self.assertFalse(library.has_fragment_index)
+
+    def test_compile_msp_content(self):
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        library = compile_msp(
+            transformer(
+                MSPDirFmt(self.get_data_path("match_spectra/library"), mode="r")
+            )
+        )
+
+        metadata = library.read_metadata()
+        offsets, mz, intensity = library.read_peaks()
+        self.assertEqual(metadata["DB#"].tolist(), ["LIB1", "LIB2", "LIB3", "LIB4"])
+        self.assertEqual(metadata["PrecursorMZ"].tolist()[1], "445.341")
+        np.testing.assert_array_equal(offsets, [0, 10, 12, 22, 32])
+        self.assertEqual(mz.dtype, np.float64)
+        self.assertEqual(intensity.dtype, np.float64)
+        np.testing.assert_array_equal(mz[10:12], [0, 100])
+        np.testing.assert_array_equal(intensity[10:12], [20, 50])
+        np.testing.assert_array_equal(mz[22:24], [0.002, 2.002])
+
+    def test_compile_msp_fragment_index(self):
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        library = transformer(
+            MSPDirFmt(self.get_data_path("match_spectra/library"), mode="r")
+        )
+        compile_msp(library, fragment_bin_width=0.1)
+        self.assertTrue(library.has_fragment_index)
+        self.assertEqual(library.read_fragment_index()[0], 0.1)
 
 
 if __name__ == "__main__":
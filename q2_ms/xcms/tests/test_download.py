@@ -0,0 +1,120 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+from unittest.mock import MagicMock, patch
+
+import requests
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.xcms.download import DOWNLOAD_CACHE_ENV, download, get_download_cache_dir
+
+URL = "https://example.org/library.msp"
+CONTENT = b"NAME: a\nNum Peaks: 1\n100 10\n\n"
+
+
+def _response(status_code, content=b"", headers=None, error_after=None):
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.history = []
+    response.url = URL
+
+    def iter_content(chunk_size):
+        for i in range(0, len(content), 4):
+            if error_after is not None and i >= error_after:
+                raise requests.exceptions.ChunkedEncodingError("Connection broken")
+            yield content[i : i + 4]
+
+    response.iter_content.side_effect = iter_content
+    return response
+
+
+class TestDownload(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        self.output_path = os.path.join(self.temp_dir.name, "library.msp")
+
+    def _read_output(self):
+        with open(self.output_path, "rb") as f:
+            return f.read()
+
+    @patch("q2_ms.xcms.download.requests.get")
+    def test_download_cached(self, mock_get):
+        mock_get.side_effect = [
+            _response(200, CONTENT, {"ETag": '"v1"'}),
+            _response(304),
+        ]
+        download(URL, self.output_path, cache_dir=self.cache_dir)
+        self.assertEqual(self._read_output(), CONTENT)
+
+        os.remove(self.output_path)
+        download(URL, self.output_path, cache_dir=self.cache_dir)
+        self.assertEqual(self._read_output(), CONTENT)
+        self.assertEqual(mock_get.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+
+        sha256 = hashlib.sha256(CONTENT).hexdigest()
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "objects", sha256)))
+
+    @patch("q2_ms.xcms.download.time.sleep")
+    @patch("q2_ms.xcms.download.requests.get")
+    def test_download_resume(self, mock_get, mock_sleep):
+        mock_get.side_effect = [
+            _response(200, CONTENT, {"ETag": '"v1"'}, error_after=8),
+            _response(206, CONTENT[8:], {"ETag": '"v1"'}),
+        ]
+        download(URL, self.output_path, cache_dir=self.cache_dir)
+
+        self.assertEqual(self._read_output(), CONTENT)
+        headers = mock_get.call_args.kwargs["headers"]
+        self.assertEqual(headers["Range"], "bytes=8-")
+        self.assertEqual(headers["If-Range"], '"v1"')
+        mock_sleep.assert_called_once()
+
+    @patch("q2_ms.xcms.download.requests.get")
+    def test_download_checksum(self, mock_get):
+        mock_get.return_value = _response(200, CONTENT)
+        sha256 = hashlib.sha256(CONTENT).hexdigest()
+        download(URL, self.output_path, sha256=sha256, cache_dir=self.cache_dir)
+
+        # Files with a known checksum are taken from the cache without a request
+        os.remove(self.output_path)
+        download(URL, self.output_path, sha256=sha256, cache_dir=self.cache_dir)
+        self.assertEqual(mock_get.call_count, 1)
+
+        with self.assertRaisesRegex(ValueError, "does not match"):
+            download(URL, self.output_path, sha256="0" * 64, cache_dir=self.cache_dir)
+
+    @patch("q2_ms.xcms.download.time.sleep")
+    @patch("q2_ms.xcms.download.requests.get")
+    def test_download_error(self, mock_get, mock_sleep):
+        mock_get.return_value = _response(502)
+        with self.assertRaisesRegex(ValueError, "502"):
+            download(URL, self.output_path, cache_dir=self.cache_dir)
+        self.assertEqual(mock_get.call_count, 5)
+
+        mock_get.reset_mock()
+        mock_get.return_value = _response(404)
+        with self.assertRaisesRegex(ValueError, "404"):
+            download(URL, self.output_path, cache_dir=self.cache_dir)
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_download_local_file(self):
+        source = os.path.join(self.temp_dir.name, "source.msp")
+        with open(source, "wb") as f:
+            f.write(CONTENT)
+        download(f"file://{source}", self.output_path)
+        self.assertEqual(self._read_output(), CONTENT)
+
+    def test_get_download_cache_dir(self):
+        with patch.dict(os.environ, {DOWNLOAD_CACHE_ENV: self.cache_dir}):
+            self.assertEqual(get_download_cache_dir(), self.cache_dir)
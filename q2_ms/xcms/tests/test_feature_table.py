@@ -0,0 +1,56 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.types import XCMSExperimentReader
+from q2_ms.xcms.feature_table import extract_feature_table
+
+
+class TestExtractFeatureTable(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.experiment = XCMSExperimentReader(
+            self.get_data_path("XCMSExperiment_features")
+        )
+
+    def test_extract_feature_table_medret(self):
+        table = extract_feature_table(self.experiment)
+        self.assertEqual(list(table.ids(axis="sample")), ["s1", "s2", "s3"])
+        self.assertEqual(list(table.ids(axis="observation")), ["FT1", "FT2"])
+        np.testing.assert_array_equal(
+            table.matrix_data.toarray(), [[100, 200, 0], [0, 0, 400]]
+        )
+
+    def test_extract_feature_table_maxint(self):
+        table = extract_feature_table(self.experiment, value="maxo", method="maxint")
+        np.testing.assert_array_equal(
+            table.matrix_data.toarray(), [[30, 20, 0], [0, 0, 40]]
+        )
+
+    def test_extract_feature_table_sum(self):
+        table = extract_feature_table(self.experiment, method="sum")
+        np.testing.assert_array_equal(
+            table.matrix_data.toarray(), [[400, 200, 0], [0, 0, 400]]
+        )
+
+    def test_extract_feature_table_sparse(self):
+        table = extract_feature_table(self.experiment)
+        self.assertEqual(table.matrix_data.nnz, 3)
+
+    def test_extract_feature_table_no_features(self):
+        os.symlink(
+            self.get_data_path("XCMSExperiment_features/ms_experiment_sample_data.txt"),
+            os.path.join(self.temp_dir.name, "ms_experiment_sample_data.txt"),
+        )
+        with self.assertRaisesRegex(ValueError, "does not contain features"):
+            extract_feature_table(XCMSExperimentReader(self.temp_dir.name))
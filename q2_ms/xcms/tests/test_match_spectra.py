@@ -0,0 +1,241 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.types import CompiledMSPDirFmt, MSPDirFmt, XCMSExperimentReader, mzMLDirFmt
+from q2_ms.xcms.match_spectra import (
+    _init_worker,
+    _match_batch,
+    _match_worker_batch,
+    _precursor_candidates,
+    _read_library,
+    _read_queries,
+    _Spectra,
+    match_spectra,
+)
+
+
+class TestMatchSpectra(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.experiment = XCMSExperimentReader(
+            self.get_data_path("match_spectra/xcms_experiment")
+        )
+        self.spectra = mzMLDirFmt(self.get_data_path("match_spectra/spectra"), mode="r")
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        self.library = transformer(
+            MSPDirFmt(self.get_data_path("match_spectra/library"), mode="r")
+        )
+
+    def _match(self, **kwargs):
+        result = match_spectra(
+            self.experiment, self.library, spectra=self.spectra, **kwargs
+        )
+        return pd.read_csv(
+            os.path.join(str(result), "matched_spectra.txt"),
+            sep="\t",
+            dtype={"target_spectrum_id": str},
+        )
+
+    def test_match_spectra_cosine(self):
+        obs = self._match()
+        self.assertEqual(obs[".original_query_index"].tolist(), [2])
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB1"])
+        self.assertAlmostEqual(obs["score"].iloc[0], 1.0)
+
+    def test_match_spectra_modified_cosine(self):
+        obs = self._match(method="modified_cosine")
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB1", "LIB4"])
+        self.assertAlmostEqual(obs["score"].iloc[1], 1.0)
+
+    def test_match_spectra_min_score(self):
+        obs = self._match(min_score=0)
+        # LIB3 has a different precursor m/z and is never scored
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB1", "LIB2", "LIB4"])
+        self.assertAlmostEqual(obs["score"].iloc[1], 20 / (110 * 70) ** 0.5)
+        self.assertAlmostEqual(obs["score"].iloc[2], 0.0)
+
+    def test_match_spectra_precursor_tolerance(self):
+        obs = self._match(ppm=0, tolerance=0.0005, min_score=0)
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB1"])
+
+    def _use_analog_library(self):
+        # The precursor m/z of the analog is 14 higher and half of its fragments
+        # are shifted by 14
+        library_dir = os.path.join(self.temp_dir.name, "library")
+        os.mkdir(library_dir)
+        with open(os.path.join(library_dir, "library.msp"), "w") as f:
+            f.write(
+                "Name: Analog\nDB#: LIB5\nPrecursorMZ: 459.34\nNum Peaks: 10\n"
+                "0 20\n2 18\n4 16\n6 14\n8 12\n24 10\n26 8\n28 6\n30 4\n32 2\n"
+            )
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        self.library = transformer(MSPDirFmt(library_dir, mode="r"))
+
+    def test_match_spectra_analog(self):
+        self._use_analog_library()
+
+        obs = self._match(method="modified_cosine", min_score=0)
+        self.assertEqual(len(obs), 0)
+
+        obs = self._match(method="cosine", min_score=0, precursor_tolerance=20)
+        self.assertAlmostEqual(obs["score"].iloc[0], 80 / 110)
+
+        obs = self._match(method="modified_cosine", precursor_tolerance=20)
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB5"])
+        self.assertAlmostEqual(obs["score"].iloc[0], 1.0)
+
+    def test_precursor_candidates_missing_precursor_mz(self):
+        library_dir = os.path.join(self.temp_dir.name, "library")
+        os.mkdir(library_dir)
+        with open(os.path.join(library_dir, "library.msp"), "w") as f:
+            f.write(
+                "Name: A\nDB#: LIB1\nNum Peaks: 1\n10 1\n\n"
+                "Name: B\nDB#: LIB2\nPrecursorMZ: 100\nNum Peaks: 1\n10 1\n\n"
+                "Name: C\nDB#: LIB3\nNum Peaks: 1\n10 1\n"
+            )
+        transformer = self.get_transformer(MSPDirFmt, CompiledMSPDirFmt)
+        targets = _read_library(transformer(MSPDirFmt(library_dir, mode="r")))
+        queries = _Spectra([1, 2], [np.nan, 100], [0, 1, 2], [10, 10], [1, 1])
+
+        for precursor_tolerance in [None, 1000]:
+            query, target = _precursor_candidates(
+                queries, targets, np.arange(2), 10, 0.01, precursor_tolerance
+            )
+            self.assertEqual(query.tolist(), [1])
+            self.assertEqual(targets.ids[target].tolist(), ["LIB2"])
+
+    def test_match_spectra_open_search(self):
+        obs = self._match(open_search=True)
+        # LIB3 has a different precursor m/z but the same fragments
+        self.assertEqual(obs[".original_query_index"].tolist(), [2, 2])
+        self.assertEqual(sorted(obs["target_spectrum_id"]), ["LIB1", "LIB3"])
+        self.assertAlmostEqual(obs["score"].iloc[1], 1.0)
+
+    def test_match_spectra_open_search_compiled_index(self):
+        self.library.build_fragment_index(0.001)
+        # LIB4 is shifted by 0.002 and does not share a bin without tolerance
+        obs = self._match(open_search=True, min_score=0, ppm=0)
+        self.assertEqual(obs["target_spectrum_id"].iloc[2], "LIB2")
+        self.assertEqual(sorted(obs["target_spectrum_id"]), ["LIB1", "LIB2", "LIB3"])
+
+    def test_match_spectra_open_search_analog(self):
+        self._use_analog_library()
+
+        # The unshifted fragments only reach a cosine score of 80 / 110
+        obs = self._match(open_search=True, min_score=0.9)
+        self.assertEqual(len(obs), 0)
+
+        obs = self._match(open_search=True, min_score=0.9, method="modified_cosine")
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB5"])
+        self.assertAlmostEqual(obs["score"].iloc[0], 1.0)
+
+    def test_match_spectra_open_search_min_score_one(self):
+        obs = self._match(open_search=True, min_score=1)
+        self.assertEqual(sorted(obs["target_spectrum_id"]), ["LIB1", "LIB3"])
+
+    def test_match_spectra_n_jobs(self):
+        # Two copies of the spectra file give two queries
+        spectra_dir = os.path.join(self.temp_dir.name, "spectra")
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        os.makedirs(spectra_dir)
+        os.makedirs(experiment_dir)
+        with open(
+            self.get_data_path("match_spectra/xcms_experiment/ms_backend_data.txt")
+        ) as f:
+            header, columns, *rows = f.read().splitlines()
+        lines = [header, columns]
+        for i, filename in enumerate(["a.mzML", "b.mzML"]):
+            shutil.copyfile(
+                self.get_data_path("match_spectra/spectra/tiny.mzML"),
+                os.path.join(spectra_dir, filename),
+            )
+            for j, row in enumerate(rows):
+                _, values = row.split("\t", 1)
+                values = values.replace("/data/tiny.mzML", f"/data/{filename}")
+                lines.append(f'"{i * len(rows) + j + 1}"\t{values}')
+        with open(os.path.join(experiment_dir, "ms_backend_data.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        self.experiment = XCMSExperimentReader(experiment_dir)
+        self.spectra = mzMLDirFmt(spectra_dir, mode="r")
+
+        with patch("q2_ms.xcms.match_spectra.BATCH_SIZE", 1):
+            exp = self._match(min_score=0, n_jobs=1)
+            with patch(
+                "q2_ms.xcms.match_spectra.ProcessPoolExecutor",
+                wraps=ProcessPoolExecutor,
+            ) as mock_executor:
+                obs = self._match(min_score=0, n_jobs=2)
+            mock_executor.assert_called_once()
+
+        self.assertEqual(obs[".original_query_index"].tolist(), [2, 2, 2, 6, 6, 6])
+        pd.testing.assert_frame_equal(obs, exp)
+
+    def test_match_spectra_worker(self):
+        queries = _read_queries(self.experiment.backend_data, str(self.spectra))
+        targets = _read_library(self.library)
+        queries.save(self.temp_dir.name, "queries")
+        targets.save(self.temp_dir.name, "targets")
+        params = {
+            "ppm": 5,
+            "tolerance": 0,
+            "modified": False,
+            "min_score": 0,
+            "precursor_tolerance": None,
+        }
+
+        loaded = _Spectra.load(self.temp_dir.name, "targets")
+        np.testing.assert_array_equal(loaded.mz, targets.mz)
+        np.testing.assert_array_equal(
+            loaded.sorted_precursor_mz, targets.sorted_precursor_mz
+        )
+
+        _init_worker(self.temp_dir.name, None)
+        exp = _match_batch(queries, targets, None, (0, 1), **params)
+        obs = _match_worker_batch((0, 1), params)
+        for obs_values, exp_values in zip(obs, exp):
+            np.testing.assert_array_equal(obs_values, exp_values)
+
+    def test_match_spectra_stored_spectra(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        os.makedirs(os.path.join(experiment_dir, "spectra"))
+        os.link(
+            self.get_data_path("match_spectra/spectra/tiny.mzML"),
+            os.path.join(experiment_dir, "spectra", "tiny.mzML"),
+        )
+        with open(
+            self.get_data_path("match_spectra/xcms_experiment/ms_backend_data.txt")
+        ) as f:
+            backend_data = f.read().replace("/data/tiny.mzML", "spectra/tiny.mzML")
+        with open(os.path.join(experiment_dir, "ms_backend_data.txt"), "w") as f:
+            f.write(backend_data)
+
+        experiment = XCMSExperimentReader(experiment_dir)
+        result = match_spectra(experiment, self.library)
+        obs = pd.read_csv(
+            os.path.join(str(result), "matched_spectra.txt"),
+            sep="\t",
+            dtype={"target_spectrum_id": str},
+        )
+        self.assertEqual(obs["target_spectrum_id"].tolist(), ["LIB1"])
+
+        rows = [row for row, *_ in experiment.iter_spectra({2})]
+        self.assertEqual(rows, [1])
+
+    def test_match_spectra_no_spectra(self):
+        with self.assertRaisesRegex(ValueError, "does not contain its spectra"):
+            match_spectra(self.experiment, self.library)
@@ -0,0 +1,63 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+from unittest.mock import patch
+
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.types import MatchedSpectraDirFmt
+from q2_ms.xcms.matched_spectra import filter_matched_spectra
+
+
+class TestFilterMatchedSpectra(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.temp_dir.name, "matched_spectra.txt"), "w") as f:
+            f.write(
+                ".original_query_index\ttarget_spectrum_id\tscore\n"
+                "2\tb\t0.5\n"
+                "1\ta\t0.2\n"
+                "1\tc\t0.9\n"
+                "2\td\t0.7\n"
+                "1\te\t0.9\n"
+                "2\tf\t0.1\n"
+            )
+        self.matched_spectra = MatchedSpectraDirFmt(self.temp_dir.name, mode="r")
+
+    def _read(self, result):
+        return pd.read_csv(
+            os.path.join(str(result), "matched_spectra.txt"),
+            sep="\t",
+            dtype={"target_spectrum_id": str},
+        )
+
+    @patch("q2_ms.xcms.matched_spectra.CHUNK_SIZE", 2)
+    def test_filter_matched_spectra_top_k(self):
+        result = filter_matched_spectra(self.matched_spectra, top_k=2)
+        df = self._read(result)
+        self.assertEqual(df[".original_query_index"].tolist(), [1, 1, 2, 2])
+        self.assertEqual(df["target_spectrum_id"].tolist(), ["c", "e", "d", "b"])
+        result.validate()
+
+    @patch("q2_ms.xcms.matched_spectra.CHUNK_SIZE", 2)
+    def test_filter_matched_spectra_min_score(self):
+        result = filter_matched_spectra(self.matched_spectra, min_score=0.5)
+        df = self._read(result)
+        self.assertEqual(df["target_spectrum_id"].tolist(), ["b", "c", "d", "e"])
+
+    def test_filter_matched_spectra_top_k_min_score(self):
+        result = filter_matched_spectra(self.matched_spectra, top_k=1, min_score=0.6)
+        df = self._read(result)
+        self.assertEqual(df["target_spectrum_id"].tolist(), ["c", "d"])
+
+    def test_filter_matched_spectra_no_filter(self):
+        with self.assertRaisesRegex(ValueError, "At least one"):
+            filter_matched_spectra(self.matched_spectra)
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.xcms.ms_backend import (
+    MS_BACKEND_MZR_COLUMNS,
+    _backend_row,
+    _format_value,
+    _make_name,
+    write_ms_experiment,
+)
+
+
+class TestMsBackend(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.spectra_path = self.get_data_path("faahKO")
+        self.output_path = os.path.join(self.temp_dir.name, "experiment")
+        os.mkdir(self.output_path)
+
+    def _read_table(self, filename):
+        return pd.read_csv(
+            os.path.join(self.output_path, filename),
+            sep="\t",
+            index_col=0,
+            comment="#",
+        )
+
+    def test_write_ms_experiment(self):
+        write_ms_experiment(self.spectra_path, self.output_path)
+
+        backend_data = self._read_table("ms_backend_data.txt")
+        self.assertEqual(list(backend_data.columns), MS_BACKEND_MZR_COLUMNS)
+        ko15 = os.path.realpath(os.path.join(self.spectra_path, "ko15.mzML"))
+        first = backend_data.iloc[0]
+        self.assertEqual(first["msLevel"], 1)
+        self.assertEqual(first["dataStorage"], ko15)
+        self.assertEqual(first["spectrumId"], f"scan={first['acquisitionNum']}")
+        self.assertEqual(first["scanIndex"], 1)
+        self.assertEqual(first["precursorMz"], -1)
+        self.assertEqual(
+            list(backend_data.index), list(range(1, len(backend_data) + 1))
+        )
+
+        links = pd.read_csv(
+            os.path.join(
+                self.output_path, "ms_experiment_sample_data_links_spectra.txt"
+            ),
+            sep="\t",
+            header=None,
+        )
+        self.assertEqual(list(links[1]), list(backend_data.index))
+        sample_data = self._read_table("ms_experiment_sample_data.txt")
+        self.assertEqual(list(sample_data["sample_index"]), [1, 2, 3, 4])
+        self.assertEqual(sample_data["spectraOrigin"].iloc[0], ko15)
+        # Each spectrum is linked to the sample of its file
+        self.assertEqual(
+            list(sample_data["spectraOrigin"].loc[links[0]]),
+            list(backend_data["dataOrigin"]),
+        )
+
+        with open(os.path.join(self.output_path, "spectra_slots.txt")) as f:
+            self.assertIn("processingChunkSize = Inf\n", f.read())
+        with open(os.path.join(self.output_path, "spectra_processing_queue.json")) as f:
+            self.assertEqual(json.loads(json.load(f)[0])["value"], [])
+
+    def test_write_ms_experiment_r_reference(self):
+        # Exported by MsIO::saveMsObject from ko15.CDF of the faahKO package. The
+        # mzML files hold other scans of the same samples, so only the columns
+        # that do not depend on the scans are compared.
+        columns = [
+            "msLevel",
+            "polarity",
+            "precScanNum",
+            "precursorMz",
+            "precursorIntensity",
+            "precursorCharge",
+            "collisionEnergy",
+            "ionisationEnergy",
+            "mergedScan",
+            "mergedResultScanNum",
+            "mergedResultStartScanNum",
+            "mergedResultEndScanNum",
+            "injectionTime",
+            "ionMobilityDriftTime",
+        ]
+        exp = pd.read_csv(
+            self.get_data_path("ms_backend_r/ms_backend_data.txt"),
+            sep="\t",
+            index_col=0,
+            comment="#",
+        )
+
+        write_ms_experiment(self.spectra_path, self.output_path)
+
+        obs = self._read_table("ms_backend_data.txt")
+        self.assertEqual(list(obs.columns), list(exp.columns))
+        pd.testing.assert_frame_equal(obs[columns].head(len(exp)), exp[columns])
+
+    def test_backend_row_precursor_without_scan_number(self):
+        header = dict.fromkeys(
+            [
+                "polarity",
+                "precursor_intensity",
+                "precursor_charge",
+                "collision_energy",
+                "total_ion_current",
+                "base_peak_mz",
+                "base_peak_intensity",
+                "lowest_mz",
+                "highest_mz",
+                "injection_time",
+                "ion_mobility_drift_time",
+            ]
+        )
+        header.update(
+            {
+                "index": 1,
+                "id": "sample=1 period=1 cycle=2",
+                "ms_level": 2,
+                "rtime": 1.5,
+                "peaks_count": 3,
+                "precursor_id": "sample=1 period=1 cycle=1",
+                "precursor_mz": 445.34,
+            }
+        )
+
+        row = dict(zip(MS_BACKEND_MZR_COLUMNS, _backend_row(header, "a.mzML")))
+
+        self.assertEqual(row["acquisitionNum"], 2)
+        self.assertEqual(row["precScanNum"], -1)
+        self.assertEqual(row["precursorMz"], 445.34)
+        self.assertEqual(row["precursorCharge"], -1)
+        self.assertEqual(row["injectionTime"], -1)
+
+    def test_write_ms_experiment_metadata(self):
+        sample_metadata = pd.read_csv(
+            self.get_data_path("faahKO_sample_data/sample_metadata.tsv"),
+            sep="\t",
+            index_col=0,
+        )
+
+        write_ms_experiment(
+            self.spectra_path, self.output_path, sample_metadata, chunk_size=1000
+        )
+
+        sample_data_exp = pd.read_csv(
+            self.get_data_path(
+                "ms_experiment_sample_data/ms_experiment_sample_data_metadata.txt"
+            ),
+            sep="\t",
+            index_col=0,
+        )
+        sample_data_obs = self._read_table("ms_experiment_sample_data.txt")
+        sample_data_obs.drop(columns=["spectraOrigin"], inplace=True)
+        pd.testing.assert_frame_equal(sample_data_exp, sample_data_obs)
+        with open(os.path.join(self.output_path, "spectra_slots.txt")) as f:
+            self.assertIn("processingChunkSize = 1000\n", f.read())
+
+    def test_write_ms_experiment_parallel(self):
+        write_ms_experiment(self.spectra_path, self.output_path, n_jobs=2)
+        serial_path = os.path.join(self.temp_dir.name, "serial")
+        os.mkdir(serial_path)
+        write_ms_experiment(self.spectra_path, serial_path)
+
+        for filename in os.listdir(serial_path):
+            with open(os.path.join(self.output_path, filename)) as obs:
+                with open(os.path.join(serial_path, filename)) as exp:
+                    self.assertEqual(obs.read(), exp.read())
+
+    def test_make_name(self):
+        self.assertEqual(_make_name("sample-id"), "sample.id")
+        self.assertEqual(_make_name("1st"), "X1st")
+        self.assertEqual(_make_name(".5"), "X.5")
+        self.assertEqual(_make_name("group"), "group")
+
+    def test_format_value(self):
+        self.assertEqual(_format_value('a"b'), '"a\\"b"')
+        self.assertEqual(_format_value(None), "NA")
+        self.assertEqual(_format_value(float("nan")), "NA")
+        self.assertEqual(_format_value(float("inf")), "Inf")
+        self.assertEqual(_format_value(True), "TRUE")
+        self.assertEqual(_format_value(0.1 + 0.2), "0.3")
+        self.assertEqual(_format_value(3), "3")
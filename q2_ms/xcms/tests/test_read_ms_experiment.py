@@ -6,13 +6,21 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import os
+import shutil
+from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
 import qiime2
 from qiime2.plugin.testing import TestPluginBase
 
 from q2_ms.types import mzMLDirFmt
-from q2_ms.xcms.read_ms_experiment import _validate_metadata, read_ms_experiment
+from q2_ms.xcms.read_ms_experiment import (
+    _prepare_spectra,
+    _store_spectra,
+    _validate_metadata,
+    read_ms_experiment,
+)
 
 
 class TestReadMsExperiment(TestPluginBase):
@@ -66,6 +74,20 @@ class TestReadMsExperiment(TestPluginBase):
 
         pd.testing.assert_frame_equal(sample_data_exp, sample_data_obs)
 
+    def test_read_ms_experiment_parallel_chunks(self):
+        xcms_experiment = read_ms_experiment(
+            spectra=self.spectra, n_jobs=2, chunk_size=1000
+        )
+        with open(os.path.join(str(xcms_experiment), "spectra_slots.txt")) as f:
+            self.assertIn("processingChunkSize = 1000", f.read())
+
+        # The result does not depend on the number of workers
+        serial = read_ms_experiment(spectra=self.spectra)
+        for filename in ("ms_backend_data.txt", "ms_experiment_sample_data.txt"):
+            with open(os.path.join(str(xcms_experiment), filename)) as obs:
+                with open(os.path.join(str(serial), filename)) as exp:
+                    self.assertEqual(obs.read(), exp.read())
+
     def test_validate_metadata_missing(self):
         metadata_missing = self.sample_metadata.drop(index="wt22")
         with self.assertRaisesRegex(ValueError, "missing in sample-metadata: {'wt22'}"):
@@ -76,3 +98,103 @@ class TestReadMsExperiment(TestPluginBase):
         metadata_added.loc["wt23"] = ["WT", "study"]
         with self.assertRaisesRegex(ValueError, "missing in spectra: {'wt23'}"):
             _validate_metadata(metadata_added, str(self.spectra))
+
+    def _compressed_spectra(self):
+        spectra_dir = os.path.join(self.temp_dir.name, "spectra")
+        os.mkdir(spectra_dir)
+        shutil.copy(self.get_data_path("faahKO/ko15.mzML"), spectra_dir)
+        with open(self.get_data_path("faahKO/ko16.mzML"), "rb") as f:
+            data = f.read()
+        with pa.output_stream(
+            os.path.join(spectra_dir, "ko16.mzML.zst"), compression="zstd"
+        ) as f:
+            f.write(data)
+        return spectra_dir, data
+
+    def test_validate_metadata_compressed(self):
+        spectra_dir, _ = self._compressed_spectra()
+        _validate_metadata(self.sample_metadata.loc[["ko15", "ko16"]], spectra_dir)
+
+    def test_prepare_spectra_plain(self):
+        self.assertEqual(
+            _prepare_spectra(str(self.spectra), self.temp_dir.name), str(self.spectra)
+        )
+
+    def test_prepare_spectra_zstd(self):
+        spectra_dir, data = self._compressed_spectra()
+        tmp_dir = os.path.join(self.temp_dir.name, "tmp")
+        os.mkdir(tmp_dir)
+
+        output_dir = _prepare_spectra(spectra_dir, tmp_dir)
+
+        self.assertEqual(sorted(os.listdir(output_dir)), ["ko15.mzML", "ko16.mzML"])
+        with open(os.path.join(output_dir, "ko16.mzML"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_store_spectra(self):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        os.mkdir(experiment_dir)
+        spectra_path = os.path.realpath(str(self.spectra))
+        with open(os.path.join(experiment_dir, "ms_backend_data.txt"), "w") as f:
+            f.write('# MsBackendMzR\n"msLevel"\t"dataOrigin"\t"dataStorage"\n')
+            for i, name in enumerate(["ko15", "ko16"], 1):
+                path = os.path.join(spectra_path, f"{name}.mzML")
+                f.write(f'"{i}"\t1\t"{path}"\t"{path}"\n')
+        with open(
+            os.path.join(experiment_dir, "ms_experiment_sample_data.txt"), "w"
+        ) as f:
+            f.write('"spectraOrigin"\n')
+            f.write(f'"1"\t"{os.path.join(spectra_path, "ko15.mzML")}"\n')
+
+        _store_spectra(experiment_dir, str(self.spectra))
+
+        stored = os.path.join(experiment_dir, "spectra", "ko15.mzML")
+        self.assertTrue(
+            os.path.samefile(stored, os.path.join(spectra_path, "ko15.mzML"))
+        )
+        with open(os.path.join(experiment_dir, "ms_backend_data.txt")) as f:
+            self.assertEqual(
+                f.read(),
+                '# MsBackendMzR\n"msLevel"\t"dataOrigin"\t"dataStorage"\n'
+                '"1"\t1\t"spectra/ko15.mzML"\t"spectra/ko15.mzML"\n'
+                '"2"\t1\t"spectra/ko16.mzML"\t"spectra/ko16.mzML"\n',
+            )
+        with open(os.path.join(experiment_dir, "ms_experiment_sample_data.txt")) as f:
+            self.assertEqual(f.read(), '"spectraOrigin"\n"1"\t"spectra/ko15.mzML"\n')
+
+    @patch("q2_ms.xcms.read_ms_experiment.link_file", side_effect=OSError("EXDEV"))
+    def test_store_spectra_cross_device(self, mock_link_file):
+        experiment_dir = os.path.join(self.temp_dir.name, "experiment")
+        os.mkdir(experiment_dir)
+        with self.assertWarnsRegex(UserWarning, "not stored"):
+            _store_spectra(experiment_dir, str(self.spectra))
+        self.assertEqual(os.listdir(experiment_dir), [])
+
+    def test_read_ms_experiment_python_engine(self):
+        xcms_experiment = read_ms_experiment(
+            spectra=self.spectra,
+            sample_metadata=qiime2.Metadata(self.sample_metadata),
+            engine="python",
+        )
+        sample_data_exp = pd.read_csv(
+            self.get_data_path(
+                "ms_experiment_sample_data/ms_experiment_sample_data_metadata.txt"
+            ),
+            sep="\t",
+            index_col=0,
+        )
+        sample_data_obs = pd.read_csv(
+            os.path.join(str(xcms_experiment), "ms_experiment_sample_data.txt"),
+            sep="\t",
+            index_col=0,
+        )
+        self.assertEqual(
+            list(sample_data_obs["spectraOrigin"]),
+            [f"spectra/{name}.mzML" for name in sample_data_exp["sampleid"]],
+        )
+        sample_data_obs.drop(columns=["spectraOrigin"], inplace=True)
+
+        pd.testing.assert_frame_equal(sample_data_exp, sample_data_obs)
+        self.assertFalse(
+            os.path.exists(os.path.join(str(xcms_experiment), "resource_usage.json"))
+        )
@@ -0,0 +1,171 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2025, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import os
+import shutil
+
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+
+from q2_ms.xcms.shards import (
+    _local_numbers,
+    _read_process_history,
+    _write_process_history,
+    merge_ms_experiments,
+    split_ms_experiment,
+)
+
+SHARDED_TABLES = [
+    "ms_backend_data.txt",
+    "ms_experiment_sample_data.txt",
+    "ms_experiment_sample_data_links_spectra.txt",
+    "xcms_experiment_chrom_peaks.txt",
+    "xcms_experiment_chrom_peak_data.txt",
+]
+
+
+class TestShards(TestPluginBase):
+    package = "q2_ms.xcms.tests"
+
+    def setUp(self):
+        super().setUp()
+        self.experiment_path = self.get_data_path("XCMSExperiment_shards")
+
+    def _read(self, path, filename):
+        with open(os.path.join(str(path), filename)) as f:
+            return f.read()
+
+    def _without_features(self):
+        path = os.path.join(self.temp_dir.name, "experiment")
+        shutil.copytree(
+            self.experiment_path,
+            path,
+            ignore=shutil.ignore_patterns("xcms_experiment_feature_*"),
+        )
+        return path
+
+    def test_split_ms_experiment(self):
+        shards = split_ms_experiment(self.experiment_path, samples_per_shard=2)
+
+        self.assertEqual(list(shards), ["shard_1", "shard_2"])
+        shard = shards["shard_2"]
+        self.assertEqual(
+            self._read(shard, "ms_backend_data.txt"),
+            '# MsBackendMzR\n"msLevel"\t"rtime"\t"dataStorage"\t"scanIndex"\n'
+            '"1"\t1\t14.5\t"spectra/s3.mzML"\t1\n'
+            '"2"\t1\t15.5\t"spectra/s3.mzML"\t2\n',
+        )
+        self.assertEqual(
+            self._read(shard, "ms_experiment_sample_data.txt"),
+            '"sample_name"\t"spectraOrigin"\n"1"\t"s3"\t"spectra/s3.mzML"\n',
+        )
+        self.assertEqual(
+            self._read(shard, "ms_experiment_sample_data_links_spectra.txt"),
+            "1\t1\n1\t2\n",
+        )
+        self.assertEqual(
+            self._read(shard, "xcms_experiment_chrom_peaks.txt").splitlines()[1],
+            '"CP1"\t200\t200\t200\t50\t49\t51\t400\t390\t40\t5\t1',
+        )
+        self.assertEqual(
+            self._read(shard, "xcms_experiment_chrom_peak_data.txt"),
+            '"ms_level"\t"is_filled"\n"CP1"\t1\tFALSE\n',
+        )
+        self.assertEqual(
+            self._read(shard, "spectra_slots.txt"),
+            self._read(self.experiment_path, "spectra_slots.txt"),
+        )
+
+    def test_split_ms_experiment_drops_features(self):
+        shards = split_ms_experiment(self.experiment_path)
+
+        self.assertEqual(list(shards), ["shard_1", "shard_2", "shard_3"])
+        for shard in shards.values():
+            self.assertFalse(
+                os.path.exists(
+                    os.path.join(str(shard), "xcms_experiment_feature_definitions.txt")
+                )
+            )
+        history = _read_process_history(str(shards["shard_2"]))
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["attributes"]["type"]["value"], ["Peak detection"])
+        self.assertEqual(history[0]["attributes"]["fileIndex"]["value"], [1])
+
+    def test_split_ms_experiment_spectra(self):
+        path = self._without_features()
+        os.mkdir(os.path.join(path, "spectra"))
+        for sample in ["s1", "s2", "s3"]:
+            with open(os.path.join(path, "spectra", f"{sample}.mzML"), "w") as f:
+                f.write(sample)
+
+        shards = split_ms_experiment(path, samples_per_shard=2)
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(str(shards["shard_1"]), "spectra"))),
+            ["s1.mzML", "s2.mzML"],
+        )
+        self.assertEqual(
+            os.listdir(os.path.join(str(shards["shard_2"]), "spectra")), ["s3.mzML"]
+        )
+
+    def test_merge_ms_experiments(self):
+        path = self._without_features()
+        shards = split_ms_experiment(path)
+
+        merged = merge_ms_experiments(shards)
+
+        for filename in SHARDED_TABLES:
+            self.assertEqual(self._read(merged, filename), self._read(path, filename))
+        history = _read_process_history(str(merged))
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["attributes"]["fileIndex"]["value"], [1, 2, 3])
+
+    def test_merge_ms_experiments_uneven_shards(self):
+        path = self._without_features()
+        shards = split_ms_experiment(path, samples_per_shard=2)
+
+        merged = merge_ms_experiments(list(shards.values()))
+
+        for filename in SHARDED_TABLES:
+            self.assertEqual(self._read(merged, filename), self._read(path, filename))
+
+    def test_merge_ms_experiments_partial_step(self):
+        path = self._without_features()
+        history = _read_process_history(path)
+        history[0]["attributes"]["fileIndex"]["value"] = [1, 3]
+        _write_process_history(path, history)
+        shards = split_ms_experiment(path, samples_per_shard=2)
+
+        merged = merge_ms_experiments(shards)
+
+        history = _read_process_history(str(merged))
+        self.assertEqual(history[0]["attributes"]["fileIndex"]["value"], [1, 3])
+
+    def test_merge_ms_experiments_features(self):
+        with self.assertRaisesRegex(ValueError, "with features can't be merged"):
+            merge_ms_experiments([self.experiment_path])
+
+    def test_merge_ms_experiments_duplicates(self):
+        path = self._without_features()
+        with self.assertRaisesRegex(ValueError, r"several XCMSExperiments: \['s1"):
+            merge_ms_experiments([path, path])
+
+    def test_merge_ms_experiments_different_steps(self):
+        shards = split_ms_experiment(self._without_features())
+        history_path = os.path.join(
+            str(shards["shard_2"]), "xcms_experiment_process_history.json"
+        )
+        with open(history_path, "w") as f:
+            json.dump([json.dumps({"type": "list", "attributes": {}, "value": []})], f)
+
+        with self.assertRaisesRegex(ValueError, "processed with the same steps"):
+            merge_ms_experiments(shards)
+
+    def test_local_numbers(self):
+        numbers = _local_numbers(np.array([0, 1, -1, 0, 1, 1]), 2)
+        self.assertEqual(numbers.tolist(), [1, 1, 0, 2, 2, 3])
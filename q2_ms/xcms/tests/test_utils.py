@@ -6,10 +6,15 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import os
+from unittest.mock import patch
 
 from qiime2.plugin.testing import TestPluginBase
 
-from q2_ms.xcms.utils import create_fake_spectra_files
+from q2_ms.xcms.utils import (
+    create_fake_spectra_files,
+    get_spectra_files_dir,
+    link_spectra_file,
+)
 
 
 class TestXCMSUtils(TestPluginBase):
@@ -29,3 +34,37 @@ class TestXCMSUtils(TestPluginBase):
         tmp_dir = self.temp_dir
         create_fake_spectra_files(xcms_experiment_path, tmp_dir.name)
         self.assertTrue(os.path.exists(os.path.join(tmp_dir.name, "ko15.mzML")))
+
+    def test_get_spectra_files_dir_stored(self):
+        os.mkdir(os.path.join(self.temp_dir.name, "spectra"))
+        tmp_dir = os.path.join(self.temp_dir.name, "tmp")
+        os.mkdir(tmp_dir)
+        self.assertEqual(
+            get_spectra_files_dir(self.temp_dir.name, tmp_dir),
+            os.path.join(self.temp_dir.name, "spectra"),
+        )
+        self.assertEqual(os.listdir(tmp_dir), [])
+
+    def test_get_spectra_files_dir_placeholders(self):
+        xcms_experiment_path = self.get_data_path("create_fake_spectra_files")
+        self.assertEqual(
+            get_spectra_files_dir(xcms_experiment_path, self.temp_dir.name),
+            self.temp_dir.name,
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, "ko15.mzML")))
+
+    def test_link_spectra_file(self):
+        src = os.path.join(self.temp_dir.name, "a.mzML")
+        dst = os.path.join(self.temp_dir.name, "b.mzML")
+        open(src, "w").close()
+        link_spectra_file(src, dst)
+        self.assertTrue(os.path.samefile(src, dst))
+
+    @patch("q2_ms.xcms.utils.link_file", side_effect=OSError("cross-device link"))
+    def test_link_spectra_file_not_copied(self, mock_link_file):
+        src = os.path.join(self.temp_dir.name, "a.mzML")
+        dst = os.path.join(self.temp_dir.name, "b.mzML")
+        open(src, "w").close()
+        with self.assertRaisesRegex(OSError, "(?s)cross-device link.*not copied"):
+            link_spectra_file(src, dst)
+        self.assertFalse(os.path.exists(dst))
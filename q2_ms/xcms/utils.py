@@ -9,6 +9,15 @@ import os
 
 import pandas as pd
 
+from q2_ms.types._xcms_experiment import SPECTRA_DIRNAME
+from q2_ms.utils import link_file
+
+# Tables of an XCMSExperiment with one row per spectrum or per sample and the
+# links between them
+BACKEND_DATA_FILENAME = "ms_backend_data.txt"
+SAMPLE_DATA_FILENAME = "ms_experiment_sample_data.txt"
+LINKS_FILENAME = "ms_experiment_sample_data_links_spectra.txt"
+
 
 def create_fake_spectra_files(xcms_experiment_path, tmp_dir):
     """
@@ -30,3 +39,134 @@ def create_fake_spectra_files(xcms_experiment_path, tmp_dir):
     for path in file_paths:
         with open(os.path.join(tmp_dir, os.path.basename(path)), "w"):
             pass
+
+
+def get_spectra_files_dir(xcms_experiment_path, tmp_dir):
+    """
+    Returns the directory with the spectra files of an xcms experiment, which is
+    passed as spectraPath to MsIO::readMsObject. Self-contained experiments store
+    their spectra files, so no files are created for them. For other experiments
+    empty placeholder files are created in `tmp_dir`, see
+    create_fake_spectra_files.
+
+       Args:
+        xcms_experiment_path (str): Path to the XCMSExperiment.
+        tmp_dir (str): Path to the temp directory.
+    """
+    spectra_dir = os.path.join(xcms_experiment_path, SPECTRA_DIRNAME)
+    if os.path.isdir(spectra_dir):
+        return spectra_dir
+
+    create_fake_spectra_files(xcms_experiment_path, tmp_dir)
+    return tmp_dir
+
+
+def link_spectra_file(src, dst):
+    """
+    Links the spectra file `src` to `dst`, see link_file. Like _store_spectra of
+    read_ms_experiment, spectra files are never copied, as copying all spectra
+    files of an experiment would take long and double their disk usage.
+
+    Raises:
+        OSError: If the file can't be linked, e.g. because `src` and `dst` are on
+            different file systems.
+    """
+    try:
+        link_file(src, dst)
+    except OSError as e:
+        raise OSError(
+            f"{e}\n\nSpectra files are linked and not copied. Please make sure "
+            "that the temporary directory of QIIME 2 (TMPDIR) is on the same file "
+            "system as the spectra files."
+        ) from e
+
+
+def read_table_header(f):
+    """
+    Reads the comment lines, e.g. "# MsBackendMzR", and the header line of a
+    table exported by MsIO from the open file `f` and returns them.
+    """
+    lines = []
+    while True:
+        line = f.readline()
+        lines.append(line)
+        if not line.startswith("#"):
+            return lines
+
+
+def concat_tables(paths, output_path):
+    """
+    Concatenates tables exported by MsIO, e.g. the backend data or the sample
+    data of several XCMSExperiments. The rows are streamed line by line and their
+    row names, which are the 1-based row numbers, are shifted by the number of
+    rows of the preceding tables.
+
+    Parameters:
+        paths (list):
+            Paths to the tables.
+        output_path (str):
+            Path the concatenated table is written to.
+
+    Returns:
+        list: Number of rows of every table.
+
+    Raises:
+        ValueError: If the headers of the tables differ.
+    """
+    counts = []
+    offset = 0
+    with open(output_path, "w") as dst:
+        for i, path in enumerate(paths):
+            n_rows = 0
+            with open(path) as src:
+                header_obs = read_table_header(src)
+                if i == 0:
+                    header_exp = header_obs
+                    dst.writelines(header_exp)
+                elif header_obs != header_exp:
+                    raise ValueError(
+                        f"The columns of {os.path.basename(path)} differ between "
+                        "the XCMSExperiments. Samples can only be combined if their "
+                        "sample metadata has the same columns.\n\nExpected:\n"
+                        + "".join(header_exp)
+                        + "\nFound instead:\n"
+                        + "".join(header_obs)
+                    )
+                for line in src:
+                    n_rows += 1
+                    row_name, rest = line.rstrip("\n").split("\t", 1)
+                    row_number = int(row_name.strip('"')) + offset
+                    dst.write(f'"{row_number}"\t{rest}\n')
+            counts.append(n_rows)
+            offset += n_rows
+    return counts
+
+
+def concat_links(paths, output_path, n_samples, n_spectra):
+    """
+    Concatenates the links between samples and spectra of several
+    XCMSExperiments. The sample and spectrum indices of every experiment are
+    shifted by the number of samples and spectra of the preceding experiments.
+
+    Parameters:
+        paths (list):
+            Paths to the ms_experiment_sample_data_links_spectra.txt files.
+        output_path (str):
+            Path the concatenated links are written to.
+        n_samples (list):
+            Number of samples of every experiment.
+        n_spectra (list):
+            Number of spectra of every experiment.
+    """
+    sample_offset = spectrum_offset = 0
+    with open(output_path, "w") as dst:
+        for path, samples, spectra in zip(paths, n_samples, n_spectra):
+            with open(path) as src:
+                for line in src:
+                    sample, spectrum = line.split()
+                    dst.write(
+                        f"{int(sample) + sample_offset}\t"
+                        f"{int(spectrum) + spectrum_offset}\n"
+                    )
+            sample_offset += samples
+            spectrum_offset += spectra